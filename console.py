@@ -13,15 +13,13 @@ The interpreter enables interactive and non-interactive usage:
       interpreter
     - Storing and persisting objects to a file (JSON format)
 
-Example of typical usage:
+Example of typical usage (`help` lists every documented command):
 
     $ ./console
     (hbnb)
 
-    (hbnb) help
-    Documented commands (type help <topic>):
-    ========================================
-    EOF  create  help  quit
+    (hbnb) help create
+    Creates a new instance.
 
     (hbnb)
     (hbnb) quit
@@ -31,7 +29,12 @@ Example of typical usage:
 import re
 import cmd
 import json
+import time
+from datetime import datetime
+from itertools import chain, islice
+from collections import OrderedDict
 from models import storage
+from models.engine.bulk import import_records, export_records
 from models.base_model import BaseModel
 from models.user import User
 from models.state import State
@@ -59,12 +62,20 @@ class HBNBCommand(cmd.Cmd):
     """
 
     prompt = "(hbnb) "
+    cache_size = 128
+
+    def __init__(self, *args, **kwargs):
+        """Initializes the interpreter with an empty result cache.
+        """
+        super().__init__(*args, **kwargs)
+        self.__results = OrderedDict()
 
     def precmd(self, line):
         """Defines actions to perform before interpreting <line>.
         """
         if not line:
             return '\n'
+        storage.sync()
 
         pattern = re.compile(r"(\w+)\.(\w+)\((.*)\)")
         match_list = pattern.findall(line)
@@ -72,12 +83,16 @@ class HBNBCommand(cmd.Cmd):
             return super().precmd(line)
 
         match_tuple = match_list[0]
+        if match_tuple[1] in ("where", "select", "explain"):
+            return "{} {} {}".format(
+                match_tuple[1], match_tuple[0], match_tuple[2])
+        if match_tuple[1] == "all" and match_tuple[2]:
+            return "all {} {}".format(
+                match_tuple[0], re.sub("[\"\',]", " ", match_tuple[2]))
         if not match_tuple[2]:
             if match_tuple[1] == "count":
-                instance_objs = storage.all()
-                print(len([
-                    v for _, v in instance_objs.items()
-                    if type(v).__name__ == match_tuple[0]]))
+                print(self.cached("count", match_tuple[0], lambda: str(
+                    storage.count(match_tuple[0]))))
                 return "\n"
             return "{} {}".format(match_tuple[1], match_tuple[0])
         else:
@@ -107,13 +122,105 @@ class HBNBCommand(cmd.Cmd):
         """Handles the EOF (End of File) signal, allowing graceful exits.
         """
         print("")
+        self.commit_batches()
         return True
 
     def do_quit(self, arg):
         """Exits the program.
         """
+        self.commit_batches()
         return True
 
+    def do_begin(self, arg):
+        """Starts a batch: changes are saved once, by the matching commit.
+        """
+        storage.begin()
+
+    def do_commit(self, arg):
+        """Ends a batch started with begin, saving its changes.
+        """
+        try:
+            storage.commit()
+        except RuntimeError:
+            print("** no batch in progress **")
+
+    def do_rollback(self, arg):
+        """Ends every batch, discarding the changes that were not saved.
+        """
+        storage.rollback()
+
+    def do_import(self, arg):
+        """Imports objects from a JSON Lines or CSV file.
+        Usage: import <file> [<class name>]
+        """
+        args = arg.split()
+        if not args:
+            print("** file name missing **")
+            return
+        if len(args) > 1 and not validate_classname(args[1:]):
+            return
+        start = time.perf_counter()
+        try:
+            count = import_records(args[0], *args[1:2])
+        except (OSError, ValueError) as e:
+            print("** {} **".format(e))
+            return
+        report_throughput("imported", count, time.perf_counter() - start)
+
+    def do_export(self, arg):
+        """Exports objects to a JSON Lines or CSV file.
+        Usage: export <file> [<class name>]
+        """
+        args = arg.split()
+        if not args:
+            print("** file name missing **")
+            return
+        if len(args) > 1 and not validate_classname(args[1:]):
+            return
+        start = time.perf_counter()
+        try:
+            count = export_records(args[0], *args[1:2])
+        except (OSError, ValueError) as e:
+            print("** {} **".format(e))
+            return
+        report_throughput("exported", count, time.perf_counter() - start)
+
+    def cached(self, command, class_name, output):
+        """Returns the output of a read-only command, reusing the one
+        computed last time unless the stored objects have changed since.
+        The outputs of the `cache_size` most recently used commands are
+        kept.
+
+        Args:
+            command (str): The name of the command.
+            class_name (str): The class it applies to, or None.
+            output (callable): Computes the output.
+
+        Returns:
+            str: The output of the command.
+        """
+        key = (command, class_name)
+        generation = storage.generation
+        entry = self.__results.get(key)
+        if entry is None or entry[0] != generation:
+            entry = self.__results[key] = (generation, output())
+        self.__results.move_to_end(key)
+        if len(self.__results) > self.cache_size:
+            self.__results.popitem(last=False)
+        return entry[1]
+
+    def commit_batches(self):
+        """Commits the batches still in progress, e.g. when a script ends
+        without its commit, and writes the saved changes the storage has
+        not written yet.
+        """
+        while True:
+            try:
+                storage.commit()
+            except RuntimeError:
+                break
+        storage.flush()
+
     def emptyline(self):
         """Overrides the default behavior for empty lines.
         """
@@ -137,9 +244,7 @@ class HBNBCommand(cmd.Cmd):
         if not validate_classname(args, check_id=True):
             return
 
-        instance_objs = storage.all()
-        key = "{}.{}".format(args[0], args[1])
-        req_instance = instance_objs.get(key, None)
+        req_instance = storage.get(args[0], args[1])
         if req_instance is None:
             print("** no instance found **")
             return
@@ -152,32 +257,106 @@ class HBNBCommand(cmd.Cmd):
         if not validate_classname(args, check_id=True):
             return
 
-        instance_objs = storage.all()
-        key = "{}.{}".format(args[0], args[1])
-        req_instance = instance_objs.get(key, None)
+        req_instance = storage.get(args[0], args[1])
         if req_instance is None:
             print("** no instance found **")
             return
 
-        del instance_objs[key]
+        storage.delete(req_instance)
         storage.save()
 
     def do_all(self, arg):
         """Displays string representation of all instances.
+        Usage: all [<class name>] [lines] [limit=<n>] [offset=<n>] [after=<id>]
+        With options, instances are printed as they are read, one per line
+        with `lines`, starting after the instance `after` if given.
+        """
+        args = arg.split()
+        class_name = None
+        if args and args[0] != "lines" and "=" not in args[0]:
+            class_name = args.pop(0)
+            if class_name not in current_classes.keys():
+                print("** class doesn't exist **")
+                return
+        if args:
+            options = parse_paging(args)
+            if options is not None:
+                stream_objects(class_name, **options)
+            return
+        print(self.cached("all", class_name, lambda: str(
+            ["{}".format(str(v))
+             for _, v in storage.all(class_name).items()])))
+
+    def do_near(self, arg):
+        """Displays instances within a distance, e.g.,
+        near <class> <latitude> <longitude> <km>.
         """
         args = arg.split()
-        all_objs = storage.all()
+        if not validate_classname(args):
+            return
+        coords = parse_coords(args[1:], 3)
+        if coords is None:
+            return
+        print(["{}".format(str(v))
+               for _, v in storage.near(args[0], *coords).items()])
 
-        if len(args) < 1:
-            print(["{}".format(str(v)) for _, v in all_objs.items()])
+    def do_within(self, arg):
+        """Displays instances inside a bounding box, e.g.,
+        within <class> <min_lat> <min_lon> <max_lat> <max_lon>.
+        """
+        args = arg.split()
+        if not validate_classname(args):
             return
-        if args[0] not in current_classes.keys():
-            print("** class doesn't exist **")
+        coords = parse_coords(args[1:], 4)
+        if coords is None:
             return
-        else:
-            print(["{}".format(str(v))
-                  for _, v in all_objs.items() if type(v).__name__ == args[0]])
+        print(["{}".format(str(v))
+               for _, v in storage.within(args[0], *coords).items()])
+
+    def do_where(self, arg):
+        """Displays the instances of a class matching predicates, e.g.,
+        where Place price_by_night<100 city_id="<id>".
+        Operators: = (or ==), !=, <, <=, > and >=.
+        """
+        args = split_args(arg)
+        predicates = parse_predicates(args)
+        if predicates is None:
             return
+        print(["{}".format(str(v))
+               for v in storage.where(args[0], *predicates).values()])
+
+    def do_explain(self, arg):
+        """Shows the plan of a where query, with its estimated and actual
+        numbers of rows, e.g., explain Place price_by_night<100.
+        """
+        args = split_args(arg)
+        predicates = parse_predicates(args)
+        if predicates is None:
+            return
+        print(storage.explain(args[0], *predicates))
+
+    def do_select(self, arg):
+        """Displays attributes of the instances of a class, optionally
+        matching predicates, e.g.,
+        select Place name price_by_night price_by_night<100.
+        """
+        args = split_args(arg)
+        if not validate_classname(args):
+            return
+        query = parse_query(args[1:])
+        if query is None:
+            return
+        fields, predicates = query
+        if not fields:
+            print("** attribute name missing **")
+            return
+        print([project(v, fields)
+               for v in storage.where(args[0], *predicates).values()])
+
+    def do_compact(self, arg):
+        """Compacts the storage journal into a fresh snapshot.
+        """
+        storage.compact()
 
     def do_update(self, arg: str):
         """Updates an instance based on the class name and id.
@@ -186,9 +365,7 @@ class HBNBCommand(cmd.Cmd):
         if not validate_classname(args, check_id=True):
             return
 
-        instance_objs = storage.all()
-        key = "{}.{}".format(args[0], args[1])
-        req_instance = instance_objs.get(key, None)
+        req_instance = storage.get(args[0], args[1])
         if req_instance is None:
             print("** no instance found **")
             return
@@ -216,17 +393,172 @@ class HBNBCommand(cmd.Cmd):
         storage.save()
 
 
+def report_throughput(action, count, seconds):
+    """Prints how many records were processed and how fast.
+
+    Args:
+        action (str): What was done to the records, e.g. "imported".
+        count (int): The number of records.
+        seconds (float): The time it took.
+    """
+    print("{} records {} in {:.2f}s ({:.0f} records/s)".format(
+        count, action, seconds, count / seconds if seconds else 0))
+
+
+def parse_paging(args):
+    """Parses the options of a streamed `all` command.
+
+    Args:
+        args (list): The arguments following the class name, e.g.
+            ["lines", "limit=10"].
+
+    Returns:
+        dict: The keyword arguments of `stream_objects`, or None if an
+        option is unknown or invalid.
+    """
+    options = {}
+    for option in args:
+        name, _, value = option.partition("=")
+        if option == "lines":
+            options["lines"] = True
+        elif name in ("limit", "offset") and value.isdigit():
+            options[name] = int(value)
+        elif name == "after" and value:
+            options["after"] = value
+        else:
+            print("** invalid option: {} **".format(option))
+            return None
+    return options
+
+
+def stream_objects(class_name, lines=False, limit=None, offset=0,
+                   after=None):
+    """Prints stored instances as they are read from the storage, so that
+    the first one appears at once and memory use does not grow with the
+    number printed.
+
+    Args:
+        class_name (str): The class of the instances, or None for all.
+        lines (bool): Print one instance per line instead of a list.
+        limit (int): The maximum number of instances to print.
+        offset (int): The number of instances to skip first.
+        after (str): The id, or key, of the instance to start after.
+    """
+    if after is not None and class_name and "." not in after:
+        after = "{}.{}".format(class_name, after)
+    stop = None if limit is None else offset + limit
+    found = islice(storage.stream(class_name, after), offset, stop)
+    try:
+        first = next(found, None)
+    except KeyError:
+        print("** no instance found **")
+        return
+    objs = (v for _, v in chain(() if first is None else (first,), found))
+    if lines:
+        for obj in objs:
+            print(obj)
+        return
+    print("[", end="")
+    for i, obj in enumerate(objs):
+        print(", " if i else "", repr(str(obj)), sep="", end="")
+    print("]")
+
+
+def split_args(arg):
+    """Splits arguments on spaces and commas, except within quotes.
+
+    Args:
+        arg (str): The arguments of a command.
+
+    Returns:
+        list: The arguments, quotes included.
+    """
+    return re.findall(r"""(?:[^\s,"']|"[^"]*"|'[^']*')+""", arg)
+
+
+def parse_query(args):
+    """Parses the attribute names and predicates of a query command.
+
+    Args:
+        args (list): The arguments following the class name, e.g.
+            ["name", "price_by_night<100"].
+
+    Returns:
+        tuple: The attribute names and the (attribute, operator, value)
+        predicates, or None if a predicate is invalid.
+    """
+    fields, predicates = [], []
+    for token in args:
+        if re.fullmatch(r"\w+", token):
+            fields.append(token)
+            continue
+        match = re.fullmatch(r"(\w+)(==|!=|<=|>=|=|<|>)(.+)", token)
+        if match is None:
+            print("** invalid predicate: {} **".format(token))
+            return None
+        attr, op, value = match.groups()
+        if len(value) > 1 and value[0] in "\"'" and value[-1] == value[0]:
+            value = value[1:-1]
+        else:
+            value = parse_str(value)
+        predicates.append((attr, "==" if op == "=" else op, value))
+    return fields, predicates
+
+
+def parse_predicates(args):
+    """Parses the class name and predicates of a where query.
+
+    Args:
+        args (list): The arguments of the command.
+
+    Returns:
+        list: The (attribute, operator, value) predicates, or None if the
+        class name or a predicate is missing or invalid.
+    """
+    if not validate_classname(args):
+        return None
+    query = parse_query(args[1:])
+    if query is None:
+        return None
+    fields, predicates = query
+    if fields:
+        print("** invalid predicate: {} **".format(fields[0]))
+        return None
+    return predicates
+
+
+def project(obj, fields):
+    """Selects attributes of an instance.
+
+    Args:
+        obj: The instance.
+        fields (list): The names of the attributes.
+
+    Returns:
+        dict: The attributes the instance has, by name, with dates in ISO
+        format.
+    """
+    values = {}
+    for name in fields:
+        if hasattr(obj, name):
+            value = getattr(obj, name)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values[name] = value
+    return values
+
+
 def validate_classname(args, check_id=False):
     """Validates the class name and instance id.
-    
+
     Args:
         args (list): A list of arguments containing class name and instance id.
-        check_id (bool, optional): Whether to check the instance id. 
+        check_id (bool, optional): Whether to check the instance id.
                                     Defaults to False.
-    
+
     Returns:
-        bool: True if the class name and (if required) the instance id are valid, 
-              False otherwise.
+        bool: True if the class name and (if required) the instance id are
+              valid, False otherwise.
     """
     if len(args) < 1:
         print("** class name missing **")
@@ -242,10 +574,10 @@ def validate_classname(args, check_id=False):
 
 def validate_attrs(args):
     """Validates the attribute name and value.
-    
+
     Args:
         args (list): A list of arguments containing attribute name and value.
-    
+
     Returns:
         bool: True if the attribute name and value are valid, False otherwise.
     """
@@ -258,6 +590,25 @@ def validate_attrs(args):
     return True
 
 
+def parse_coords(args, count):
+    """Parses the numeric arguments of the spatial commands.
+
+    Args:
+        args (list): The arguments following the class name.
+        count (int): The number of numbers expected.
+
+    Returns:
+        list: The parsed numbers, or None if some are missing or invalid.
+    """
+    if len(args) < count:
+        print("** coordinates missing **")
+        return None
+    if not all(is_float(x) for x in args[:count]):
+        print("** invalid coordinates **")
+        return None
+    return [float(x) for x in args[:count]]
+
+
 def is_float(x):
     """Checks if `x` is a float number.
 
@@ -3,10 +3,61 @@
 Module: __init__.py
 
 This module initializes the storage system for the application.
+
+Environment variables:
+    HBNB_TYPE_STORAGE: When set to "db", objects are stored in a SQLite
+        database (`DBStorage`) instead of a file; the other variables only
+        apply to file storage.
+    HBNB_DB_PATH: The path of the SQLite database (default: file.db).
+    HBNB_FILE_JOURNAL: When set to "1", `FileStorage` appends changed
+        records to a journal instead of rewriting the whole file on save.
+    HBNB_FILE_COMPACT_THRESHOLD: Number of journal entries after which the
+        journal is compacted into a fresh snapshot (default: 10000).
+    HBNB_FILE_LAZY: When set to "1", reloaded objects are only created
+        the first time they are accessed.
+    HBNB_COMPACT_MODELS: When set to "1", reloaded objects use the compact,
+        slot-based variants of the model classes.
+    HBNB_COLUMNAR: When set to "1", numeric attributes are also kept in
+        column stores to speed up `storage.where()`.
+    HBNB_FILE_MAPPED: When set to "1", the snapshot is memory-mapped and
+        objects are read from it when they are first accessed.
+    HBNB_FILE_FORMAT: The file format, "json" or "binary" (default: binary
+        when mapped, JSON otherwise).
+    HBNB_FILE_WRITE_DELAY: When set, saves are written by a background
+        thread this many seconds after they are made, so that bursts of
+        saves are written at once.
+    HBNB_FILE_SHARED: When set to "1", the storage file is locked while it
+        is used and the changes of other processes using it are merged, so
+        that several consoles can share one store.
+    HBNB_FILE_THREADSAFE: When set to "1", `storage.all()` returns
+        read-only snapshots that threads can iterate while others change
+        the storage.
+    HBNB_FILE_SHARDS: When set to a number, each class is stored in that
+        many files, so that a save only rewrites the files holding the
+        changed objects.
 """
 
+from os import getenv
 from models.engine import file_storage
 
-# Initialize file storage
-storage = file_storage.FileStorage()
+if getenv("HBNB_TYPE_STORAGE") == "db":
+    # Initialize database storage
+    from models.engine import db_storage
+    storage = db_storage.DBStorage(getenv("HBNB_DB_PATH", "file.db"))
+else:
+    # Initialize file storage
+    storage = file_storage.FileStorage(
+        journal=getenv("HBNB_FILE_JOURNAL") == "1",
+        compact_threshold=int(
+            getenv("HBNB_FILE_COMPACT_THRESHOLD", "10000")),
+        lazy=getenv("HBNB_FILE_LAZY") == "1",
+        compact_models=getenv("HBNB_COMPACT_MODELS") == "1",
+        columnar=getenv("HBNB_COLUMNAR") == "1",
+        mapped=getenv("HBNB_FILE_MAPPED") == "1",
+        format=getenv("HBNB_FILE_FORMAT"),
+        write_delay=(float(getenv("HBNB_FILE_WRITE_DELAY"))
+                     if getenv("HBNB_FILE_WRITE_DELAY") else None),
+        shared=getenv("HBNB_FILE_SHARED") == "1",
+        threadsafe=getenv("HBNB_FILE_THREADSAFE") == "1",
+        shards=int(getenv("HBNB_FILE_SHARDS", "0")) or None)
 storage.reload()
@@ -5,18 +5,47 @@ Module: base.py
 This module defines the base class `BaseModel`, which serves as the foundation
 for other classes in the application. It provides common attributes and methods
 that are inherited by subclasses.
+
+Every model class also has a compact variant, returned by `compact()`, for
+stores whose size is bound by memory.
+
+The string form of an instance is computed once and kept until one of its
+attributes is set or deleted, so that printing an unchanged object again
+costs nothing. The dictionary form is not kept: the storage engines keep
+the encoding of each object already.
 """
 import models
+import sys
 import uuid
 from datetime import datetime
 
+_compact_classes = {}
+
 
 class BaseModel:
     """
     This Base class states all common
     methods and attributes for other classes
+
+    Attributes:
+        _indexed_attrs (tuple): Names of the attributes (typically foreign
+            keys) the storage engine keeps an index on for this class.
+        _columnar_attrs (tuple): Names of the numeric attributes the
+            storage engine can keep in columns for this class.
+        _spatial_attrs (tuple): Names of the latitude and longitude
+            attributes the storage engine keeps a spatial index on.
+        _memoize (bool): Whether instances keep their string form once
+            computed. Compact variants do not, to save memory.
     """
 
+    # The cache lives in a slot, out of the attributes `__dict__` holds
+    __slots__ = ("__dict__", "__weakref__", "__cache")
+
+    _indexed_attrs = ()
+    _columnar_attrs = ()
+    _spatial_attrs = ()
+    _memoize = True
+
     def __init__(self, *args, **kwargs):
         """
         Initializes an object with its attributes.
@@ -31,17 +60,53 @@ class BaseModel:
         `updated_at`) to the current time. Additionally, it registers the new
         instance with the storage system.
         """
+        object.__setattr__(self, "_BaseModel__cache", None)
         if kwargs:
+            dates = {}
             for key, value in kwargs.items():
-                if key in ("created_at", "updated_at"):
-                    value = datetime.fromisoformat(value)
-                setattr(self, key, value)
+                if key == "__class__":
+                    continue
+                if key in ("created_at", "updated_at") and \
+                        isinstance(value, str):
+                    # Equal timestamps share one (immutable) datetime
+                    if value not in dates:
+                        dates[value] = datetime.fromisoformat(value)
+                    value = dates[value]
+                # Not stored yet: nothing to report to the storage system
+                self._assign(key, value)
         else:
             self.id = str(uuid.uuid4())
             self.created_at = datetime.now()
             self.updated_at = datetime.now()
             models.storage.new(self)
 
+    def __setattr__(self, name, value):
+        """
+        Sets an attribute and reports the change to the storage system, so
+        that only modified objects are serialized again on the next save.
+
+        Attributes mutated in place (e.g. appending to a list) are not
+        detected; assign them again or call `models.storage.touch(obj)`.
+        """
+        self._assign(name, value)
+        object.__setattr__(self, "_BaseModel__cache", None)
+        models.storage.touch(self)
+
+    def _assign(self, name, value):
+        """
+        Sets an attribute without reporting the change to the storage
+        system, e.g. while an instance is built from its dictionary.
+        """
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        """
+        Deletes an attribute and reports the change to the storage system.
+        """
+        super().__delattr__(name)
+        object.__setattr__(self, "_BaseModel__cache", None)
+        models.storage.touch(self)
+
     def __str__(self):
         """
         Returns the string representation of the instance.
@@ -50,9 +115,14 @@ class BaseModel:
             str: A string containing the class name, instance id, and its
             attributes.
         """
-        return "[{}] ({}) {}".format(
-            type(self).__name__, self.id, self.__dict__
-        )
+        string = self.__cache
+        if string is None:
+            string = "[{}] ({}) {}".format(
+                type(self).__name__, self.id, self._attributes()
+            )
+            if self._memoize:
+                object.__setattr__(self, "_BaseModel__cache", string)
+        return string
 
     def save(self):
         """
@@ -71,9 +141,117 @@ class BaseModel:
             attributes. Additionally, it includes the class name and formatted
             creation/update times.
         """
-        obj_dict = self.__dict__.copy()
+        obj_dict = dict(self._attributes())
         obj_dict['__class__'] = type(self).__name__
         obj_dict['created_at'] = obj_dict['created_at'].isoformat()
         obj_dict['updated_at'] = obj_dict['updated_at'].isoformat()
         return obj_dict
 
+    def _changed(self):
+        """
+        Forgets the string form of the instance, e.g. after one of its
+        attributes was mutated in place.
+        """
+        object.__setattr__(self, "_BaseModel__cache", None)
+
+    def _attributes(self):
+        """
+        Returns:
+            dict: The instance attributes. Compact variants build it from
+            their slots and their `__dict__`.
+        """
+        return self.__dict__
+
+    @classmethod
+    def compact(cls):
+        """
+        Returns the compact variant of the class, created on first use.
+
+        The variant is a subclass with the same name that keeps `id`,
+        `created_at`, `updated_at` and the attributes declared on the class
+        in slots instead of the instance `__dict__`, and interns the string
+        values of its indexed attributes, which repeat across many objects.
+        Any other attribute can still be set and lands in `__dict__`, which
+        is only created then.
+
+        Returns:
+            type: The compact variant of the class.
+        """
+        if cls in _compact_classes.values():
+            return cls
+        if cls not in _compact_classes:
+            _compact_classes[cls] = _make_compact(cls)
+        return _compact_classes[cls]
+
+
+def _make_compact(cls):
+    """
+    Builds the compact variant of a model class (see `BaseModel.compact`).
+
+    Args:
+        cls (type): A `BaseModel` subclass.
+
+    Returns:
+        type: The compact variant of `cls`.
+    """
+    fields = ["id", "created_at", "updated_at"]
+    for klass in reversed(cls.__mro__):
+        for name in vars(klass).get("__annotations__", {}):
+            if name not in fields:
+                fields.append(name)
+    interned = frozenset(cls._indexed_attrs)
+
+    def __getattr__(self, name):
+        """
+        Falls back to the class default of declared attributes whose slot
+        was never set.
+        """
+        if name in slots and hasattr(cls, name):
+            return getattr(cls, name)
+        raise AttributeError(
+            f"'{cls.__name__}' object has no attribute '{name}'")
+
+    def _assign(self, name, value):
+        """
+        Interns the string values of indexed attributes before setting them,
+        and notes when an attribute lands in `__dict__`.
+        """
+        if name in interned and type(value) is str:
+            value = sys.intern(value)
+        if name not in slots:
+            object.__setattr__(self, "_extra", True)
+        object.__setattr__(self, name, value)
+
+    def _attributes(self):
+        """
+        Returns:
+            dict: The set slots followed by the `__dict__` attributes. The
+            `__dict__` is left alone (reading it would create it) unless an
+            attribute was ever set there.
+        """
+        attrs = {}
+        for name, slot in slots.items():
+            try:
+                attrs[name] = slot.__get__(self, variant)
+            except AttributeError:
+                pass
+        try:
+            extra.__get__(self, variant)
+        except AttributeError:
+            return attrs
+        attrs.update(self.__dict__)
+        return attrs
+
+    variant = type(cls.__name__, (cls,), {
+        "__slots__": tuple(fields) + ("_extra",),
+        "__module__": cls.__module__,
+        "__qualname__": cls.__qualname__,
+        "__doc__": cls.__doc__,
+        "__getattr__": __getattr__,
+        "_assign": _assign,
+        "_attributes": _attributes,
+        "_memoize": False,
+    })
+    slots = {name: vars(variant)[name] for name in fields}
+    extra = vars(variant)["_extra"]
+    return variant
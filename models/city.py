@@ -18,19 +18,7 @@ class City(BaseModel):
         state_id (str): The ID of the state to which the city belongs.
     """
 
-    def __init__(self, *args, **kwargs):
-        """
-        Initializes a City instance.
-
-        Args:
-            *args: Variable-length argument list.
-            **kwargs: Arbitrary keyword arguments.
-
-        Attributes:
-            name (str): The name of the city.
-            state_id (str): The ID of the state to which the city belongs.
-        """
-        super().__init__(*args, **kwargs)
-        self.name = ""
-        self.state_id = ""
+    name: str = ""
+    state_id: str = ""
 
+    _indexed_attrs = ("state_id",)
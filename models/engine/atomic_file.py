@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+"""
+Module: atomic_file.py
+
+Defines functions writing snapshots so that a crash never leaves a
+truncated one, and checking them when they are read back.
+
+A snapshot is written to a temporary file, flushed to disk and renamed over
+the previous one, so that the path always holds either the old or the new
+snapshot. The previous snapshot is kept as `<path>.bak`, and the size and
+CRC-32 of each snapshot are written next to it, in `<path>.sum`, so that a
+snapshot damaged later on (e.g. by a disk error) is detected and replaced
+by its backup. Loading a snapshot only compares its size, which costs
+nothing; the CRC-32 is computed when the snapshot cannot be parsed, to
+tell whether the file or its contents are at fault.
+
+The checksum also records the modification time of the snapshot: a
+snapshot written by other means since (e.g. restored by hand) is not
+checked against it, and only replaced by the backup if it cannot be read.
+"""
+
+import os
+import zlib
+import shutil
+import warnings
+
+
+def backup_path(path):
+    """
+    Args:
+        path (str): The path of a snapshot.
+
+    Returns:
+        str: The path the previous snapshot is kept at.
+    """
+    return f"{path}.bak"
+
+
+def checksum_path(path):
+    """
+    Args:
+        path (str): The path of a snapshot.
+
+    Returns:
+        str: The path of the checksum of the snapshot.
+    """
+    return f"{path}.sum"
+
+
+class _Checksummed:
+    """A file wrapper computing the size and CRC-32 of what is written."""
+
+    def __init__(self, f):
+        """
+        Args:
+            f: A file opened for writing bytes.
+        """
+        self.__file = f
+        self.size = 0
+        self.crc = 0
+
+    def write(self, data):
+        """
+        Write bytes to the file.
+
+        Args:
+            data (bytes): The bytes to write.
+
+        Returns:
+            int: The number of bytes written.
+        """
+        self.size += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return self.__file.write(data)
+
+
+def write_atomic(path, write):
+    """Writes a snapshot atomically, keeping the previous one as a backup.
+
+    The previous snapshot is only kept if it has the size recorded in its
+    checksum, so that a damaged snapshot never replaces a good backup.
+
+    Args:
+        path (str): The path of the snapshot.
+        write (callable): Called with the file to write the snapshot to.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        out = _Checksummed(f)
+        write(out)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path) and verify(path, quick=True):
+        _backup(path)
+    os.replace(tmp_path, path)
+    _sync_directory(path)
+    _write_checksum(path, out.size, out.crc)
+
+
+def verify(path, quick=False):
+    """Checks a snapshot against its checksum.
+
+    Args:
+        path (str): The path of the snapshot.
+        quick (bool): Only compare the size of the snapshot.
+
+    Returns:
+        bool: False if the snapshot is missing or does not match its
+        checksum; True if it matches, or has no checksum recorded since it
+        was last modified.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    expected = _read_checksum(path)
+    if expected is None or expected[2] != stat.st_mtime_ns:
+        return True
+    if stat.st_size != expected[0]:
+        return False
+    if quick:
+        return True
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc == expected[1]
+
+
+def recover(path, damaged=False, quick=False):
+    """Replaces a damaged snapshot by its backup, if the backup is good.
+
+    A missing snapshot is not replaced: deleting the storage file is the
+    way to start afresh.
+
+    Args:
+        path (str): The path of the snapshot.
+        damaged (bool): Whether the snapshot is already known to be
+            damaged (e.g. it could not be parsed) whatever its checksum.
+        quick (bool): Only compare the size of the snapshot with its
+            checksum, not its CRC-32.
+
+    Returns:
+        bool: True if the backup was restored.
+    """
+    if not os.path.exists(path) or \
+            (not damaged and verify(path, quick=quick)):
+        return False
+    backup = backup_path(path)
+    if not verify(backup):
+        return False
+    tmp_path = f"{path}.tmp"
+    shutil.copyfile(backup, tmp_path)
+    with open(tmp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _sync_directory(path)
+    checksum = _read_checksum(backup)
+    if checksum is None:
+        if os.path.exists(checksum_path(path)):
+            os.remove(checksum_path(path))
+    else:
+        _write_checksum(path, *checksum[:2])
+    warnings.warn(f"{path} was damaged and has been replaced by {backup}",
+                  RuntimeWarning)
+    return True
+
+
+def _backup(path):
+    """
+    Keep a snapshot, and its checksum, as the backup.
+
+    Args:
+        path (str): The path of the snapshot.
+    """
+    backup = backup_path(path)
+    tmp_path = f"{backup}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        shutil.copyfile(path, tmp_path)
+    os.replace(tmp_path, backup)
+    checksum = _read_checksum(path)
+    if checksum is not None:
+        _write_checksum(backup, *checksum[:2])
+    elif os.path.exists(checksum_path(backup)):
+        os.remove(checksum_path(backup))
+
+
+def _read_checksum(path):
+    """
+    Args:
+        path (str): The path of a snapshot.
+
+    Returns:
+        tuple: The size, CRC-32 and modification time in nanoseconds
+        recorded for the snapshot, or None if none is.
+    """
+    try:
+        with open(checksum_path(path)) as f:
+            size, crc, mtime = f.read().split()
+        return int(size), int(crc, 16), int(mtime)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checksum(path, size, crc):
+    """
+    Record the size and CRC-32 of a snapshot, with its current
+    modification time.
+
+    Args:
+        path (str): The path of the snapshot.
+        size (int): Its size in bytes.
+        crc (int): Its CRC-32.
+    """
+    sum_path = checksum_path(path)
+    tmp_path = f"{sum_path}.tmp"
+    mtime = os.stat(path).st_mtime_ns
+    with open(tmp_path, 'w') as f:
+        f.write(f"{size} {crc:08x} {mtime}\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, sum_path)
+
+
+def _sync_directory(path):
+    """
+    Flush the directory entry of a renamed file to disk, where the
+    platform allows it.
+
+    Args:
+        path (str): The path of the file.
+    """
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,300 @@
+#!/usr/bin/python3
+"""
+Module: bulk.py
+
+Defines functions importing objects into the storage from JSON Lines or CSV
+files, and exporting them to such files, one record at a time.
+
+A JSON Lines file holds one record per line, as returned by `to_dict()`. A
+CSV file has a header row naming the attributes; an empty cell stands for
+an attribute the object does not have, and lists are written as JSON.
+
+Imported values are converted to the types annotated on the model classes
+(e.g. `Place.number_rooms: int`), so that CSV files, whose values are all
+strings, load the same objects as JSON Lines files.
+"""
+
+import os
+import csv
+import json
+import uuid
+from datetime import datetime
+import models
+from models.base_model import BaseModel
+from models.user import User
+from models.state import State
+from models.city import City
+from models.review import Review
+from models.amenity import Amenity
+from models.place import Place
+
+FORMATS = {".jsonl": "jsonl", ".csv": "csv"}
+
+_models = {'BaseModel': BaseModel, 'User': User, 'Amenity': Amenity,
+           'City': City, 'State': State, 'Place': Place, 'Review': Review}
+_annotations = {}
+
+
+def import_records(path, cls=None, format=None, storage=None,
+                   batch_size=None):
+    """Creates or replaces objects from the records of a file.
+
+    The objects are added within a storage batch, so they are saved once
+    at the end, or once every `batch_size` records; if a record is invalid,
+    the records of its batch are taken out of the storage again (objects
+    they replaced are put back) and ValueError is raised. Other changes,
+    and a batch the caller may have begun, are left as they are.
+
+    Args:
+        path (str): The path of the file.
+        cls (type or str, optional): The class, or class name, of the
+            records; by default each record names its class in its
+            `__class__` attribute.
+        format (str, optional): "jsonl" or "csv"; guessed from the
+            extension of `path` by default.
+        storage (optional): The storage to import into; `models.storage`
+            by default.
+        batch_size (int, optional): The number of records saved at a time.
+
+    Returns:
+        int: The number of records imported.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the format is unknown or a record is invalid.
+    """
+    storage = models.storage if storage is None else storage
+    format = _format(path, format)
+    name = None if cls is None else _class_name(cls)
+    now = datetime.now().isoformat()
+    count = 0
+    added = []
+    with open(path, newline='') as f:
+        storage.begin()
+        try:
+            for line, record in _read(f, format):
+                try:
+                    obj = _build(record, name, now)
+                except (ValueError, TypeError) as e:
+                    raise ValueError(f"{path}:{line}: {e}") from None
+                added.append((obj, storage.get(type(obj), obj.id)))
+                storage.new(obj)
+                count += 1
+                if batch_size and count % batch_size == 0:
+                    storage.save()
+                    storage.commit()
+                    storage.begin()
+                    added = []
+            storage.save()
+        except BaseException:
+            _undo(storage, added)
+            storage.commit()
+            raise
+    storage.commit()
+    return count
+
+
+def export_records(path, cls=None, format=None, storage=None):
+    """Writes the stored objects, or those of one class, to a file.
+
+    Args:
+        path (str): The path of the file.
+        cls (type or str, optional): The class, or class name, of the
+            objects to export.
+        format (str, optional): "jsonl" or "csv"; guessed from the
+            extension of `path` by default.
+        storage (optional): The storage to export from; `models.storage`
+            by default.
+
+    Returns:
+        int: The number of records exported.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    storage = models.storage if storage is None else storage
+    format = _format(path, format)
+    count = 0
+    with open(path, 'w', newline='') as f:
+        if format == "jsonl":
+            for _, obj in storage.stream(cls):
+                f.write(json.dumps(obj.to_dict()))
+                f.write("\n")
+                count += 1
+            return count
+        # The header names the attributes of all objects, so the objects
+        # are streamed twice rather than held in memory
+        fields = {"__class__": None}
+        for _, obj in storage.stream(cls):
+            fields.update(dict.fromkeys(obj.to_dict()))
+        writer = csv.DictWriter(f, fields)
+        writer.writeheader()
+        for _, obj in storage.stream(cls):
+            writer.writerow({
+                k: json.dumps(v) if isinstance(v, (list, dict)) else v
+                for k, v in obj.to_dict().items()})
+            count += 1
+    return count
+
+
+def coerce(cls, attr, value):
+    """Converts a value to the type annotated for an attribute.
+
+    Args:
+        cls (type): A model class.
+        attr (str): The name of the attribute.
+        value (any): The value to convert.
+
+    Returns:
+        The converted value; None, and values of attributes that are not
+        annotated, are returned as they are.
+
+    Raises:
+        ValueError: If the value cannot be converted.
+    """
+    kind = _types(cls).get(attr)
+    if kind is None or value is None or type(value) is kind:
+        return value
+    if kind is int:
+        if isinstance(value, float):
+            if not value.is_integer():
+                raise ValueError(f"{attr}: {value!r} is not an integer")
+            return int(value)
+        return int(value)
+    if kind is float:
+        return float(value)
+    if kind is list:
+        if isinstance(value, str):
+            value = json.loads(value)
+        if not isinstance(value, list):
+            raise ValueError(f"{attr}: {value!r} is not a list")
+        return value
+    return kind(value)
+
+
+def _types(cls):
+    """
+    Args:
+        cls (type): A model class.
+
+    Returns:
+        dict: The annotated attributes of `cls` and of its bases, mapped to
+        their types.
+    """
+    if cls not in _annotations:
+        types = {}
+        for klass in reversed(cls.__mro__):
+            types.update(vars(klass).get("__annotations__", {}))
+        _annotations[cls] = types
+    return _annotations[cls]
+
+
+def _class_name(cls):
+    """
+    Args:
+        cls (type or str): A class or class name.
+
+    Returns:
+        str: The name of the class.
+    """
+    return cls if isinstance(cls, str) else cls.__name__
+
+
+def _format(path, format):
+    """
+    Args:
+        path (str): The path of a file.
+        format (str): The format asked for, or None.
+
+    Returns:
+        str: The format of the file.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    if format is None:
+        format = FORMATS.get(os.path.splitext(path)[1])
+    if format not in FORMATS.values():
+        raise ValueError(f"unknown format for {path}")
+    return format
+
+
+def _read(f, format):
+    """
+    Yield the records of a file.
+
+    Args:
+        f: The file, opened for reading text.
+        format (str): "jsonl" or "csv".
+
+    Yields:
+        tuple: The line number and the record, as a dictionary.
+    """
+    if format == "jsonl":
+        for line, text in enumerate(f, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"{f.name}:{line}: {e}") from None
+            yield line, record
+        return
+    reader = csv.DictReader(f)
+    for record in reader:
+        yield reader.line_num, {k: v for k, v in record.items()
+                                if k is not None and v not in ("", None)}
+
+
+def _undo(storage, added):
+    """
+    Take imported objects out of the storage, putting back the objects
+    they replaced.
+
+    Args:
+        storage: The storage they were imported into.
+        added (list): (object, replaced object or None) pairs, in import
+            order.
+    """
+    for obj, replaced in reversed(added):
+        if replaced is None:
+            storage.delete(obj)
+        else:
+            storage.new(replaced)
+
+
+def _build(record, name, now):
+    """
+    Create the object of a record, converting its values.
+
+    Args:
+        record (dict): The attributes of the object.
+        name (str): The name of its class, or None to read it from the
+            record.
+        now (str): The creation time of records that have none.
+
+    Returns:
+        The new object, not stored yet.
+
+    Raises:
+        ValueError: If the class is missing or unknown, or a value cannot
+            be converted, or a timestamp is not an ISO 8601 string.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("a record must be an object")
+    record_name = record.get("__class__", name)
+    if name is not None and record_name != name:
+        raise ValueError(f"record of class {record_name}, not {name}")
+    cls = _models.get(record_name)
+    if cls is None:
+        raise ValueError(f"unknown class {record_name}")
+    attrs = {k: coerce(cls, k, v) for k, v in record.items()
+             if k != "__class__"}
+    attrs.setdefault("id", str(uuid.uuid4()))
+    attrs.setdefault("created_at", now)
+    attrs.setdefault("updated_at", attrs["created_at"])
+    for attr in ("created_at", "updated_at"):
+        if not isinstance(attrs[attr], str):
+            raise ValueError(f"{attr}: {attrs[attr]!r} is not a date")
+        attrs[attr] = datetime.fromisoformat(attrs[attr])
+    return cls(**attrs)
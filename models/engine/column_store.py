@@ -0,0 +1,200 @@
+#!/usr/bin/python3
+"""
+Module: column_store.py
+
+Defines a `ColumnStore` class keeping numeric attributes of the objects of
+one model class in columns, so that range and equality predicates over them
+can be evaluated for all objects at once.
+
+When NumPy is installed, columns are NumPy arrays and predicates are
+evaluated with vectorized comparisons; otherwise columns are `array`
+objects scanned in pure Python.
+"""
+
+import operator
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+OPERATORS = {
+    "==": operator.eq, "!=": operator.ne,
+    "<": operator.lt, "<=": operator.le,
+    ">": operator.gt, ">=": operator.ge,
+}
+
+
+def is_number(value):
+    """Checks if `value` can be stored in a numeric column.
+
+    Args:
+        value (any): The value to check.
+
+    Returns:
+        bool: True if `value` is an int or a float, False otherwise.
+    """
+    return isinstance(value, (int, float))
+
+
+def matches(obj, predicates):
+    """Checks an object against comparison predicates.
+
+    Args:
+        obj: The object to check.
+        predicates (list): (attribute, operator, value) triples.
+
+    Returns:
+        bool: True if `obj` matches every predicate. An attribute that is
+        missing, or whose value cannot be compared, does not match.
+    """
+    missing = object()
+    for attr, op, value in predicates:
+        current = getattr(obj, attr, missing)
+        if current is missing:
+            return False
+        try:
+            if not OPERATORS[op](current, value):
+                return False
+        except TypeError:
+            return False
+    return True
+
+
+class ColumnStore:
+    """
+    Numeric attributes of a set of objects, stored one column per attribute
+    and one row per object key.
+
+    Rows of removed keys are reused by later keys. Objects holding a
+    non-numeric value in one of the columns are kept aside as irregular:
+    `select()` returns them separately so the caller can check them itself.
+    """
+
+    def __init__(self, attrs):
+        """
+        Initialize an empty store.
+
+        Args:
+            attrs (tuple): The names of the attributes to keep in columns.
+        """
+        self.attrs = tuple(attrs)
+        self.__rows = {}
+        self.__keys = []
+        self.__free = []
+        self.__irregular = set()
+        if numpy is not None:
+            self.__columns = {a: numpy.zeros(0) for a in self.attrs}
+            self.__valid = numpy.zeros(0, dtype=bool)
+        else:
+            self.__columns = {a: array('d') for a in self.attrs}
+            self.__valid = array('b')
+
+    def __len__(self):
+        """
+        Returns:
+            int: The number of keys in the store.
+        """
+        return len(self.__rows) + len(self.__irregular)
+
+    def set(self, key, values):
+        """
+        Store or replace the values of one key.
+
+        Args:
+            key (str): The storage key of the object.
+            values (dict): Attribute names mapped to their values.
+        """
+        self.remove(key)
+        if not all(is_number(values[a]) for a in self.attrs):
+            self.__irregular.add(key)
+            return
+        if self.__free:
+            row = self.__free.pop()
+            self.__keys[row] = key
+        else:
+            row = len(self.__keys)
+            self.__keys.append(key)
+            self.__grow()
+        for attr in self.attrs:
+            self.__columns[attr][row] = values[attr]
+        self.__valid[row] = True
+        self.__rows[key] = row
+
+    def remove(self, key):
+        """
+        Remove a key from the store, if present.
+
+        Args:
+            key (str): The storage key of the object.
+        """
+        self.__irregular.discard(key)
+        row = self.__rows.pop(key, None)
+        if row is not None:
+            self.__valid[row] = False
+            self.__keys[row] = None
+            self.__free.append(row)
+
+    def can_select(self, predicate):
+        """
+        Checks if the store can evaluate a predicate.
+
+        Args:
+            predicate (tuple): An (attribute, operator, value) triple.
+
+        Returns:
+            bool: True if the attribute is a column, the operator is known
+            and the value is a number.
+        """
+        attr, op, value = predicate
+        return attr in self.__columns and op in OPERATORS and \
+            is_number(value)
+
+    def select(self, predicates):
+        """
+        Evaluate predicates that `can_select()` accepts.
+
+        Args:
+            predicates (list): (attribute, operator, value) triples.
+
+        Returns:
+            tuple: The keys whose values match every predicate, and the
+            irregular keys, whose values the store cannot compare.
+        """
+        size = len(self.__keys)
+        if numpy is not None:
+            mask = self.__valid[:size].copy()
+            for attr, op, value in predicates:
+                mask &= OPERATORS[op](self.__columns[attr][:size], value)
+            rows = numpy.flatnonzero(mask).tolist()
+        else:
+            tests = [(self.__columns[attr], OPERATORS[op], value)
+                     for attr, op, value in predicates]
+            valid = self.__valid
+            rows = [r for r in range(size)
+                    if valid[r] and all(test(column[r], value)
+                                        for column, test, value in tests)]
+        keys = self.__keys
+        return [keys[r] for r in rows], list(self.__irregular)
+
+    def __grow(self):
+        """
+        Make room for the row just appended to the keys.
+        """
+        size = len(self.__keys)
+        if numpy is None:
+            for column in self.__columns.values():
+                column.append(0.0)
+            self.__valid.append(0)
+            return
+        if size <= len(self.__valid):
+            return
+        capacity = max(16, 2 * len(self.__valid))
+        for attr, column in self.__columns.items():
+            grown = numpy.zeros(capacity)
+            grown[:len(column)] = column
+            self.__columns[attr] = grown
+        valid = numpy.zeros(capacity, dtype=bool)
+        valid[:len(self.__valid)] = self.__valid
+        self.__valid = valid
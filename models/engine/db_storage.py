@@ -0,0 +1,696 @@
+#!/usr/bin/python3
+"""
+Module: db_storage.py
+
+Defines a `DBStorage` class storing instances in a SQLite database, with
+the same interface as `FileStorage`.
+
+Each model class has a table of its own, keyed by object id, whose `data`
+column holds the JSON record of the object (as stored in `file.json`). The
+attributes a model declares in `_indexed_attrs`, `_columnar_attrs` and
+`_spatial_attrs` are also copied to columns, so that `find()`, `where()`,
+`near()` and `within()` filter rows in SQL before checking the objects,
+as `FileStorage` does. Foreign keys and coordinates are indexed.
+
+Objects read from the database are kept in an identity map, so the same
+key gives the same object until the next `reload()`. New, changed and
+deleted objects are written to the database one row each, before the next
+query and on `save()`, which commits them in one transaction; `reload()`
+rolls back the changes that were not saved. Within a batch (`batch()`, or
+`begin()` and `commit()`) saves are deferred, so the whole batch is
+committed as one transaction.
+"""
+
+import json
+import sqlite3
+from contextlib import contextmanager
+from models.engine.column_store import OPERATORS, is_number, matches
+from models.engine.spatial_index import degree_spans, distance_km
+from models.engine.query_planner import Plan
+from models.base_model import BaseModel
+from models.user import User
+from models.state import State
+from models.city import City
+from models.review import Review
+from models.amenity import Amenity
+from models.place import Place
+
+
+class DBStorage:
+    """
+    A class storing instances in a SQLite database.
+
+    Attributes:
+        page_size (int): The number of rows `stream()` reads at a time.
+    """
+
+    page_size = 1000
+    __models = {'BaseModel': BaseModel, 'User': User, 'Amenity': Amenity,
+                'City': City, 'State': State, 'Place': Place,
+                'Review': Review}
+
+    def __init__(self, path="file.db"):
+        """
+        Initialize the storage. The database is opened by `reload()`, or
+        by the first operation that needs it.
+
+        Args:
+            path (str): The path of the SQLite database.
+        """
+        self.__path = path
+        self.__connection = None
+        self.__objects = {}
+        self.__pending = set()
+        self.__deleted = set()
+        self.__batches = 0
+        self.__save_requested = False
+        self.__generation = 0
+        self.__data_version = None
+
+    @property
+    def generation(self):
+        """
+        int: A counter increased whenever an object is created, changed or
+        deleted here, or the objects are reloaded, or another connection
+        (e.g. another process) commits changes to the database, so that
+        results computed from the stored objects can be reused while it
+        stays the same.
+        """
+        if self.__connection is not None:
+            (version,) = self.__connection.execute(
+                "PRAGMA data_version").fetchone()
+            if version != self.__data_version:
+                self.__data_version = version
+                self.__generation += 1
+        return self.__generation
+
+    def all(self, cls=None):
+        """
+        Retrieve all stored objects, or only those of one class.
+
+        Args:
+            cls (type or str, optional): The class, or class name, of the
+                objects to retrieve.
+
+        Returns:
+            dict: A new dictionary with the matching objects, by key.
+        """
+        names = self.__models if cls is None else [self.__class_name(cls)]
+        found = {}
+        for name in names:
+            found.update(self.__select(name))
+        return found
+
+    def stream(self, cls=None, after=None):
+        """
+        Yield the stored objects, or those of one class, one at a time
+        instead of collecting them in a dictionary, e.g. to print them as
+        they are read. Rows are read `page_size` at a time.
+
+        Objects are yielded by class, in the order of their ids within a
+        class.
+
+        Args:
+            cls (type or str, optional): The class, or class name, of the
+                objects to yield.
+            after (str, optional): A storage key; only the objects
+                following it are yielded, e.g. the last key of the previous
+                page.
+
+        Yields:
+            tuple: The key and the object.
+        """
+        names = list(self.__models) if cls is None else \
+            [self.__class_name(cls)]
+        last = None
+        if after is not None:
+            name, _, last = after.partition('.')
+            names = names[names.index(name):] if name in names else []
+        for name in names:
+            if name not in self.__models:
+                continue
+            while True:
+                sql = f'SELECT id, data FROM "{name}"'
+                params = []
+                if last is not None:
+                    sql += " WHERE id > ?"
+                    params.append(last)
+                sql += f" ORDER BY id LIMIT {self.page_size}"
+                rows = self.__flush().execute(sql, params).fetchall()
+                for id, data in rows:
+                    key = f"{name}.{id}"
+                    yield key, self.__load(key, data)
+                if len(rows) < self.page_size:
+                    break
+                last = rows[-1][0]
+            last = None
+
+    def count(self, cls=None):
+        """
+        Count stored objects, or only those of one class.
+
+        Args:
+            cls (type or str, optional): The class, or class name, of the
+                objects to count.
+
+        Returns:
+            int: The number of matching objects.
+        """
+        names = self.__models if cls is None else [self.__class_name(cls)]
+        db = self.__flush()
+        return sum(db.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+                   for name in names if name in self.__models)
+
+    def near(self, cls, latitude, longitude, km):
+        """
+        Retrieve the objects of a class within a distance of a point.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            latitude (float): Latitude of the center, in degrees.
+            longitude (float): Longitude of the center, in degrees.
+            km (float): The radius, in kilometers.
+
+        Returns:
+            dict: The matching objects by key, closest first.
+        """
+        name = self.__class_name(cls)
+        model = self.__models.get(name)
+        if model is None or not model._spatial_attrs:
+            return {}
+        lat_span, lon_span = degree_spans(latitude, km)
+        box = [latitude - lat_span, None, latitude + lat_span, None]
+        if lon_span < 180:
+            box[1] = (longitude - lon_span + 180) % 360 - 180
+            box[3] = (longitude + lon_span + 180) % 360 - 180
+        found = []
+        for key, obj in self.__select_box(name, *box).items():
+            point = [getattr(obj, attr, None) for attr in model._spatial_attrs]
+            if all(is_number(v) for v in point):
+                distance = distance_km(latitude, longitude, *point)
+                if distance <= km:
+                    found.append((distance, key, obj))
+        found.sort(key=lambda item: item[0])
+        return {key: obj for _, key, obj in found}
+
+    def within(self, cls, min_lat, min_lon, max_lat, max_lon):
+        """
+        Retrieve the objects of a class inside a bounding box.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            min_lat (float): Southern edge, in degrees.
+            min_lon (float): Western edge, in degrees.
+            max_lat (float): Northern edge, in degrees.
+            max_lon (float): Eastern edge, in degrees. A box whose
+                `min_lon` is greater crosses the antimeridian.
+
+        Returns:
+            dict: The matching objects, by key.
+        """
+        name = self.__class_name(cls)
+        model = self.__models.get(name)
+        if model is None or not model._spatial_attrs:
+            return {}
+        lat_attr, lon_attr = model._spatial_attrs
+        found = {}
+        for key, obj in self.__select_box(
+                name, min_lat, min_lon, max_lat, max_lon).items():
+            lat = getattr(obj, lat_attr, None)
+            lon = getattr(obj, lon_attr, None)
+            if not (is_number(lat) and is_number(lon)) or \
+                    not min_lat <= lat <= max_lat:
+                continue
+            if min_lon <= max_lon and not min_lon <= lon <= max_lon:
+                continue
+            if min_lon > max_lon and min_lon > lon > max_lon:
+                continue
+            found[key] = obj
+        return found
+
+    def get(self, cls, id):
+        """
+        Retrieve one object by class and id.
+
+        Args:
+            cls (type or str): The class, or class name, of the object.
+            id (str): The id of the object.
+
+        Returns:
+            The object, or None if it is not stored.
+        """
+        name = self.__class_name(cls)
+        key = f"{name}.{id}"
+        if key in self.__objects:
+            return self.__objects[key]
+        if key in self.__deleted or name not in self.__models:
+            return None
+        row = self.__db().execute(
+            f'SELECT data FROM "{name}" WHERE id = ?', (id,)).fetchone()
+        return None if row is None else self.__load(key, row[0])
+
+    def find(self, cls, **criteria):
+        """
+        Retrieve the objects of a class whose attributes equal the given
+        values, e.g. `find(Review, place_id=place.id)`.
+
+        Criteria on the columns of the class are evaluated in SQL, the
+        others on the objects the query returned.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            **criteria: Attribute names mapped to the values to match.
+
+        Returns:
+            dict: The matching objects, by key.
+        """
+        return self.where(cls, *((attr, "==", value)
+                                 for attr, value in criteria.items()))
+
+    def where(self, cls, *predicates):
+        """
+        Retrieve the objects of a class matching comparison predicates,
+        e.g. `where(Place, ("price_by_night", "<", 100))`.
+
+        Predicates on the columns of the class are evaluated in SQL, and
+        every predicate is then checked on the objects. Objects that lack
+        an attribute, or whose value cannot be compared, do not match.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            *predicates: (attribute, operator, value) triples, where the
+                operator is one of ==, !=, <, <=, > or >=.
+
+        Returns:
+            dict: The matching objects, by key.
+
+        Raises:
+            ValueError: If an operator is unknown.
+        """
+        name = self.__class_name(cls)
+        clauses, params = self.__clauses(name, predicates)
+        return {key: obj
+                for key, obj in self.__select(name, clauses, params).items()
+                if matches(obj, predicates)}
+
+    def explain(self, cls, *predicates):
+        """
+        Run `where(cls, *predicates)` and describe how SQLite ran it, as
+        `EXPLAIN QUERY PLAN` reports it. SQLite gives no estimates.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            *predicates: (attribute, operator, value) triples.
+
+        Returns:
+            Plan: The plan, with the actual numbers of matching objects
+            and of rows the query returned.
+
+        Raises:
+            ValueError: If an operator is unknown.
+        """
+        name = self.__class_name(cls)
+        clauses, params = self.__clauses(name, predicates)
+        if name not in self.__models:
+            plan = Plan("sql", "", None, None)
+            plan.rows = plan.examined = 0
+            return plan
+        sql = f'SELECT id, data FROM "{name}"'
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        steps = self.__flush().execute(
+            "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        plan = Plan("sql", "; ".join(step[-1] for step in steps),
+                    None, None)
+        selected = self.__select(name, clauses, params)
+        plan.examined = len(selected)
+        plan.rows = sum(matches(obj, predicates)
+                        for obj in selected.values())
+        return plan
+
+    def new(self, obj):
+        """
+        Add a new object to the storage.
+
+        Args:
+            obj: The object to be added to the storage.
+        """
+        key = f"{type(obj).__name__}.{obj.id}"
+        self.__objects[key] = obj
+        self.__generation += 1
+        self.__pending.add(key)
+        self.__deleted.discard(key)
+
+    def touch(self, obj):
+        """
+        Mark a stored object as modified so its row is written again.
+
+        Args:
+            obj: The modified object. Objects that are not stored (yet) are
+                ignored.
+        """
+        key = f"{type(obj).__name__}.{getattr(obj, 'id', None)}"
+        if self.__objects.get(key) is obj:
+            self.__generation += 1
+            obj._changed()
+            self.__pending.add(key)
+
+    def delete(self, obj=None):
+        """
+        Remove an object from the storage.
+
+        Args:
+            obj: The object to be removed. Nothing happens if it is None.
+        """
+        if obj is None:
+            return
+        key = f"{type(obj).__name__}.{obj.id}"
+        self.__objects.pop(key, None)
+        self.__generation += 1
+        self.__pending.discard(key)
+        self.__deleted.add(key)
+
+    def save(self):
+        """
+        Write the changes since the last save and commit them in one
+        transaction. Within a batch, the commit is deferred until the batch
+        is committed.
+        """
+        if self.__batches:
+            self.__save_requested = True
+            return
+        self.__flush().commit()
+
+    def flush(self):
+        """
+        Do nothing: saves are committed to the database at once.
+        """
+
+    def sync(self):
+        """
+        Do nothing: queries read the changes of other processes from the
+        database; objects already loaded are kept until `reload()`.
+        """
+
+    def begin(self):
+        """
+        Start a batch: saves are deferred until the matching `commit()`.
+        Batches nest; only the outermost one saves.
+        """
+        self.__batches += 1
+
+    def commit(self):
+        """
+        End the innermost batch. Ending the outermost one saves, if any
+        save was requested during the batch.
+
+        Raises:
+            RuntimeError: If no batch was started.
+        """
+        if not self.__batches:
+            raise RuntimeError("no batch to commit")
+        self.__batches -= 1
+        if not self.__batches and self.__save_requested:
+            self.__save_requested = False
+            self.save()
+
+    def rollback(self):
+        """
+        End every batch without saving, discarding all the changes that
+        were not saved.
+        """
+        self.__batches = 0
+        self.__save_requested = False
+        self.reload()
+
+    @contextmanager
+    def batch(self):
+        """
+        Run a block as a batch, committed as one transaction when the block
+        exits and rolled back if it raises.
+
+        Yields:
+            DBStorage: The storage.
+        """
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def compact(self, background=False):
+        """
+        Save the changes, then rebuild the database file to reclaim the
+        space of deleted rows. Nothing is done within a batch.
+
+        Args:
+            background (bool): Accepted for compatibility with
+                `FileStorage.compact()`; the database is always rebuilt
+                before returning.
+        """
+        if self.__batches:
+            return
+        self.save()
+        self.__db().execute("VACUUM")
+
+    def reload(self):
+        """
+        Open the database, creating the tables of the model classes if
+        needed, and forget the objects read so far and the changes not
+        saved yet.
+        """
+        self.__db().rollback()
+        self.__objects = {}
+        self.__generation += 1
+        self.__pending.clear()
+        self.__deleted.clear()
+
+    @staticmethod
+    def __class_name(cls):
+        """
+        Args:
+            cls (type or str): A class or class name.
+
+        Returns:
+            str: The name of the class.
+        """
+        return cls if isinstance(cls, str) else cls.__name__
+
+    @staticmethod
+    def __columns(cls):
+        """
+        Args:
+            cls (type): A model class.
+
+        Returns:
+            tuple: The attributes of `cls` copied to columns of its table.
+        """
+        columns = []
+        for attr in cls._indexed_attrs + cls._columnar_attrs + \
+                cls._spatial_attrs:
+            if attr != "id" and attr not in columns:
+                columns.append(attr)
+        return tuple(columns)
+
+    def __db(self):
+        """
+        Returns:
+            sqlite3.Connection: The connection to the database, opened and
+            set up on first use.
+        """
+        if self.__connection is None:
+            self.__connection = sqlite3.connect(self.__path)
+            self.__connection.execute("PRAGMA journal_mode = WAL")
+            self.__connection.execute("PRAGMA synchronous = NORMAL")
+            for name, cls in self.__models.items():
+                self.__create_table(name, cls)
+            self.__connection.commit()
+        return self.__connection
+
+    def __create_table(self, name, cls):
+        """
+        Create the table of a model class and its indexes, adding the
+        columns the class declares that the table lacks.
+
+        Args:
+            name (str): The name of the class.
+            cls (type): The model class.
+        """
+        db = self.__connection
+        columns = self.__columns(cls)
+        db.execute(f'CREATE TABLE IF NOT EXISTS "{name}" '
+                   f'(id TEXT PRIMARY KEY, data TEXT NOT NULL)')
+        existing = {row[1] for row in db.execute(
+            f'PRAGMA table_info("{name}")')}
+        missing = [c for c in columns if c not in existing]
+        for column in missing:
+            # Columns are left untyped so values compare as in Python
+            db.execute(f'ALTER TABLE "{name}" ADD COLUMN "{column}"')
+        for attr in cls._indexed_attrs:
+            db.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{attr}" '
+                       f'ON "{name}" ("{attr}")')
+        if cls._spatial_attrs:
+            lat, lon = cls._spatial_attrs
+            db.execute(f'CREATE INDEX IF NOT EXISTS "{name}_spatial" '
+                       f'ON "{name}" ("{lat}", "{lon}")')
+        if missing:
+            rows = [self.__row(cls(**json.loads(data)), columns)
+                    for (data,) in db.execute(f'SELECT data FROM "{name}"')]
+            db.executemany(self.__upsert(name, columns), rows)
+
+    def __clauses(self, name, predicates):
+        """
+        Translate the predicates on the columns of a class to SQL.
+
+        Args:
+            name (str): The name of the class.
+            predicates (tuple): (attribute, operator, value) triples.
+
+        Returns:
+            tuple: The SQL conditions and their parameters. Predicates that
+            cannot be evaluated in SQL are left out.
+
+        Raises:
+            ValueError: If an operator is unknown.
+        """
+        for _, op, _ in predicates:
+            if op not in OPERATORS:
+                raise ValueError(f"unknown operator: {op}")
+        if name not in self.__models:
+            return [], []
+        columns = ("id",) + self.__columns(self.__models[name])
+        clauses, params = [], []
+        for attr, op, value in predicates:
+            if attr not in columns or not (
+                    isinstance(value, str) or is_number(value)):
+                continue
+            if op == "==":
+                clauses.append(f'"{attr}" = ?')
+            elif op == "!=":
+                # NULL stands for values that have no column type
+                clauses.append(f'("{attr}" IS NULL OR "{attr}" != ?)')
+            else:
+                types = "'text'" if isinstance(value, str) else \
+                    "'integer', 'real'"
+                clauses.append(
+                    f'"{attr}" {op} ? AND typeof("{attr}") IN ({types})')
+            params.append(value)
+        return clauses, params
+
+    def __flush(self):
+        """
+        Write the rows of the objects changed or deleted since the last
+        flush, without committing them.
+
+        Returns:
+            sqlite3.Connection: The connection to the database.
+        """
+        db = self.__db()
+        for key in self.__deleted:
+            name, id = key.split('.', 1)
+            if name in self.__models:
+                db.execute(f'DELETE FROM "{name}" WHERE id = ?', (id,))
+        rows = {}
+        for key in self.__pending:
+            obj = self.__objects[key]
+            rows.setdefault(type(obj).__name__, []).append(obj)
+        for name, objs in rows.items():
+            columns = self.__columns(self.__models[name])
+            db.executemany(self.__upsert(name, columns),
+                           [self.__row(obj, columns) for obj in objs])
+        self.__pending.clear()
+        self.__deleted.clear()
+        return db
+
+    @staticmethod
+    def __upsert(name, columns):
+        """
+        Returns:
+            str: The statement inserting or replacing a row of a table.
+        """
+        names = ", ".join(f'"{c}"' for c in ("id",) + columns + ("data",))
+        marks = ", ".join("?" * (len(columns) + 2))
+        return f'INSERT OR REPLACE INTO "{name}" ({names}) VALUES ({marks})'
+
+    @staticmethod
+    def __row(obj, columns):
+        """
+        Args:
+            obj: A stored object.
+            columns (tuple): The attributes copied to columns.
+
+        Returns:
+            tuple: The values of the row of `obj`. Values that SQLite cannot
+            compare like Python does are left out of the columns.
+        """
+        values = [obj.id]
+        for attr in columns:
+            value = getattr(obj, attr, None)
+            values.append(value if isinstance(value, str) or
+                          is_number(value) else None)
+        values.append(json.dumps(obj.to_dict()))
+        return values
+
+    def __load(self, key, data):
+        """
+        Args:
+            key (str): The key of a row.
+            data (str): The JSON record of the row.
+
+        Returns:
+            The object of the row, created unless already read.
+        """
+        obj = self.__objects.get(key)
+        if obj is None:
+            cls = self.__models[key.split('.')[0]]
+            obj = cls(**json.loads(data))
+            self.__objects[key] = obj
+        return obj
+
+    def __select(self, name, clauses=(), params=()):
+        """
+        Retrieve the objects of the rows of a table matching SQL clauses.
+
+        Args:
+            name (str): The name of the class.
+            clauses (list): SQL conditions, all of which must hold.
+            params (list): The parameters of the conditions.
+
+        Returns:
+            dict: The objects of the matching rows, by key.
+        """
+        if name not in self.__models:
+            return {}
+        sql = f'SELECT id, data FROM "{name}"'
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return {f"{name}.{id}": self.__load(f"{name}.{id}", data)
+                for id, data in self.__flush().execute(sql, params)}
+
+    def __select_box(self, name, min_lat, min_lon, max_lat, max_lon):
+        """
+        Retrieve the objects of a class whose coordinates columns fall in
+        a bounding box.
+
+        Args:
+            name (str): The name of a class with `_spatial_attrs`.
+            min_lat (float): Southern edge, in degrees.
+            min_lon (float): Western edge, in degrees, or None.
+            max_lat (float): Northern edge, in degrees.
+            max_lon (float): Eastern edge, in degrees, or None.
+
+        Returns:
+            dict: The objects of the matching rows, by key.
+        """
+        lat, lon = self.__models[name]._spatial_attrs
+        clauses = [f'"{lat}" BETWEEN ? AND ?']
+        params = [min_lat, max_lat]
+        if min_lon is not None:
+            if min_lon <= max_lon:
+                clauses.append(f'"{lon}" BETWEEN ? AND ?')
+            else:
+                clauses.append(f'("{lon}" >= ? OR "{lon}" <= ?)')
+            params.extend((min_lon, max_lon))
+        return self.__select(name, clauses, params)
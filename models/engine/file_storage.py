@@ -4,10 +4,127 @@ Module: file_storage.py
 
 Defines a `FileStorage` class for serializing instances to a JSON file and deserializing
 JSON file to instances.
+
+The file format is pluggable (see `models.engine.serializers`): the binary
+format is stored next to the JSON path, with a `.bin` extension.
+
+Snapshots are written atomically, next to a checksum and a backup of the
+previous one (see `models.engine.atomic_file`): a crash while saving leaves
+the previous snapshot, and a snapshot found truncated or unreadable on
+reload is replaced by the backup. If there is no good backup, `reload()` raises
+ValueError rather than starting from an empty store.
+
+When journaling is enabled, `save()` no longer rewrites the whole file: the
+records created, updated or destroyed since the last save are appended to a
+journal (`<file_path>.log`, e.g. one JSON entry per line) and `reload()`
+replays that journal on top of the snapshot. The entries of each save are
+framed by a commit marker, so a save cut short by a crash is dropped as a
+whole, batches included.
+
+Once the journal holds `compact_threshold` entries (or when `compact()` is
+called, e.g. from the console) it is folded into a fresh snapshot. The
+journal is first rotated to `<file_path>.log.old` so that saves can keep
+appending to a new journal while a background thread writes the snapshot
+to a temporary file and atomically renames it over the old one.
+
+Models report their own attribute changes through `touch()`, and the
+encoding of every record is cached until its object changes, so a save only
+re-serializes the objects modified since the previous one.
+
+Keys are also indexed by class name, so listing or counting the objects of
+one class costs time proportional to that class only, and by the values of
+the attributes each model declares in `_indexed_attrs` (its foreign keys),
+so `find()` serves lookups such as "all reviews of a place" in time
+proportional to the number of matches.
+
+`reload()` streams the snapshot and creates each object as soon as its
+record is read, so the file text and the parsed records are never all held
+in memory next to the objects.
+
+In lazy mode `reload()` keeps the raw records and only builds the indexes;
+instances are created the first time they are accessed through `all()`,
+`get()` or `find()`, and records that are never accessed are saved back
+without ever being instantiated.
+
+In compact mode reloaded objects are created from the compact variants of
+the model classes (see `BaseModel.compact`), which use less memory.
+
+In columnar mode the numeric attributes each model declares in
+`_columnar_attrs` are also kept in a `ColumnStore`, which `where()` uses to
+evaluate comparisons over all objects of a class at once.
+
+In mapped mode the store is a binary snapshot that `reload()` only
+memory-maps (see `RecordFile`): an object is read from the file when it is
+first accessed, using an index of the record offsets by key, and changes
+are journaled, so a single `show`, `update` or `destroy` costs about the
+same whatever the size of the store. The indexes of classes and attributes
+are only built when a query needs them.
+
+Within a batch (`batch()`, or `begin()` and `commit()`) saves are deferred:
+the changes of the whole batch are written by a single save when it ends,
+and none of them are if it fails.
+
+The coordinates of models declaring `_spatial_attrs` (latitude, longitude)
+are indexed in a `GridIndex`, which serves `near()` and `within()`.
+
+`where()` reads the objects of a query through the access path a small
+planner estimates to be the cheapest (see `models.engine.query_planner`),
+from the sizes of the indexes and the range of each numeric attribute;
+`explain()` shows the plan. The spatial index and the ranges of a class
+are built by its first spatial query or `where()`, and kept up to date
+from then on.
+
+In write-behind mode (`write_delay`) `save()` only marks the store dirty: a
+background thread writes the changes `write_delay` seconds later, so a
+burst of saves costs a single write. `flush()` writes them at once; it is
+called by `reload()`, at the start of a batch and when the interpreter
+exits. The methods of the storage hold a lock, so the writer never encodes
+an object while it is being changed.
+
+In shared mode several processes can use the same storage file. Writes and
+reloads hold an exclusive lock on `<file_path>.lock`, and before writing,
+the storage applies the changes other processes have written since it last
+read the file: the new journal entries when only the journal has grown,
+otherwise the whole file is read again. Only the records changed by the
+process itself are then written over them, so the last writer wins for
+each record rather than for the whole store. `sync()` applies the changes
+of other processes without writing (e.g. before each console command).
+Compactions then run while holding the lock, instead of in the background.
+
+The lock the methods of the storage hold also lets several threads share
+it. In thread-safe mode `all()` also returns a read-only snapshot of the
+stored objects instead of the live dictionary, so that a thread can
+iterate over it while others create or delete objects. The snapshot is
+copied once and shared by every caller until an object is created or
+deleted, and `all()` and `get()` serve readers without taking the lock when
+they can, so readers are not held up by a writer encoding the objects.
+
+In sharded mode (`shards`) the objects are stored in one directory per
+class, split into `shards` files by a hash of their ids (see
+`models.engine.shards`). `save()` only rewrites the files holding objects
+changed since the last save, and `reload()` reads no file: the files of a
+class are read the first time its objects are needed. An unsharded store
+found on reload is split into shards by the next save.
 """
 
 import os
-import json
+import time
+import atexit
+import threading
+from types import MappingProxyType
+from functools import wraps
+from contextlib import contextmanager
+from models.engine.column_store import (
+    ColumnStore, OPERATORS, is_number, matches)
+from models.engine.spatial_index import GridIndex
+from models.engine.query_planner import (
+    COLUMN_COST, Plan, Statistics, bounding_box, choose)
+from models.engine.serializers import get_serializer, read_store
+from models.engine.record_file import RecordFile, write_index
+from models.engine.atomic_file import (
+    checksum_path, recover, write_atomic)
+from models.engine.shards import (
+    bucket_of, list_shards, shard_directory, shard_path)
 from models.base_model import BaseModel
 from models.user import User
 from models.state import State
@@ -16,6 +133,11 @@ from models.review import Review
 from models.amenity import Amenity
 from models.place import Place
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 
 class FileStorage:
     """
@@ -24,16 +146,362 @@ class FileStorage:
 
     __file_path = "file.json"
     __objects = {}
+    __models = {'BaseModel': BaseModel, 'User': User, 'Amenity': Amenity,
+                'City': City, 'State': State, 'Place': Place,
+                'Review': Review}
+
+    def __synchronized(method):
+        """
+        Make a method hold the lock of the storage while it runs.
+        """
+        @wraps(method)
+        def synchronized(self, *args, **kwargs):
+            with self.__lock:
+                return method(self, *args, **kwargs)
+        return synchronized
+
+    def __init__(self, *, journal=False, compact_threshold=10000,
+                 lazy=False, compact_models=False, columnar=False,
+                 mapped=False, format=None, write_delay=None,
+                 shared=False, threadsafe=False, shards=None):
+        """
+        Initialize the storage.
+
+        Args:
+            journal (bool): Append changed records to a journal on `save()`
+                instead of rewriting the whole file.
+            compact_threshold (int): Number of journal entries after which
+                the journal is compacted in the background. None disables
+                automatic compaction.
+            lazy (bool): Defer the creation of reloaded objects until they
+                are accessed.
+            compact_models (bool): Create reloaded objects from the compact
+                variants of the model classes.
+            columnar (bool): Keep numeric attributes in column stores.
+            mapped (bool): Memory-map the snapshot and read objects from it
+                when they are accessed; implies journaling.
+            format (str): The file format, "json" or "binary". Defaults to
+                binary in mapped mode and to JSON otherwise.
+            write_delay (float): Write saved changes in a background thread
+                this many seconds after the first save instead of at once.
+                None writes them in `save()`.
+            shared (bool): Lock the storage file while using it and merge
+                the changes of other processes using it too.
+            threadsafe (bool): Return snapshots from `all()`, which other
+                threads can change the storage while they are iterated.
+            shards (int): Store each class in this many files instead of
+                storing every object in one file.
+
+        Raises:
+            ValueError: If the format is unknown, or not binary in mapped
+                mode, or if a sharded storage is journaled, mapped or
+                shared.
+        """
+        if format is None:
+            format = "binary" if mapped else "json"
+        if mapped and format != "binary":
+            raise ValueError("mapped storage requires the binary format")
+        if shards and (journal or mapped or shared):
+            raise ValueError(
+                "sharded storage cannot be journaled, mapped or shared")
+        self.__serializer = get_serializer(format)
+        root, extension = os.path.splitext(self.__file_path)
+        if extension != self.__serializer.extension:
+            self.__file_path = root + self.__serializer.extension
+        self.__journal = journal or mapped
+        self.__mapped = mapped
+        self.__lazy = lazy
+        self.__compact_models = compact_models
+        self.__columnar = columnar
+        self.__column_stores = {}
+        self.__grids = {}
+        self.__stats = Statistics()
+        self.__planned = set()
+        self.__raw = {}
+        self.__compact_threshold = compact_threshold
+        self.__journal_entries = 0
+        self.__compactor = None
+        self.__pending = set()
+        self.__deleted = set()
+        self.__encoded = {}
+        self.__classes = {}
+        self.__attr_index = {}
+        self.__attr_values = {}
+        self.__indexed = None
+        self.__loaded = None
+        self.__batches = 0
+        self.__save_requested = False
+        self.__lock = threading.RLock()
+        self.__write_lock = threading.RLock()
+        self.__dirty = threading.Event()
+        self.__write_delay = write_delay
+        self.__writer = None
+        self.__write_error = None
+        if write_delay is not None:
+            atexit.register(self.flush)
+        self.__shared = shared
+        self.__seen = None
+        self.__threadsafe = threadsafe
+        self.__view = None
+        self.__shards = shards
+        self.__shard_directory = shard_directory(self.__file_path)
+        self.__unloaded = {}
+        self.__shard_keys = {}
+        self.__generation = 0
+
+    @property
+    def generation(self):
+        """
+        int: A counter increased whenever an object is created, changed or
+        deleted, or the objects are reloaded, so that results computed from
+        the stored objects can be reused while it stays the same.
+        """
+        with self.__lock:
+            self.__sync()
+            return self.__generation
+
+    def all(self, cls=None):
+        """
+        Retrieve all stored objects, or only those of one class.
+
+        Args:
+            cls (type or str, optional): The class, or class name, of the
+                objects to retrieve.
+
+        Returns:
+            dict: A dictionary containing all stored objects when `cls` is
+            None, otherwise a new dictionary with the objects of `cls`. In
+            thread-safe mode, all the stored objects are returned as a
+            read-only snapshot.
+        """
+        if cls is None and self.__threadsafe:
+            view = self.__view
+            if view is not None and view[0] is self.__objects:
+                return view[1]
+        with self.__lock:
+            self.__load(cls)
+            if cls is None:
+                for key in list(self.__raw):
+                    self.__materialize(key)
+                if not self.__threadsafe:
+                    return self.__objects
+                self.__view = (self.__objects,
+                               MappingProxyType(dict(self.__objects)))
+                return self.__view[1]
+            keys = self.__indexes().get(self.__class_name(cls), ())
+            return {k: self.__lookup(k) for k in keys}
+
+    def stream(self, cls=None, after=None):
+        """
+        Yield the stored objects, or those of one class, one at a time
+        instead of collecting them in a dictionary, e.g. to print them as
+        they are read.
+
+        Objects are yielded by class, in the order they were stored within
+        a class. In thread-safe mode the keys of each class are copied when
+        the iteration reaches it; otherwise objects must not be created or
+        deleted while the iteration is in progress.
+
+        Args:
+            cls (type or str, optional): The class, or class name, of the
+                objects to yield.
+            after (str, optional): The key of a stored object; only the
+                objects following it are yielded, e.g. the last key of the
+                previous page.
+
+        Yields:
+            tuple: The key and the object.
+
+        Raises:
+            KeyError: If no object of the class is stored under `after`.
+        """
+        with self.__lock:
+            self.__load(cls)
+            classes = self.__indexes()
+            names = list(classes) if cls is None else \
+                [self.__class_name(cls)]
+            if after is not None:
+                name = after.split('.')[0]
+                if name not in names or after not in classes[name]:
+                    raise KeyError(after)
+                names = names[names.index(name):]
+        for name in names:
+            with self.__lock:
+                keys = self.__indexes().get(name, ())
+                if self.__threadsafe:
+                    keys = list(keys)
+            for key in keys:
+                if after is not None:
+                    if key == after:
+                        after = None
+                    continue
+                with self.__lock:
+                    obj = self.__objects.get(key)
+                    if obj is None and key in self.__raw:
+                        obj = self.__materialize(key)
+                if obj is not None:
+                    yield key, obj
+
+    @__synchronized
+    def count(self, cls=None):
+        """
+        Count stored objects, or only those of one class.
+
+        Args:
+            cls (type or str, optional): The class, or class name, of the
+                objects to count.
+
+        Returns:
+            int: The number of matching objects.
+        """
+        self.__load(cls)
+        if cls is None:
+            return len(self.__objects) + len(self.__raw)
+        return len(self.__indexes().get(self.__class_name(cls), ()))
+
+    @__synchronized
+    def near(self, cls, latitude, longitude, km):
+        """
+        Retrieve the objects of a class within a distance of a point.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            latitude (float): Latitude of the center, in degrees.
+            longitude (float): Longitude of the center, in degrees.
+            km (float): The radius, in kilometers.
+
+        Returns:
+            dict: The matching objects by key, closest first.
+        """
+        grid = self.__grid(cls)
+        if grid is None:
+            return {}
+        return {key: self.__lookup(key)
+                for key, _ in grid.near(latitude, longitude, km)}
+
+    @__synchronized
+    def within(self, cls, min_lat, min_lon, max_lat, max_lon):
+        """
+        Retrieve the objects of a class inside a bounding box.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            min_lat (float): Southern edge, in degrees.
+            min_lon (float): Western edge, in degrees.
+            max_lat (float): Northern edge, in degrees.
+            max_lon (float): Eastern edge, in degrees. A box whose
+                `min_lon` is greater crosses the antimeridian.
+
+        Returns:
+            dict: The matching objects, by key.
+        """
+        grid = self.__grid(cls)
+        if grid is None:
+            return {}
+        return {key: self.__lookup(key)
+                for key in grid.within(min_lat, min_lon, max_lat, max_lon)}
+
+    def get(self, cls, id):
+        """
+        Retrieve one object by class and id.
+
+        Args:
+            cls (type or str): The class, or class name, of the object.
+            id (str): The id of the object.
+
+        Returns:
+            The object, or None if it is not stored.
+        """
+        key = f"{self.__class_name(cls)}.{id}"
+        if self.__threadsafe:
+            obj = self.__objects.get(key)
+            if obj is not None:
+                return obj
+        with self.__lock:
+            self.__load(cls)
+            if key in self.__raw:
+                return self.__materialize(key)
+            return self.__objects.get(key)
+
+    @__synchronized
+    def find(self, cls, **criteria):
+        """
+        Retrieve the objects of a class whose attributes equal the given
+        values, e.g. `find(Review, place_id=place.id)`.
+
+        Indexed attributes are looked up in their index, starting with the
+        most selective one; the remaining criteria are checked on the
+        candidates only.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            **criteria: Attribute names mapped to the values to match.
+
+        Returns:
+            dict: The matching objects, by key.
+        """
+        name = self.__class_name(cls)
+        self.__load(name)
+        candidates = self.__narrowest(name, criteria.items())
+        missing = object()
+        found = {}
+        for key in candidates:
+            obj = self.__lookup(key)
+            if all(getattr(obj, attr, missing) == value
+                   for attr, value in criteria.items()):
+                found[key] = obj
+        return found
+
+    @__synchronized
+    def where(self, cls, *predicates):
+        """
+        Retrieve the objects of a class matching comparison predicates,
+        e.g. `where(Place, ("price_by_night", "<", 100))`.
+
+        The objects are read through the access path the query planner
+        estimates to be the cheapest (see `models.engine.query_planner`):
+        an attribute index for an equality predicate, the spatial index for
+        a range of coordinates, the column store for predicates on its
+        columns, or the class index. Objects that lack an attribute, or
+        whose value cannot be compared, do not match.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            *predicates: (attribute, operator, value) triples, where the
+                operator is one of ==, !=, <, <=, > or >=.
 
-    def all(self):
+        Returns:
+            dict: The matching objects, by key.
+
+        Raises:
+            ValueError: If an operator is unknown.
+        """
+        name = self.__class_name(cls)
+        return self.__run(name, self.__plan(name, predicates), predicates)
+
+    @__synchronized
+    def explain(self, cls, *predicates):
         """
-        Retrieve all stored objects.
+        Plan and run `where(cls, *predicates)`, to compare the estimates
+        of the chosen plan with what it actually did.
+
+        Args:
+            cls (type or str): The class, or class name, of the objects.
+            *predicates: (attribute, operator, value) triples.
 
         Returns:
-            dict: A dictionary containing all stored objects.
+            Plan: The chosen plan, with the plans it was preferred to and
+            the actual numbers of matching and read objects.
+
+        Raises:
+            ValueError: If an operator is unknown.
         """
-        return self.__objects
+        name = self.__class_name(cls)
+        plan = self.__plan(name, predicates)
+        plan.rows = len(self.__run(name, plan, predicates))
+        return plan
 
+    @__synchronized
     def new(self, obj):
         """
         Add a new object to the storage.
@@ -42,34 +510,1079 @@ class FileStorage:
             obj: The object to be added to the storage.
         """
         key = f"{type(obj).__name__}.{obj.id}"
+        self.__sync()
+        if self.__indexed is self.__objects:
+            self.__classes.setdefault(type(obj).__name__, {})[key] = None
+            self.__unindex_attrs(key, type(obj).__name__)
+            self.__index_attrs(key, obj)
+        if key in self.__raw:
+            del self.__raw[key]
+        if self.__objects.get(key) is not obj:
+            self.__view = None
+        self.__generation += 1
+        self.__add_to_shard(key)
         self.__objects[key] = obj
+        self.__encoded.pop(key, None)
+        self.__pending.add(key)
+        self.__deleted.discard(key)
+
+    @__synchronized
+    def touch(self, obj):
+        """
+        Mark a stored object as modified so the next `save()` persists it.
+
+        Args:
+            obj: The modified object. Objects that are not stored (yet) are
+                ignored.
+        """
+        key = f"{type(obj).__name__}.{getattr(obj, 'id', None)}"
+        if self.__objects.get(key) is obj:
+            self.__generation += 1
+            obj._changed()
+            self.__encoded.pop(key, None)
+            self.__pending.add(key)
+            if self.__indexed is self.__objects and (
+                    obj._indexed_attrs or obj._columnar_attrs or
+                    obj._spatial_attrs):
+                self.__unindex_attrs(key, type(obj).__name__)
+                self.__index_attrs(key, obj)
+
+    @__synchronized
+    def delete(self, obj=None):
+        """
+        Remove an object from the storage.
+
+        Args:
+            obj: The object to be removed. Nothing happens if it is None or
+                not stored.
+        """
+        if obj is None:
+            return
+        key = f"{type(obj).__name__}.{obj.id}"
+        if self.__objects.get(key) is not None:
+            if self.__indexed is self.__objects:
+                self.__classes.get(type(obj).__name__, {}).pop(key, None)
+                self.__unindex_attrs(key, type(obj).__name__)
+            del self.__objects[key]
+            self.__view = None
+            self.__generation += 1
+            buckets = self.__shard_keys.get(type(obj).__name__)
+            if buckets is not None:
+                buckets[bucket_of(key, self.__shards)].pop(key, None)
+            self.__encoded.pop(key, None)
+            self.__pending.discard(key)
+            self.__deleted.add(key)
 
     def save(self):
         """
-        Serialize the objects to a JSON file.
+        Serialize the objects to the storage file.
+
+        In journal mode only the records changed since the last save are
+        appended to the journal; the snapshot is written in full only when
+        it does not exist yet. Within a batch, the save is deferred until
+        the batch is committed. In write-behind mode the changes are
+        written later by the writer thread.
+
+        Raises:
+            Exception: The error of the last background write, if it
+                failed.
+        """
+        with self.__lock:
+            if self.__batches:
+                self.__save_requested = True
+                return
+            error, self.__write_error = self.__write_error, None
+            if error is not None:
+                raise error
+            self.__dirty.set()
+            if self.__write_delay is not None:
+                if self.__writer is None or not self.__writer.is_alive():
+                    self.__writer = threading.Thread(
+                        target=self.__write_behind, daemon=True)
+                    self.__writer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """
+        Write the changes saved since the last write, if any.
+
+        The records are encoded while the lock is held; the file is written
+        after releasing it, so the objects can be used meanwhile. In shared
+        mode the changes of other processes are applied first.
+        """
+        with self.__write_lock, self.__file_lock():
+            with self.__lock:
+                if not self.__dirty.is_set():
+                    return
+                self.__dirty.clear()
+                self.__merge_external()
+                append = (self.__journal and
+                          os.path.exists(self.__file_path))
+                if self.__shards:
+                    data = self.__dirty_shards()
+                elif append:
+                    data = self.__journal_bytes()
+                else:
+                    self.__wait_compaction()
+                    data = self.__encode_all()
+                pending, self.__pending = self.__pending, set()
+                deleted, self.__deleted = self.__deleted, set()
+            try:
+                if self.__shards:
+                    self.__write_shards(data)
+                elif append:
+                    self.__append_journal(data)
+                else:
+                    self.__write_snapshot(data)
+            except BaseException:
+                with self.__lock:
+                    self.__pending |= pending
+                    self.__deleted |= deleted
+                    self.__dirty.set()
+                raise
+            self.__mark_seen()
+        with self.__write_lock:
+            if (self.__compact_threshold is not None and
+                    self.__journal_entries >= self.__compact_threshold):
+                self.compact(background=True)
+
+    def sync(self):
+        """
+        Apply the changes other processes have written to the storage file
+        since it was last read or written. Only shared storages do so;
+        changes not saved yet are kept.
+        """
+        if not self.__shared:
+            return
+        with self.__write_lock, self.__file_lock():
+            with self.__lock:
+                self.__merge_external()
+
+    def begin(self):
+        """
+        Start a batch: saves are deferred until the matching `commit()`.
+        Batches nest; only the outermost one saves.
+
+        Changes saved before the outermost batch are written first, so that
+        rolling it back cannot discard them.
+        """
+        with self.__lock:
+            if self.__batches:
+                self.__batches += 1
+                return
+        self.flush()
+        with self.__lock:
+            self.__batches += 1
+
+    def commit(self):
+        """
+        End the innermost batch. Ending the outermost one saves, if any
+        save was requested during the batch.
+
+        Raises:
+            RuntimeError: If no batch was started.
+        """
+        with self.__lock:
+            if not self.__batches:
+                raise RuntimeError("no batch to commit")
+            self.__batches -= 1
+            save = not self.__batches and self.__save_requested
+            if save:
+                self.__save_requested = False
+        if save:
+            self.save()
+
+    def rollback(self):
+        """
+        End every batch without saving and reload the storage file,
+        discarding all the changes that were not saved.
         """
-        serialized_objects = {k: v.to_dict() for k, v in self.__objects.items()}
-        with open(self.__file_path, 'w') as f:
-            json.dump(serialized_objects, f)
+        with self.__write_lock, self.__file_lock(), self.__lock:
+            self.__batches = 0
+            self.__save_requested = False
+            self.__objects.clear()
+            self.__drop_raw()
+            self.__encoded.clear()
+            self.__indexed = None
+            self.__pending.clear()
+            self.__deleted.clear()
+            self.__dirty.clear()
+            self.__reload()
+            self.__mark_seen()
+
+    @contextmanager
+    def batch(self):
+        """
+        Run a block as a batch, e.g. to create many objects with a single
+        save:
+
+            with storage.batch():
+                for _ in range(1000):
+                    User().save()
+
+        The batch is committed when the block exits, and rolled back if it
+        raises.
+
+        Yields:
+            FileStorage: The storage.
+        """
+        self.begin()
+        try:
+            yield self
+        except BaseException:
+            self.rollback()
+            raise
+        self.commit()
+
+    def compact(self, background=False):
+        """
+        Fold the journal into a fresh snapshot of the stored objects.
+
+        The objects are encoded right away; writing the snapshot happens in
+        a background thread when `background` is True, while saves keep
+        appending to a new journal. Nothing is done within a batch, whose
+        changes must not be written before it is committed.
+
+        Args:
+            background (bool): Return as soon as the snapshot writer has
+                been started instead of waiting for it.
+
+        Returns:
+            threading.Thread: The thread writing the snapshot, or None
+            within a batch or in shared mode, where the snapshot is written
+            before returning. Sharded storages have no journal to fold:
+            their changes are only saved.
+        """
+        with self.__write_lock:
+            if self.__batches:
+                return None
+            self.flush()
+            if self.__shards:
+                return None
+            self.__wait_compaction()
+            with self.__file_lock():
+                with self.__lock:
+                    self.__merge_external()
+                    records = self.__encode_all()
+                if os.path.exists(self.__journal_path()):
+                    if os.path.exists(self.__rotated_path()):
+                        # A previous compaction did not finish: keep its
+                        # entries
+                        with open(self.__journal_path(), 'rb') as src, \
+                                open(self.__rotated_path(), 'ab') as dst:
+                            dst.write(src.read())
+                        os.remove(self.__journal_path())
+                    else:
+                        os.replace(self.__journal_path(),
+                                   self.__rotated_path())
+                self.__journal_entries = 0
+
+                self.__compactor = threading.Thread(
+                    target=self.__write_compacted, args=(records,),
+                    daemon=True)
+                self.__compactor.start()
+                if self.__shared:
+                    self.__wait_compaction()
+                    self.__mark_seen()
+        if not background:
+            self.__wait_compaction()
+        return self.__compactor
 
     def reload(self):
         """
-        Deserialize the JSON file and load objects into storage.
+        Deserialize the storage file and load objects into storage.
+
+        Entries of the journal, if any, are replayed on top of the snapshot.
+        The entries of a save torn at the end of the journal (e.g. after a
+        crash in the middle of a write) are ignored. Changes saved but not
+        written yet are written first.
         """
-        current_classes = {'BaseModel': BaseModel, 'User': User,
-                           'Amenity': Amenity, 'City': City, 'State': State,
-                           'Place': Place, 'Review': Review}
+        with self.__write_lock:
+            self.flush()
+            with self.__file_lock(), self.__lock:
+                self.__reload()
+                self.__mark_seen()
+
+    def __reload(self):
+        """
+        Load the objects of the storage file.
+        """
+        self.__view = None
+        self.__shard_keys = {}
+        self.__generation += 1
+        self.__wait_compaction()
+        if self.__mapped:
+            self.__map()
+            return
+        if self.__shards:
+            shards = list_shards(self.__shard_directory,
+                                 self.__serializer.extension)
+            if shards:
+                self.__objects.clear()
+                self.__encoded.clear()
+                self.__raw = {}
+                self.__loaded = self.__objects
+                self.__indexed = None
+                self.__pending.clear()
+                self.__deleted.clear()
+                self.__unloaded = shards
+                return
+        if self.__lazy:
+            build = None
+        else:
+            def build(key, record):
+                return self.__model(key)(**record)
+        loaded = read_store(self.__file_path, self.__serializer, build)
+        if loaded is None:
+            return
+        deserialized, self.__journal_entries = loaded
 
+        self.__objects.clear()
+        self.__encoded.clear()
+        if self.__lazy:
+            self.__raw = deserialized
+        else:
+            self.__raw = {}
+            self.__objects.update(deserialized)
+        self.__loaded = self.__objects
+        self.__rebuild_indexes()
+        self.__pending.clear()
+        self.__deleted.clear()
+        if self.__shards:
+            # Split the unsharded store on the next save
+            self.__pending.update(self.__objects)
+            self.__pending.update(self.__raw)
+
+    def __map(self):
+        """
+        Map the snapshot in place of the stored objects, without reading
+        it; the indexes are built when a query first needs them.
+        """
         if not os.path.exists(self.__file_path):
             return
+        recover(self.__file_path, quick=True)
+        try:
+            records = RecordFile(self.__file_path, self.__serializer)
+        except ValueError:
+            if not recover(self.__file_path, damaged=True):
+                raise
+            records = RecordFile(self.__file_path, self.__serializer)
+        self.__objects.clear()
+        self.__encoded.clear()
+        self.__drop_raw()
+        self.__raw = records
+        self.__journal_entries = records.journal_entries
+        self.__loaded = self.__objects
+        self.__indexed = None
+        self.__pending.clear()
+        self.__deleted.clear()
+
+    def __drop_raw(self):
+        """
+        Drop the raw records, unmapping the snapshot in mapped mode.
+        """
+        if isinstance(self.__raw, RecordFile):
+            self.__raw.close()
+        self.__raw = {}
 
-        with open(self.__file_path, 'r') as f:
+    @staticmethod
+    def __class_name(cls):
+        """
+        Args:
+            cls (type or str): A class or class name.
+
+        Returns:
+            str: The name of the class.
+        """
+        return cls if isinstance(cls, str) else cls.__name__
+
+    def __indexes(self):
+        """
+        Returns the index of keys by class name, building it and the
+        attribute indexes when they were not built yet or the stored
+        objects were replaced.
+
+        Returns:
+            dict: Class name mapped to a dictionary whose keys are the
+            storage keys of that class, in insertion order.
+        """
+        self.__sync()
+        if self.__indexed is not self.__objects:
+            self.__rebuild_indexes()
+        return self.__classes
+
+    def __sync(self):
+        """
+        Drop the raw records, and the shards not read yet, when the stored
+        objects were replaced, since they belong to the replaced objects.
+        """
+        if self.__loaded is not self.__objects:
+            self.__drop_raw()
+            self.__unloaded = {}
+            self.__shard_keys = {}
+            self.__loaded = self.__objects
+            self.__generation += 1
+
+    def __load(self, cls=None):
+        """
+        Read the shards of a class, or of every class, that were not read
+        yet. Records changed or deleted since are left out.
+
+        Args:
+            cls (type or str, optional): The class, or class name.
+        """
+        self.__sync()
+        if not self.__unloaded:
+            return
+        if cls is None:
+            names = list(self.__unloaded)
+        else:
+            names = [self.__class_name(cls)]
+        if self.__lazy:
+            build = None
+        else:
+            def build(key, record):
+                return self.__model(key)(**record)
+        indexed = self.__indexed is self.__objects
+        target = self.__raw if self.__lazy else self.__objects
+        for name in names:
+            for path in self.__unloaded.pop(name, ()):
+                loaded = read_store(path, self.__serializer, build)
+                if loaded is None:
+                    continue
+                for key, value in loaded[0].items():
+                    if key in self.__pending or key in self.__deleted:
+                        continue
+                    target[key] = value
+                    self.__add_to_shard(key)
+                    if indexed:
+                        self.__classes.setdefault(name, {})[key] = None
+                        self.__index_attrs(key, value)
+        self.__view = None
+
+    def __rebuild_indexes(self):
+        """
+        Build the class and attribute indexes of the stored objects and
+        of the raw records that have not been materialized yet.
+        """
+        self.__classes = {}
+        self.__attr_index = {}
+        self.__attr_values = {}
+        self.__stats.clear()
+        self.__grids = {}
+        self.__planned = set()
+        self.__column_stores = {}
+        if self.__columnar:
+            self.__column_stores = {
+                name: ColumnStore(cls._columnar_attrs)
+                for name, cls in self.__models.items()
+                if cls._columnar_attrs}
+        for source in (self.__objects, self.__raw):
+            for key, obj in source.items():
+                self.__classes.setdefault(key.split('.')[0], {})[key] = None
+                self.__index_attrs(key, obj)
+        self.__indexed = self.__objects
+
+    def __plan(self, name, predicates):
+        """
+        Choose the access path of a query from the sizes of the indexes and
+        the statistics of the attributes.
+
+        Args:
+            name (str): A class name.
+            predicates (tuple): (attribute, operator, value) triples.
+
+        Returns:
+            Plan: The cheapest plan.
+
+        Raises:
+            ValueError: If an operator is unknown.
+        """
+        for _, op, _ in predicates:
+            if op not in OPERATORS:
+                raise ValueError(f"unknown operator: {op}")
+        self.__load(name)
+        size = len(self.__indexes().get(name, ()))
+        self.__prepare(name)
+        # Buckets by predicate position, as values may be unhashable
+        buckets = {}
+        for i, (attr, op, value) in enumerate(predicates):
+            index = self.__attr_index.get((name, attr))
+            if op == "==" and index is not None:
+                try:
+                    buckets[i] = index.get(value, {})
+                except TypeError:
+                    pass
+        # The indexes give the exact size of their buckets
+        estimated = size * self.__stats.selectivity(
+            name, [p for i, p in enumerate(predicates) if i not in buckets])
+        for bucket in buckets.values():
+            estimated *= len(bucket) / size if size else 0.0
+        plans = [Plan("scan", "", size, estimated)]
+        for i, bucket in buckets.items():
+            attr, op, value = predicates[i]
+            plans.append(Plan("index", f"{attr} == {value!r}", len(bucket),
+                              estimated, bucket))
+        grid = self.__grids.get(name)
+        if grid is not None:
+            lat, lon = self.__models[name]._spatial_attrs
+            box = bounding_box(predicates, lat, lon)
+            if box is not None:
+                plans.append(Plan(
+                    "spatial", f"{lat} {box[0]}..{box[2]}, "
+                               f"{lon} {box[1]}..{box[3]}",
+                    grid.estimate(*box), estimated, box))
+        store = self.__column_stores.get(name)
+        if store is not None:
+            pushed = [p for p in predicates if store.can_select(p)]
+            if pushed:
+                selected = size * self.__stats.selectivity(name, pushed)
+                plans.append(Plan(
+                    "columns", " and ".join(
+                        f"{attr} {op} {value!r}"
+                        for attr, op, value in pushed),
+                    size * COLUMN_COST + selected, estimated, pushed))
+        return choose(plans)
+
+    def __run(self, name, plan, predicates):
+        """
+        Run the plan of a query, recording how many objects it read.
+
+        Args:
+            name (str): A class name.
+            plan (Plan): The plan chosen for the query.
+            predicates (tuple): (attribute, operator, value) triples.
+
+        Returns:
+            dict: The matching objects, by key.
+        """
+        recheck = ()
+        remaining = predicates
+        if plan.path == "index":
+            candidates = plan.source
+        elif plan.path == "spatial":
+            grid = self.__grids[name]
+            candidates = grid.within(*plan.source)
+            # The box only covers valid numeric coordinates, which points
+            # out of range or of other types may match all the same
+            recheck = grid.irregular()
+        elif plan.path == "columns":
+            candidates, recheck = \
+                self.__column_stores[name].select(plan.source)
+            remaining = [p for p in predicates if p not in plan.source]
+        else:
+            candidates = self.__indexes().get(name, {})
+        found = {}
+        examined = 0
+        for keys, tests in ((candidates, remaining), (recheck, predicates)):
+            for key in keys:
+                obj = self.__lookup(key)
+                examined += 1
+                if matches(obj, tests):
+                    found[key] = obj
+        plan.examined = examined
+        return found
+
+    def __narrowest(self, name, criteria):
+        """
+        Args:
+            name (str): A class name.
+            criteria: (attribute, value) pairs the objects must equal.
+
+        Returns:
+            dict: The keys in the smallest bucket of the attribute indexes
+            matching one of the criteria, or every key of the class when
+            none of the attributes is indexed.
+        """
+        candidates = self.__indexes().get(name, {})
+        for attr, value in criteria:
+            index = self.__attr_index.get((name, attr))
+            if index is None:
+                continue
             try:
-                deserialized = json.load(f)
-            except json.JSONDecodeError:
-                return
+                bucket = index.get(value, {})
+            except TypeError:
+                continue
+            if len(bucket) < len(candidates):
+                candidates = bucket
+        return candidates
+
+    def __model(self, key):
+        """
+        Args:
+            key (str): A storage key.
+
+        Returns:
+            type: The class to create the object stored under `key` from.
+        """
+        cls = self.__models[key.split('.')[0]]
+        return cls.compact() if self.__compact_models else cls
 
-            self.__objects = {
-                k: current_classes[k.split('.')[0]](**v)
-                for k, v in deserialized.items()}
+    def __grid(self, cls):
+        """
+        Args:
+            cls (type or str): A class or class name.
 
+        Returns:
+            GridIndex: The spatial index of the class, or None.
+        """
+        self.__load(cls)
+        self.__indexes()
+        self.__prepare(self.__class_name(cls))
+        return self.__grids.get(self.__class_name(cls))
+
+    def __prepare(self, name):
+        """
+        Build the spatial index and the statistics of a class, which only
+        queries need, the first time one runs on the class. They are kept
+        up to date as objects are stored from then on, until the indexes
+        are rebuilt.
+
+        Args:
+            name (str): A class name.
+        """
+        cls = self.__models.get(name)
+        if name in self.__planned or cls is None:
+            return
+        self.__planned.add(name)
+        if cls._spatial_attrs:
+            self.__grids[name] = GridIndex()
+        for key in self.__classes.get(name, ()):
+            obj = self.__objects.get(key)
+            self.__index_planned(
+                key, *self.__values(key, self.__raw[key] if obj is None
+                                    else obj))
+
+    def __lookup(self, key):
+        """
+        Args:
+            key (str): The key of a stored object.
+
+        Returns:
+            The object stored under `key`, materialized if needed.
+        """
+        obj = self.__objects.get(key)
+        if obj is None:
+            obj = self.__materialize(key)
+        return obj
+
+    def __materialize(self, key):
+        """
+        Create the object of a raw record and store it in place of the
+        record. Its cached encoding, if any, stays valid.
+
+        Args:
+            key (str): The key of a raw record.
+
+        Returns:
+            The new object.
+        """
+        obj = self.__model(key)(**self.__raw.pop(key))
+        self.__objects[key] = obj
+        return obj
+
+    def __values(self, key, obj):
+        """
+        Args:
+            key (str): The storage key of `obj`.
+            obj: A stored object, or its raw record.
+
+        Returns:
+            tuple: The class name and class of `obj`, and a function
+            returning the value of one of its attributes, or None.
+        """
+        if isinstance(obj, dict):
+            name = key.split('.')[0]
+            cls = self.__models[name]
+
+            def value_of(attr):
+                return obj.get(attr, getattr(cls, attr, None))
+        else:
+            name = type(obj).__name__
+            cls = type(obj)
+
+            def value_of(attr):
+                return getattr(obj, attr, None)
+        return name, cls, value_of
+
+    def __index_attrs(self, key, obj):
+        """
+        Add `obj` to the indexes of the attributes its class declares in
+        `_indexed_attrs`, and to its column store if any, and to the
+        spatial index and statistics of its class once built. Unhashable
+        values are left out of the indexes.
+
+        Args:
+            key (str): The storage key of `obj`.
+            obj: The object to index, or its raw record.
+        """
+        name, cls, value_of = self.__values(key, obj)
+        if name in self.__planned:
+            self.__index_planned(key, name, cls, value_of)
+        store = self.__column_stores.get(name)
+        if store is not None:
+            store.set(key, {attr: value_of(attr) for attr in store.attrs})
+        values = {}
+        for attr in cls._indexed_attrs:
+            value = value_of(attr)
+            try:
+                bucket = self.__attr_index.setdefault(
+                    (name, attr), {}).setdefault(value, {})
+            except TypeError:
+                continue
+            bucket[key] = None
+            values[attr] = value
+        if values:
+            self.__attr_values[key] = values
+
+    def __index_planned(self, key, name, cls, value_of):
+        """
+        Add an object to the spatial index of its class, if any, and widen
+        the statistics of its numeric attributes.
+
+        Args:
+            key (str): The storage key of the object.
+            name (str): Its class name.
+            cls (type): Its class.
+            value_of (function): Returns the value of one of its
+                attributes.
+        """
+        for attr in cls._columnar_attrs + cls._spatial_attrs:
+            value = value_of(attr)
+            if is_number(value):
+                self.__stats.observe(name, attr, value)
+        grid = self.__grids.get(name)
+        if grid is not None:
+            grid.set(key, *[value_of(attr) for attr in cls._spatial_attrs])
+
+    def __unindex_attrs(self, key, name):
+        """
+        Remove a key from the attribute indexes of its class.
+
+        Args:
+            key (str): The storage key to remove.
+            name (str): The class name of the object stored under `key`.
+        """
+        store = self.__column_stores.get(name)
+        if store is not None:
+            store.remove(key)
+        grid = self.__grids.get(name)
+        if grid is not None:
+            grid.remove(key)
+        for attr, value in self.__attr_values.pop(key, {}).items():
+            index = self.__attr_index[(name, attr)]
+            index[value].pop(key, None)
+            if not index[value]:
+                del index[value]
+
+    def __journal_path(self):
+        """
+        Returns:
+            str: The path of the journal that goes with the snapshot file.
+        """
+        return f"{self.__file_path}.log"
+
+    def __rotated_path(self):
+        """
+        Returns:
+            str: The path the journal is moved to while it is compacted.
+        """
+        return f"{self.__file_path}.log.old"
+
+    def __wait_compaction(self):
+        """
+        Block until the running compaction, if any, has finished.
+        """
+        if self.__compactor is not None:
+            self.__compactor.join()
+            self.__compactor = None
+
+    def __encode(self, key, obj):
+        """
+        Args:
+            key (str): The storage key of `obj`.
+            obj: A stored object.
+
+        Returns:
+            bytes: The encoding of `obj`, reused until `obj` changes.
+        """
+        encoded = self.__encoded.get(key)
+        if encoded is None:
+            encoded = self.__serializer.encode(obj.to_dict())
+            self.__encoded[key] = encoded
+        return encoded
+
+    def __encode_all(self):
+        """
+        Returns:
+            list: (key, encoding) pairs for every stored object and every
+            raw record.
+        """
+        records = [(k, self.__encode(k, v)) for k, v in self.__objects.items()]
+        records.extend((k, self.__encode_raw(k)) for k in self.__raw)
+        return records
+
+    def __encode_raw(self, key):
+        """
+        Args:
+            key (str): The key of a raw record.
+
+        Returns:
+            bytes: The encoding of the record, reused until it changes.
+        """
+        encoded = self.__encoded.get(key)
+        if encoded is None:
+            encoded = self.__serializer.encode(self.__raw[key])
+            self.__encoded[key] = encoded
+        return encoded
+
+    def __dirty_shards(self):
+        """
+        Returns:
+            dict: The path of every shard holding a record changed or
+            deleted since the last save, mapped to the (key, encoding)
+            pairs of the records it holds now.
+        """
+        dirty = {}
+        for key in self.__pending | self.__deleted:
+            dirty.setdefault(key.split('.')[0], set()).add(
+                bucket_of(key, self.__shards))
+        shards = {}
+        for name, buckets in dirty.items():
+            self.__load(name)
+            if name not in self.__shard_keys:
+                self.__shard_keys[name] = members = {
+                    b: {} for b in range(self.__shards)}
+                for key in self.__indexes().get(name, ()):
+                    members[bucket_of(key, self.__shards)][key] = None
+            for bucket in buckets:
+                records = []
+                for key in self.__shard_keys[name][bucket]:
+                    obj = self.__objects.get(key)
+                    records.append((key, self.__encode_raw(key) if obj is None
+                                    else self.__encode(key, obj)))
+                shards[shard_path(self.__shard_directory, name, bucket,
+                                  self.__serializer.extension)] = records
+        return shards
+
+    def __add_to_shard(self, key):
+        """
+        Add a key to the keys of its shard, if they are tracked.
+
+        Args:
+            key (str): A storage key.
+        """
+        buckets = self.__shard_keys.get(key.split('.')[0])
+        if buckets is not None:
+            buckets[bucket_of(key, self.__shards)][key] = None
+
+    def __write_shards(self, shards):
+        """
+        Write shards, removing those left empty.
+
+        Args:
+            shards (dict): The path of each shard mapped to its
+                (key, encoding) pairs.
+        """
+        for path, records in shards.items():
+            if records:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                write_atomic(path, lambda f, records=records:
+                             self.__serializer.write_snapshot(f, records))
+            elif os.path.exists(path):
+                os.remove(path)
+                if os.path.exists(checksum_path(path)):
+                    os.remove(checksum_path(path))
+
+    def __write_compacted(self, records):
+        """
+        Write a compacted snapshot next to the current one, rename it over
+        the current one and drop the rotated journal it supersedes.
+
+        Args:
+            records (list): (key, encoding) pairs of the new snapshot.
+        """
+        write_atomic(self.__file_path,
+                     lambda f: self.__serializer.write_snapshot(f, records))
+        if self.__mapped:
+            write_index(self.__file_path, self.__serializer)
+        if os.path.exists(self.__rotated_path()):
+            os.remove(self.__rotated_path())
+
+    @contextmanager
+    def __file_lock(self):
+        """
+        Hold an exclusive lock on the lock file of the storage, in shared
+        mode and where the platform supports it.
+        """
+        if not self.__shared or fcntl is None:
+            yield
+            return
+        fd = os.open(f"{self.__file_path}.lock", os.O_RDWR | os.O_CREAT,
+                     0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def __file_state(self):
+        """
+        Returns:
+            tuple: The inode, modification time and size of the snapshot
+            (None if there is none), and the sizes of the rotated journal
+            and of the journal (None if there are none).
+        """
+        def size(path):
+            try:
+                return os.stat(path).st_size
+            except FileNotFoundError:
+                return None
+        try:
+            stat = os.stat(self.__file_path)
+            snapshot = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            snapshot = None
+        return (snapshot, size(self.__rotated_path()),
+                size(self.__journal_path()))
+
+    def __mark_seen(self):
+        """
+        Record the state of the storage file as the one the stored objects
+        match, in shared mode.
+        """
+        if self.__shared:
+            self.__seen = self.__file_state()
+
+    def __merge_external(self):
+        """
+        Apply the changes other processes have written since the storage
+        file was last read or written, keeping the changes not written yet.
+        Nothing is done unless the storage is shared.
+
+        When only the journal has grown, just its new entries are replayed;
+        otherwise the whole file is read again.
+        """
+        if not self.__shared:
+            return
+        state = self.__file_state()
+        seen = self.__seen
+        if state == seen:
+            return
+        if (seen is not None and state[0] is not None and
+                state[:2] == seen[:2] and state[2] is not None and
+                state[2] >= (seen[2] or 0)):
+            self.__sync()
+            with open(self.__journal_path(), 'rb') as f:
+                f.seek(seen[2] or 0)
+                for op, key, record in self.__serializer.read_journal(f):
+                    self.__apply(op, key, record)
+                    self.__journal_entries += 1
+        else:
+            changed = {k: self.__objects[k] for k in self.__pending
+                       if k in self.__objects}
+            deleted = set(self.__deleted)
+            self.__reload()
+            self.__sync()
+            for key in deleted:
+                self.__objects.pop(key, None)
+                self.__raw.pop(key, None)
+            for key, obj in changed.items():
+                self.__raw.pop(key, None)
+                self.__objects[key] = obj
+            self.__pending = set(changed)
+            self.__deleted = deleted
+            self.__indexed = None
+            self.__view = None
+        self.__seen = state
+
+    def __apply(self, op, key, record):
+        """
+        Apply a journal entry written by another process, unless the
+        record it changes has unsaved changes here.
+
+        Args:
+            op (str): "set" or "del".
+            key (str): The key of the record.
+            record (dict): The record set, or None.
+        """
+        if key in self.__pending or key in self.__deleted:
+            return
+        self.__view = None
+        self.__generation += 1
+        name = key.split('.')[0]
+        indexed = self.__indexed is self.__objects
+        if indexed:
+            self.__classes.get(name, {}).pop(key, None)
+            self.__unindex_attrs(key, name)
+        self.__objects.pop(key, None)
+        self.__raw.pop(key, None)
+        self.__encoded.pop(key, None)
+        if op != "set":
+            return
+        if self.__lazy or self.__mapped:
+            self.__raw[key] = obj = record
+        else:
+            self.__objects[key] = obj = self.__model(key)(**record)
+        if indexed:
+            self.__classes.setdefault(name, {})[key] = None
+            self.__index_attrs(key, obj)
+
+    def __journal_bytes(self):
+        """
+        Returns:
+            list: One journal entry per record changed since the last save.
+        """
+        serializer = self.__serializer
+        entries = [serializer.journal_entry("del", k) for k in self.__deleted]
+        entries.extend(
+            serializer.journal_entry(
+                "set", k, self.__encode(k, self.__objects[k]))
+            for k in self.__pending if k in self.__objects)
+        return entries
+
+    def __append_journal(self, entries):
+        """
+        Append entries to the journal, in one frame, so that a crash while
+        writing them loses all of them rather than some.
+
+        Args:
+            entries (list): The encoded journal entries.
+        """
+        if not entries:
+            return
+        with open(self.__journal_path(), 'ab') as f:
+            f.write(self.__serializer.journal_frame(entries))
+        self.__journal_entries += len(entries)
+
+    def __write_snapshot(self, records):
+        """
+        Write the whole snapshot and drop the journals it supersedes.
+
+        Args:
+            records (list): (key, encoding) pairs of the snapshot.
+        """
+        write_atomic(self.__file_path,
+                     lambda f: self.__serializer.write_snapshot(f, records))
+        if self.__mapped:
+            write_index(self.__file_path, self.__serializer)
+        for path in (self.__journal_path(), self.__rotated_path()):
+            if os.path.exists(path):
+                os.remove(path)
+        self.__journal_entries = 0
+
+    def __write_behind(self):
+        """
+        Run the writer thread: wait for a save, let the following saves
+        accumulate for `write_delay` seconds, then write them all at once.
+        The error of a failed write is raised by the next `save()`, and the
+        write is retried after the next delay.
+        """
+        while True:
+            self.__dirty.wait()
+            time.sleep(self.__write_delay)
+            try:
+                self.flush()
+            except Exception as e:
+                self.__write_error = e
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+"""
+Module: query_planner.py
+
+Defines how `FileStorage.where()` chooses the access path of a query, i.e.
+which objects of the class it reads and checks against the predicates:
+
+    index      The bucket of an attribute index matching an equality
+               predicate, e.g. the reviews of one place.
+    spatial    The cells of the spatial index overlapping the bounding box
+               that range predicates on the coordinates describe.
+    columns    The keys a column store selects with the predicates on its
+               columns.
+    scan       Every object of the class, from the class index.
+
+The cost of a path is the number of objects it reads, plus a fraction of
+the size of the class for a column store, which compares whole columns at
+once. The cheapest path is chosen.
+
+Costs and row counts are estimated from statistics the storage keeps up to
+date as objects are stored: the size of each class and of each index
+bucket, which the indexes give exactly, and the smallest and largest value
+of each numeric attribute, which range predicates are assumed to split
+uniformly. Predicates nothing is known about get the usual default
+selectivities.
+"""
+
+from models.engine import column_store
+from models.engine.column_store import is_number
+
+# Fraction of the rows matching a predicate nothing is known about
+DEFAULT_SELECTIVITY = {"==": 0.1, "!=": 0.9}
+RANGE_SELECTIVITY = 1 / 3
+
+# Cost of comparing one row of a column, relative to reading an object
+COLUMN_COST = 0.02 if column_store.numpy is not None else 0.5
+
+
+class Statistics:
+    """
+    The smallest and largest value of the numeric attributes of each
+    class. They only widen as values are observed: values that are changed
+    or deleted are kept until the statistics are rebuilt, which only makes
+    range estimates more conservative.
+    """
+
+    def __init__(self):
+        """Initialize empty statistics."""
+        self.__bounds = {}
+
+    def clear(self):
+        """Forget every value observed."""
+        self.__bounds.clear()
+
+    def observe(self, name, attr, value):
+        """
+        Widen the bounds of an attribute to a value.
+
+        Args:
+            name (str): A class name.
+            attr (str): The attribute.
+            value (int or float): Its value on an object of the class.
+        """
+        bounds = self.__bounds.get((name, attr))
+        if bounds is None:
+            self.__bounds[(name, attr)] = [value, value]
+        elif value < bounds[0]:
+            bounds[0] = value
+        elif value > bounds[1]:
+            bounds[1] = value
+
+    def bounds(self, name, attr):
+        """
+        Args:
+            name (str): A class name.
+            attr (str): The attribute.
+
+        Returns:
+            tuple: The smallest and largest values observed, or None.
+        """
+        bounds = self.__bounds.get((name, attr))
+        return None if bounds is None else tuple(bounds)
+
+    def selectivity(self, name, predicates):
+        """
+        Estimate the fraction of the objects of a class matching
+        predicates, from the bounds of their attributes. The range
+        predicates on one attribute are combined into an interval, and the
+        attributes are assumed to be independent.
+
+        Args:
+            name (str): A class name.
+            predicates (list): (attribute, operator, value) triples.
+
+        Returns:
+            float: The estimated fraction, between 0 and 1.
+        """
+        fraction = 1.0
+        intervals = {}
+        for attr, op, value in predicates:
+            bounds = self.__bounds.get((name, attr))
+            if bounds is None or not is_number(value):
+                fraction *= DEFAULT_SELECTIVITY.get(op, RANGE_SELECTIVITY)
+            elif op in DEFAULT_SELECTIVITY:
+                inside = bounds[0] <= value <= bounds[1]
+                fraction *= DEFAULT_SELECTIVITY[op] if inside else \
+                    float(op == "!=")
+            else:
+                interval = intervals.setdefault(attr, list(bounds))
+                if op in ("<", "<="):
+                    interval[1] = min(interval[1], value)
+                else:
+                    interval[0] = max(interval[0], value)
+        for attr, (low, high) in intervals.items():
+            least, most = self.__bounds[(name, attr)]
+            if low > high:
+                return 0.0
+            if most > least:
+                fraction *= (high - low) / (most - least)
+        return fraction
+
+
+class Plan:
+    """
+    An access path for a query, with its estimates and, once it has run,
+    what it actually did.
+
+    Attributes:
+        path (str): "index", "spatial", "columns" or "scan".
+        detail (str): What the path reads, e.g. "city_id == 'c7'".
+        cost (float): The estimated number of objects read, or None if
+            unknown.
+        estimated (float): The estimated number of matching objects, or
+            None if unknown.
+        source: What the storage needs to run the path: the index bucket,
+            the bounding box or the predicates given to the column store.
+        rows (int): The number of matching objects, once run.
+        examined (int): The number of objects read, once run.
+        rejected (list): The other plans considered, cheapest first.
+    """
+
+    def __init__(self, path, detail, cost, estimated, source=None):
+        """
+        Args:
+            path (str): The access path.
+            detail (str): What the path reads.
+            cost (float): The estimated number of objects read.
+            estimated (float): The estimated number of matching objects.
+            source: What the storage needs to run the path.
+        """
+        self.path = path
+        self.detail = detail
+        self.cost = cost
+        self.estimated = estimated
+        self.source = source
+        self.rows = None
+        self.examined = None
+        self.rejected = []
+
+    def __str__(self):
+        """
+        Returns:
+            str: The plan, its estimates and, once it has run, the actual
+            numbers, one per line. Unknown estimates are left out.
+        """
+        lines = [f"plan: {self.label()}"]
+        if self.cost is not None:
+            lines.append(f"estimated cost: {self.cost:.0f}")
+        if self.estimated is not None:
+            lines.append(f"estimated rows: {self.estimated:.0f}")
+        if self.rows is not None:
+            lines.append(f"actual rows: {self.rows} "
+                         f"({self.examined} objects read)")
+        if self.rejected:
+            lines.append("rejected: " + ", ".join(
+                f"{plan.label()} (cost {plan.cost:.0f})"
+                for plan in self.rejected))
+        return "\n".join(lines)
+
+    def label(self):
+        """
+        Returns:
+            str: The path and what it reads, e.g. "index city_id == 'c7'".
+        """
+        return f"{self.path} {self.detail}" if self.detail else self.path
+
+
+def choose(plans):
+    """
+    Pick the cheapest of the plans considered for a query; the others are
+    kept as its rejected plans.
+
+    Args:
+        plans (list): The plans, the full scan first so that it wins ties.
+
+    Returns:
+        Plan: The cheapest plan.
+    """
+    ranked = sorted(plans, key=lambda plan: plan.cost)
+    best = ranked[0]
+    best.rejected = ranked[1:]
+    return best
+
+
+def bounding_box(predicates, lat_attr, lon_attr):
+    """
+    Derive the bounding box that range and equality predicates on the
+    coordinates describe, within valid latitudes and longitudes. Stored
+    points out of that range must be checked apart.
+
+    Args:
+        predicates (list): (attribute, operator, value) triples.
+        lat_attr (str): The latitude attribute.
+        lon_attr (str): The longitude attribute.
+
+    Returns:
+        tuple: (min_lat, min_lon, max_lat, max_lon), or None if no
+        predicate bounds the coordinates, or they bound an empty box.
+    """
+    box = {lat_attr: [-90.0, 90.0], lon_attr: [-180.0, 180.0]}
+    bounded = False
+    for attr, op, value in predicates:
+        if attr not in box or not is_number(value) or \
+                op not in ("==", "<", "<=", ">", ">="):
+            continue
+        bounded = True
+        if op in ("==", "<", "<="):
+            box[attr][1] = min(box[attr][1], value)
+        if op in ("==", ">", ">="):
+            box[attr][0] = max(box[attr][0], value)
+    (min_lat, max_lat), (min_lon, max_lon) = box[lat_attr], box[lon_attr]
+    if not bounded or min_lat > max_lat or min_lon > max_lon:
+        return None
+    return min_lat, min_lon, max_lat, max_lon
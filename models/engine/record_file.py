@@ -0,0 +1,254 @@
+#!/usr/bin/python3
+"""
+Module: record_file.py
+
+Defines a `RecordFile` class giving random access to the records of a
+binary snapshot (see `models.engine.serializers`) without reading it.
+
+The snapshot is memory-mapped, and a sidecar index (`<snapshot>.idx`) holds
+the offsets of its records sorted by key, so a record is found by a binary
+search that only touches the pages of the index and of the records it
+compares. The index is rebuilt when it does not match the snapshot, e.g.
+after the snapshot was written without it.
+"""
+
+import os
+import mmap
+import struct
+from collections.abc import MutableMapping
+
+INDEX_MAGIC = b"HBNI\x01"
+_index_header = struct.Struct(">QQQ")
+_offset = struct.Struct(">Q")
+
+
+def index_path(path):
+    """
+    Args:
+        path (str): The path of a binary snapshot.
+
+    Returns:
+        str: The path of its index.
+    """
+    return f"{path}.idx"
+
+
+def write_index(path, serializer):
+    """Writes the index of a binary snapshot.
+
+    The index starts with `INDEX_MAGIC`, then the size and modification
+    time (in nanoseconds) of the snapshot it was built from and its number
+    of records, followed by the offsets of the records sorted by key, all
+    as big-endian 8-byte integers.
+
+    Args:
+        path (str): The path of the snapshot.
+        serializer: The binary serializer.
+
+    Returns:
+        int: The number of records indexed.
+    """
+    stat = os.stat(path)
+    entries = []
+    with open(path, 'rb') as f, _map(f) as data:
+        offset = len(serializer.MAGIC)
+        while offset < len(data):
+            key, end = serializer.read_key(data, offset)
+            entries.append((key, offset))
+            offset = end
+    entries.sort()
+    tmp_path = f"{index_path(path)}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(_index_header.pack(
+            stat.st_size, stat.st_mtime_ns, len(entries)))
+        f.write(b"".join(_offset.pack(offset) for _, offset in entries))
+    os.replace(tmp_path, index_path(path))
+    return len(entries)
+
+
+def _map(f):
+    """
+    Args:
+        f: A file opened for reading bytes.
+
+    Returns:
+        mmap.mmap: A read-only memory map of the whole file.
+    """
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class RecordFile(MutableMapping):
+    """
+    The records of a binary snapshot and of its journals, by key.
+
+    Records are decoded from the memory-mapped snapshot each time they are
+    read. Journal entries, and records set or deleted afterwards, are kept
+    in memory on top of the snapshot, which is never written to.
+    """
+
+    def __init__(self, path, serializer):
+        """
+        Map a snapshot and its index, rebuilding the index if it is missing
+        or stale, and replay the journals of the snapshot.
+
+        Args:
+            path (str): The path of the snapshot.
+            serializer: The binary serializer.
+
+        Raises:
+            ValueError: If the file is not a binary snapshot.
+        """
+        self.__serializer = serializer
+        with open(path, 'rb') as f:
+            self.__data = _map(f)
+        if self.__data[:len(serializer.MAGIC)] != serializer.MAGIC:
+            self.__data.close()
+            raise ValueError("not a binary snapshot")
+        self.__index = self.__open_index(path)
+        if self.__index is None:
+            write_index(path, serializer)
+            self.__index = self.__open_index(path)
+        self.__start = len(INDEX_MAGIC) + _index_header.size
+        self.__count = _index_header.unpack_from(
+            self.__index, len(INDEX_MAGIC))[2]
+        self.__overlay = {}
+        self.__hidden = set()
+        self.journal_entries = 0
+        for journal in (f"{path}.log.old", f"{path}.log"):
+            if not os.path.exists(journal):
+                continue
+            with open(journal, 'rb') as f:
+                for op, key, record in serializer.read_journal(f):
+                    if op == "set":
+                        self[key] = record
+                    else:
+                        self.pop(key, None)
+                    self.journal_entries += 1
+
+    def __getitem__(self, key):
+        """
+        Returns:
+            dict: The record stored under `key`.
+
+        Raises:
+            KeyError: If there is no such record.
+        """
+        if key in self.__overlay:
+            return self.__overlay[key]
+        offset = self.__find(key)
+        if offset is None:
+            raise KeyError(key)
+        return self.__serializer.read_record(self.__data, offset)[1]
+
+    def __setitem__(self, key, record):
+        """
+        Store a record in memory, in place of the snapshot record if any.
+        """
+        if self.__find(key) is not None:
+            self.__hidden.add(key)
+        self.__overlay[key] = record
+
+    def __delitem__(self, key):
+        """
+        Remove a record.
+
+        Raises:
+            KeyError: If there is no such record.
+        """
+        if key in self.__overlay:
+            del self.__overlay[key]
+        elif self.__find(key) is not None:
+            self.__hidden.add(key)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        """
+        Returns:
+            bool: True if a record is stored under `key`; the record is not
+            decoded.
+        """
+        return key in self.__overlay or self.__find(key) is not None
+
+    def __iter__(self):
+        """
+        Yield the keys of the snapshot in file order, then the keys set in
+        memory.
+        """
+        serializer = self.__serializer
+        offset = len(serializer.MAGIC)
+        while offset < len(self.__data):
+            key, offset = serializer.read_key(self.__data, offset)
+            if key not in self.__hidden:
+                yield key
+        yield from list(self.__overlay)
+
+    def __len__(self):
+        """
+        Returns:
+            int: The number of records.
+        """
+        return self.__count - len(self.__hidden) + len(self.__overlay)
+
+    def close(self):
+        """
+        Unmap the snapshot and its index.
+        """
+        self.__data.close()
+        self.__index.close()
+
+    def __find(self, key):
+        """
+        Binary search the index for a key of the snapshot.
+
+        Args:
+            key (str): The key to look for.
+
+        Returns:
+            int: The offset of its record in the snapshot, or None if the
+            snapshot has no such record or it was set or deleted since.
+        """
+        if key in self.__hidden:
+            return None
+        low, high = 0, self.__count
+        while low < high:
+            middle = (low + high) // 2
+            (offset,) = _offset.unpack_from(
+                self.__index, self.__start + middle * _offset.size)
+            found = self.__serializer.read_key(self.__data, offset)[0]
+            if found == key:
+                return offset
+            if found < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __open_index(self, path):
+        """
+        Map the index of a snapshot.
+
+        Args:
+            path (str): The path of the snapshot.
+
+        Returns:
+            mmap.mmap: The index, or None if it is missing or was not built
+            from the current snapshot.
+        """
+        try:
+            with open(index_path(path), 'rb') as f:
+                index = _map(f)
+        except (OSError, ValueError):
+            return None
+        stat = os.stat(path)
+        start = len(INDEX_MAGIC)
+        if index[:start] == INDEX_MAGIC and \
+                len(index) >= start + _index_header.size:
+            size, mtime, count = _index_header.unpack_from(index, start)
+            if (size, mtime) == (stat.st_size, stat.st_mtime_ns) and \
+                    len(index) == start + _index_header.size + \
+                    count * _offset.size:
+                return index
+        index.close()
+        return None
@@ -0,0 +1,604 @@
+#!/usr/bin/python3
+"""
+Module: serializers.py
+
+Defines the on-disk formats `FileStorage` can use for its snapshot and its
+journal, and a converter between them.
+
+Two formats are available:
+    - `JSONSerializer` ("json"): the snapshot is one JSON object mapping
+      keys to records, the journal holds one JSON entry per line.
+    - `BinarySerializer` ("binary"): length-prefixed records whose
+      timestamps are stored as microseconds since the epoch, so that
+      loading them needs no date parsing, and whose other attributes are
+      stored in the `marshal` format, which decodes faster than JSON.
+
+The entries a save appends to a journal are framed by a begin and a commit
+marker, and a journal is only replayed up to the last complete frame, so
+that a crash in the middle of a save never leaves part of its changes.
+Entries outside any frame, as journals written without them hold, are
+replayed one by one.
+
+Usage as a script converts a store from one format to the other:
+
+    $ python3 -m models.engine.serializers file.json file.bin
+"""
+
+import os
+import sys
+import json
+import codecs
+import marshal
+import struct
+from datetime import datetime, timedelta
+from json.decoder import WHITESPACE
+from models.engine.atomic_file import recover, write_atomic
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+class JSONSerializer:
+    """
+    The JSON format, as written by `json.dump`.
+    """
+
+    name = "json"
+    extension = ".json"
+
+    def encode(self, record):
+        """
+        Args:
+            record (dict): A record as returned by `to_dict()`. Timestamps
+                may also be `datetime` objects.
+
+        Returns:
+            bytes: The encoded record.
+        """
+        for attr in ("created_at", "updated_at"):
+            if isinstance(record.get(attr), datetime):
+                record = dict(record, **{attr: record[attr].isoformat()})
+        return json.dumps(record).encode()
+
+    def write_snapshot(self, f, records):
+        """
+        Write a snapshot, exactly as `json.dump` would write the mapping of
+        keys to records.
+
+        Args:
+            f: A file opened for writing bytes.
+            records (list): (key, encoded record) pairs.
+        """
+        f.write(b"{")
+        f.write(b", ".join(
+            json.dumps(k).encode() + b": " + encoded
+            for k, encoded in records))
+        f.write(b"}")
+
+    def read_snapshot(self, f):
+        """
+        Args:
+            f: A file opened for reading bytes.
+
+        Returns:
+            dict: The records of the snapshot, by key.
+
+        Raises:
+            ValueError: If the snapshot is corrupt.
+        """
+        return json.load(f)
+
+    def iter_snapshot(self, f, chunk_size=1 << 16):
+        """
+        Read a snapshot one record at a time, so that neither its whole
+        text nor all of its records are held in memory at once.
+
+        Args:
+            f: A file opened for reading bytes.
+            chunk_size (int): The number of bytes read at a time.
+
+        Yields:
+            tuple: (key, record) pairs, in file order.
+
+        Raises:
+            ValueError: If the snapshot is corrupt.
+        """
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        buf, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+            return not eof
+
+        def skip(expected=None):
+            nonlocal pos
+            while True:
+                pos = WHITESPACE.match(buf, pos).end()
+                if pos < len(buf) or not fill():
+                    break
+            char = buf[pos:pos + 1]
+            if expected is not None and (not char or char not in expected):
+                raise ValueError(f"expected {expected!r} at {char!r}")
+            return char
+
+        def value():
+            nonlocal pos
+            while True:
+                try:
+                    result, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    if not fill():
+                        raise
+                    continue
+                # A number could go on in the next chunk
+                if end < len(buf) or eof or not fill():
+                    pos = end
+                    return result
+
+        skip("{")
+        pos += 1
+        if skip() == "}":
+            return
+        while True:
+            key = value()
+            skip(":")
+            pos += 1
+            skip()
+            yield key, value()
+            if skip(",}") == "}":
+                return
+            pos += 1
+            skip()
+
+    def journal_entry(self, op, key, encoded=None):
+        """
+        Args:
+            op (str): "set" or "del".
+            key (str): The key of the record.
+            encoded (bytes): The encoded record, for "set" entries.
+
+        Returns:
+            bytes: The journal entry.
+        """
+        if op == "del":
+            return json.dumps({"op": op, "key": key}).encode() + b"\n"
+        return b'{"op": "set", "key": ' + json.dumps(key).encode() + \
+            b', "value": ' + encoded + b'}\n'
+
+    def journal_frame(self, entries):
+        """
+        Args:
+            entries (list): The journal entries of one save.
+
+        Returns:
+            bytes: The entries between a begin and a commit marker.
+        """
+        return b"".join([b'{"op": "begin"}\n', *entries,
+                         b'{"op": "commit"}\n'])
+
+    def read_journal(self, f):
+        """
+        Yield the entries of the complete frames of a journal, stopping at
+        a torn entry.
+
+        Args:
+            f: A file opened for reading bytes.
+
+        Yields:
+            tuple: (op, key, record) triples; record is None for "del".
+        """
+        def entries():
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    return
+                yield entry["op"], entry.get("key"), entry.get("value")
+        return _committed(entries())
+
+
+class BinarySerializer:
+    """
+    A compact binary format.
+
+    A snapshot starts with `MAGIC`, followed by records made of a 4-byte
+    big-endian length and a payload: the key (2-byte length, UTF-8), the
+    creation and update times (signed 8-byte microseconds since the epoch)
+    and the other attributes as a dictionary in `marshal` format (version
+    4, which every Python 3 release since 3.4 reads). Journal entries are a
+    one-byte operation (b"S" or b"D") followed by the same length-prefixed
+    payload, or by the length-prefixed key only for deletions.
+    """
+
+    name = "binary"
+    extension = ".bin"
+    MAGIC = b"HBNB\x01"
+    __length = struct.Struct(">I")
+    __key_length = struct.Struct(">H")
+    __times = struct.Struct(">qq")
+    __header = struct.Struct(">IH")
+
+    def encode(self, record):
+        """
+        Args:
+            record (dict): A record as returned by `to_dict()`. Timestamps
+                may also be `datetime` objects.
+
+        Returns:
+            bytes: The encoded record, without its key.
+        """
+        attrs = dict(record)
+        attrs.pop("__class__", None)
+        times = []
+        for attr in ("created_at", "updated_at"):
+            value = attrs.pop(attr)
+            if isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            times.append((value - EPOCH) // MICROSECOND)
+        return self.__times.pack(*times) + marshal.dumps(attrs, 4)
+
+    def write_snapshot(self, f, records):
+        """
+        Args:
+            f: A file opened for writing bytes.
+            records (list): (key, encoded record) pairs.
+        """
+        f.write(self.MAGIC)
+        for key, encoded in records:
+            f.write(self.__payload(key, encoded))
+
+    def read_snapshot(self, f):
+        """
+        Args:
+            f: A file opened for reading bytes.
+
+        Returns:
+            dict: The records of the snapshot, by key.
+
+        Raises:
+            ValueError: If the snapshot is corrupt.
+        """
+        data = f.read()
+        if not data.startswith(self.MAGIC):
+            raise ValueError("not a binary snapshot")
+        records = {}
+        offset = len(self.MAGIC)
+        read_record = self.read_record
+        view = memoryview(data)
+        while offset < len(data):
+            key, record, offset = read_record(data, offset, view)
+            records[key] = record
+        return records
+
+    def iter_snapshot(self, f):
+        """
+        Read a snapshot one record at a time.
+
+        Args:
+            f: A file opened for reading bytes.
+
+        Yields:
+            tuple: (key, record) pairs, in file order.
+
+        Raises:
+            ValueError: If the snapshot is corrupt.
+        """
+        if f.read(len(self.MAGIC)) != self.MAGIC:
+            raise ValueError("not a binary snapshot")
+        while True:
+            header = f.read(self.__length.size)
+            if not header:
+                return
+            if len(header) < self.__length.size:
+                raise ValueError("incomplete record")
+            (size,) = self.__length.unpack(header)
+            try:
+                key, record, _ = self.read_record(
+                    header + f.read(size), 0)
+            except (struct.error, EOFError):
+                raise ValueError("corrupt record") from None
+            yield key, record
+
+    def journal_entry(self, op, key, encoded=None):
+        """
+        Args:
+            op (str): "set" or "del".
+            key (str): The key of the record.
+            encoded (bytes): The encoded record, for "set" entries.
+
+        Returns:
+            bytes: The journal entry.
+        """
+        if op == "del":
+            key = key.encode()
+            return b"D" + self.__length.pack(len(key)) + key
+        return b"S" + self.__payload(key, encoded)
+
+    def journal_frame(self, entries):
+        """
+        Args:
+            entries (list): The journal entries of one save.
+
+        Returns:
+            bytes: The entries between a begin (b"B") and a commit (b"C")
+            marker.
+        """
+        return b"".join([b"B", *entries, b"C"])
+
+    def read_journal(self, f):
+        """
+        Yield the entries of the complete frames of a journal, stopping at
+        a torn entry.
+
+        Args:
+            f: A file opened for reading bytes.
+
+        Yields:
+            tuple: (op, key, record) triples; record is None for "del".
+        """
+        return _committed(self.__entries(f.read()))
+
+    def __entries(self, data):
+        """
+        Yield the entries and markers of a journal, stopping at a torn
+        entry.
+
+        Args:
+            data (bytes): The journal.
+
+        Yields:
+            tuple: (op, key, record) triples; key and record are None for
+            the "begin" and "commit" markers.
+        """
+        markers = {b"B": "begin", b"C": "commit"}
+        offset = 0
+        while offset < len(data):
+            op = data[offset:offset + 1]
+            try:
+                if op in markers:
+                    yield markers[op], None, None
+                    offset += 1
+                elif op == b"S":
+                    key, record, offset = self.read_record(
+                        data, offset + 1)
+                    yield "set", key, record
+                elif op == b"D":
+                    start = offset + 1 + self.__length.size
+                    (size,) = self.__length.unpack_from(data, offset + 1)
+                    if start + size > len(data):
+                        return
+                    yield "del", data[start:start + size].decode(), None
+                    offset = start + size
+                else:
+                    return
+            except (struct.error, ValueError, EOFError):
+                return
+
+    def __payload(self, key, encoded):
+        """
+        Returns:
+            bytes: The length-prefixed payload of a record.
+        """
+        key = key.encode()
+        payload = self.__key_length.pack(len(key)) + key + encoded
+        return self.__length.pack(len(payload)) + payload
+
+    def read_key(self, data, offset):
+        """
+        Decode the key of the record whose payload starts at `offset`.
+
+        Args:
+            data (bytes): The file contents, or a memory map of the file.
+            offset (int): Where the payload length starts.
+
+        Returns:
+            tuple: The key and the offset after the payload.
+        """
+        size, key_size = self.__header.unpack_from(data, offset)
+        key_start = offset + self.__header.size
+        return (str(data[key_start:key_start + key_size], "utf-8"),
+                offset + self.__length.size + size)
+
+    def read_record(self, data, offset, view=None):
+        """
+        Decode the length-prefixed payload of a record.
+
+        Args:
+            data (bytes): The file contents, or a memory map of the file.
+            offset (int): Where the payload length starts.
+            view (memoryview, optional): A view of `data`, to decode the
+                attributes without copying them.
+
+        Returns:
+            tuple: The key, the record and the offset after the payload.
+
+        Raises:
+            ValueError: If the payload is incomplete or corrupt.
+        """
+        size, key_size = self.__header.unpack_from(data, offset)
+        end = offset + self.__length.size + size
+        if end > len(data):
+            raise ValueError("incomplete record")
+        key_start = offset + self.__header.size
+        key_end = key_start + key_size
+        key = str(data[key_start:key_end], "utf-8")
+        created, updated = self.__times.unpack_from(data, key_end)
+        record = marshal.loads(
+            (memoryview(data) if view is None else view)[
+                key_end + self.__times.size:end])
+        record["created_at"] = created_at = \
+            EPOCH + timedelta(microseconds=created)
+        record["updated_at"] = created_at if updated == created else \
+            EPOCH + timedelta(microseconds=updated)
+        record["__class__"] = key[:key.index('.')]
+        return key, record, end
+
+
+SERIALIZERS = {s.name: s for s in (JSONSerializer(), BinarySerializer())}
+
+
+def _committed(entries):
+    """
+    Drop the entries of the frames of a journal that were not committed.
+
+    Args:
+        entries: (op, key, record) triples, markers included, in journal
+            order.
+
+    Yields:
+        tuple: The (op, key, record) triples outside any frame, and those
+        of the frames followed by their commit marker.
+    """
+    frame = None
+    for entry in entries:
+        if entry[0] == "begin":
+            # A frame begun before was never committed
+            frame = []
+        elif entry[0] == "commit":
+            yield from frame or ()
+            frame = None
+        elif frame is None:
+            yield entry
+        else:
+            frame.append(entry)
+
+
+def get_serializer(name):
+    """Looks up a serializer by format name.
+
+    Args:
+        name (str): "json" or "binary".
+
+    Returns:
+        The serializer.
+
+    Raises:
+        ValueError: If the format is unknown.
+    """
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ValueError(f"unknown storage format: {name}") from None
+
+
+def serializer_for(path):
+    """Guesses the serializer of a file from its extension.
+
+    Args:
+        path (str): The path of a snapshot.
+
+    Returns:
+        The serializer; JSON for unknown extensions.
+    """
+    extension = os.path.splitext(path)[1]
+    for serializer in SERIALIZERS.values():
+        if serializer.extension == extension:
+            return serializer
+    return SERIALIZERS["json"]
+
+
+def read_store(path, serializer, build=None):
+    """Reads a snapshot and replays its journals on top of it.
+
+    A snapshot that does not have the size recorded in its checksum, or
+    cannot be parsed, is replaced by its backup (see
+    `models.engine.atomic_file`).
+
+    Args:
+        path (str): The path of the snapshot.
+        serializer: The serializer of the snapshot and its journals.
+        build (callable, optional): Called with the key and the record of
+            every record as soon as it is read, snapshot and journal alike;
+            what it returns is stored in place of the record. The snapshot
+            is then streamed rather than loaded at once.
+
+    Returns:
+        tuple: The records (or what `build` made of them) by key, and the
+        number of journal entries replayed; None if there is no
+        snapshot.
+
+    Raises:
+        ValueError: If the snapshot cannot be read and has no good backup.
+    """
+    if not os.path.exists(path):
+        return None
+    recover(path, quick=True)
+    try:
+        records = _read_snapshot(path, serializer, build)
+    except ValueError:
+        if not recover(path, damaged=True):
+            raise ValueError(f"cannot read snapshot: {path}") from None
+        records = _read_snapshot(path, serializer, build)
+    entries = 0
+    for journal in (f"{path}.log.old", f"{path}.log"):
+        if not os.path.exists(journal):
+            continue
+        with open(journal, 'rb') as f:
+            for op, key, record in serializer.read_journal(f):
+                if op == "del":
+                    records.pop(key, None)
+                elif build is None:
+                    records[key] = record
+                else:
+                    records[key] = build(key, record)
+                entries += 1
+    return records, entries
+
+
+def _read_snapshot(path, serializer, build):
+    """
+    Args:
+        path (str): The path of a snapshot.
+        serializer: The serializer of the snapshot.
+        build (callable): Called with the key and the record of every
+            record, or None.
+
+    Returns:
+        dict: The records (or what `build` made of them) by key.
+
+    Raises:
+        ValueError: If the snapshot cannot be parsed.
+    """
+    with open(path, 'rb') as f:
+        if build is None:
+            return serializer.read_snapshot(f)
+        return {k: build(k, v) for k, v in serializer.iter_snapshot(f)}
+
+
+def convert(src, dst, src_format=None, dst_format=None):
+    """Converts a store, journals included, to another format.
+
+    Args:
+        src (str): The path of the snapshot to convert.
+        dst (str): The path of the snapshot to write.
+        src_format (str, optional): The format of `src`; guessed from its
+            extension by default.
+        dst_format (str, optional): The format of `dst`; guessed from its
+            extension by default.
+
+    Returns:
+        int: The number of records converted.
+
+    Raises:
+        ValueError: If `src` cannot be read.
+    """
+    reader = get_serializer(src_format) if src_format else serializer_for(src)
+    writer = get_serializer(dst_format) if dst_format else serializer_for(dst)
+    loaded = read_store(src, reader)
+    if loaded is None:
+        raise ValueError(f"cannot read store: {src}")
+    records = [(k, writer.encode(v)) for k, v in loaded[0].items()]
+    write_atomic(dst, lambda f: writer.write_snapshot(f, records))
+    return len(records)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: {} <source> <destination>".format(sys.argv[0]))
+        sys.exit(1)
+    print("{} records converted".format(convert(sys.argv[1], sys.argv[2])))
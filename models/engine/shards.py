@@ -0,0 +1,83 @@
+#!/usr/bin/python3
+"""
+Module: shards.py
+
+Defines the layout of a sharded store: one directory per model class, each
+holding one snapshot per bucket of ids, e.g. for `file.json`:
+
+    file.shards/
+        Review/
+            00.json
+            ...
+            0f.json
+        User/
+            ...
+
+An object goes to the bucket given by the CRC-32 of its id, which, unlike
+`hash()`, is the same in every process.
+"""
+
+import os
+import zlib
+
+
+def shard_directory(path):
+    """
+    Args:
+        path (str): The path of the unsharded snapshot, e.g. "file.json".
+
+    Returns:
+        str: The directory of its shards, e.g. "file.shards".
+    """
+    return f"{os.path.splitext(path)[0]}.shards"
+
+
+def bucket_of(key, buckets):
+    """
+    Args:
+        key (str): A storage key, "<class name>.<id>".
+        buckets (int): The number of buckets of each class.
+
+    Returns:
+        int: The bucket of the object stored under `key`.
+    """
+    return zlib.crc32(key.partition('.')[2].encode()) % buckets
+
+
+def shard_path(directory, name, bucket, extension):
+    """
+    Args:
+        directory (str): The directory of the shards.
+        name (str): A class name.
+        bucket (int): A bucket number.
+        extension (str): The extension of the snapshot format.
+
+    Returns:
+        str: The path of the shard holding the objects of class `name` in
+        bucket `bucket`.
+    """
+    return os.path.join(directory, name, f"{bucket:02x}{extension}")
+
+
+def list_shards(directory, extension):
+    """
+    Args:
+        directory (str): The directory of the shards.
+        extension (str): The extension of the snapshot format.
+
+    Returns:
+        dict: Each class name with shards mapped to the list of their
+        paths; empty if there is no such directory.
+    """
+    if not os.path.isdir(directory):
+        return {}
+    shards = {}
+    for name in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, name)
+        if not os.path.isdir(folder):
+            continue
+        paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+                 if f.endswith(extension)]
+        if paths:
+            shards[name] = paths
+    return shards
@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+"""
+Module: spatial_index.py
+
+Defines a `GridIndex` class indexing points (latitude, longitude) in a grid
+of fixed-size cells, so that radius and bounding-box searches only look at
+the points of the cells they overlap.
+"""
+
+import math
+from itertools import chain
+from models.engine.column_store import is_number
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Computes the great-circle distance between two points.
+
+    Args:
+        lat1 (float): Latitude of the first point, in degrees.
+        lon1 (float): Longitude of the first point, in degrees.
+        lat2 (float): Latitude of the second point, in degrees.
+        lon2 (float): Longitude of the second point, in degrees.
+
+    Returns:
+        float: The distance in kilometers (haversine formula).
+    """
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def degree_spans(latitude, km):
+    """Computes how far, in degrees, points within a distance of a point
+    can be from it.
+
+    Args:
+        latitude (float): Latitude of the point, in degrees.
+        km (float): The distance, in kilometers.
+
+    Returns:
+        tuple: The latitude and longitude spans, in degrees; the longitude
+        span is 360 when the distance reaches over a pole.
+    """
+    lat_span = km / KM_PER_DEGREE
+    cos_lat = math.cos(math.radians(min(90.0, abs(latitude) + lat_span)))
+    if cos_lat * 180 * KM_PER_DEGREE <= km:
+        return lat_span, 360.0
+    return lat_span, lat_span / cos_lat
+
+
+class GridIndex:
+    """
+    Points stored by key in square cells of `cell_size` degrees.
+
+    Searches visit the cells overlapping the searched area, or every
+    non-empty cell when that is fewer, and then check the points of those
+    cells exactly. Points whose coordinates are out of range (latitude
+    beyond 90 degrees, longitude beyond 180) or are not numbers are kept
+    aside as irregular: every search checks the numeric ones too, and
+    callers filtering on the coordinates must check them all themselves.
+    """
+
+    def __init__(self, cell_size=0.1):
+        """
+        Initialize an empty index.
+
+        Args:
+            cell_size (float): Side of a cell, in degrees.
+        """
+        self.cell_size = cell_size
+        self.__lon_cells = math.ceil(360 / cell_size)
+        self.__cells = {}
+        self.__points = {}
+        self.__irregular = {}
+
+    def __len__(self):
+        """
+        Returns:
+            int: The number of points in the index.
+        """
+        return len(self.__points)
+
+    def set(self, key, latitude, longitude):
+        """
+        Store or move the point of a key.
+
+        Args:
+            key (str): The storage key of the object.
+            latitude (float): Latitude, in degrees.
+            longitude (float): Longitude, in degrees. Either may be of any
+                other type, which makes the point irregular.
+        """
+        self.remove(key)
+        point = (latitude, longitude)
+        self.__points[key] = point
+        if is_number(latitude) and is_number(longitude) and \
+                -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            self.__cells.setdefault(self.__cell(*point), {})[key] = point
+        else:
+            self.__irregular[key] = point
+
+    def remove(self, key):
+        """
+        Remove the point of a key, if present.
+
+        Args:
+            key (str): The storage key of the object.
+        """
+        point = self.__points.pop(key, None)
+        if point is None or self.__irregular.pop(key, None) is not None:
+            return
+        cell = self.__cell(*point)
+        del self.__cells[cell][key]
+        if not self.__cells[cell]:
+            del self.__cells[cell]
+
+    def within(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Find the points inside a bounding box. A box whose `min_lon` is
+        greater than its `max_lon` crosses the antimeridian.
+
+        Args:
+            min_lat (float): Southern edge, in degrees.
+            min_lon (float): Western edge, in degrees.
+            max_lat (float): Northern edge, in degrees.
+            max_lon (float): Eastern edge, in degrees.
+
+        Returns:
+            list: The keys of the points inside the box, irregular points
+            included.
+        """
+        wraps = min_lon > max_lon
+
+        def inside(lat, lon):
+            if not min_lat <= lat <= max_lat:
+                return False
+            if wraps:
+                return lon >= min_lon or lon <= max_lon
+            return min_lon <= lon <= max_lon
+
+        lon_span = (max_lon - min_lon) % 360 if wraps else max_lon - min_lon
+        return [key for key, (lat, lon) in self.__candidates(
+                    min_lat, max_lat, min_lon, lon_span)
+                if inside(lat, lon)] + \
+            [key for key, point in self.__numeric_irregular()
+             if inside(*point)]
+
+    def near(self, latitude, longitude, km):
+        """
+        Find the points within a distance of a point.
+
+        Args:
+            latitude (float): Latitude of the center, in degrees.
+            longitude (float): Longitude of the center, in degrees.
+            km (float): The radius, in kilometers.
+
+        Returns:
+            list: (key, distance in km) pairs, closest first, irregular
+            points included.
+        """
+        lat_span, lon_span = degree_spans(latitude, km)
+        found = []
+        for key, (lat, lon) in chain(self.__candidates(
+                latitude - lat_span, latitude + lat_span,
+                longitude - lon_span, 2 * lon_span),
+                self.__numeric_irregular()):
+            distance = distance_km(latitude, longitude, lat, lon)
+            if distance <= km:
+                found.append((key, distance))
+        found.sort(key=lambda item: item[1])
+        return found
+
+    def __cell(self, latitude, longitude):
+        """
+        Returns:
+            tuple: The (row, column) of the cell holding a point.
+        """
+        return (math.floor(latitude / self.cell_size),
+                math.floor((longitude + 180) / self.cell_size) %
+                self.__lon_cells)
+
+    def estimate(self, min_lat, min_lon, max_lat, max_lon):
+        """
+        Count the points of the cells overlapping a bounding box, and the
+        irregular points, without checking them: the number of points
+        `within()` would check, and an upper bound of the number it finds.
+
+        Args:
+            min_lat (float): Southern edge, in degrees.
+            min_lon (float): Western edge, in degrees.
+            max_lat (float): Northern edge, in degrees.
+            max_lon (float): Eastern edge, in degrees.
+
+        Returns:
+            int: The number of points in the overlapping cells.
+        """
+        wraps = min_lon > max_lon
+        lon_span = (max_lon - min_lon) % 360 if wraps else max_lon - min_lon
+        return sum(len(points) for points in self.__overlapping(
+            min_lat, max_lat, min_lon, lon_span)) + len(self.__irregular)
+
+    def irregular(self):
+        """
+        Returns:
+            list: The keys of the points whose coordinates are out of
+            range or not numbers.
+        """
+        return list(self.__irregular)
+
+    def __numeric_irregular(self):
+        """
+        Yields:
+            tuple: (key, (latitude, longitude)) pairs of the irregular
+            points whose coordinates are numbers.
+        """
+        for key, point in self.__irregular.items():
+            if is_number(point[0]) and is_number(point[1]):
+                yield key, point
+
+    def __candidates(self, min_lat, max_lat, min_lon, lon_span):
+        """
+        Yield the points of the cells overlapping an area.
+
+        Args:
+            min_lat (float): Southern edge, in degrees.
+            max_lat (float): Northern edge, in degrees.
+            min_lon (float): Western edge, in degrees.
+            lon_span (float): Width of the area eastwards, in degrees.
+
+        Yields:
+            tuple: (key, (latitude, longitude)) pairs.
+        """
+        for points in self.__overlapping(min_lat, max_lat, min_lon, lon_span):
+            yield from points.items()
+
+    def __overlapping(self, min_lat, max_lat, min_lon, lon_span):
+        """
+        Yield the non-empty cells overlapping an area.
+
+        Args:
+            min_lat (float): Southern edge, in degrees.
+            max_lat (float): Northern edge, in degrees.
+            min_lon (float): Western edge, in degrees.
+            lon_span (float): Width of the area eastwards, in degrees.
+
+        Yields:
+            dict: The points of a cell, by key.
+        """
+        first_row, first_col = self.__cell(min_lat, min_lon)
+        last_row = math.floor(max_lat / self.cell_size)
+        cols = min(self.__lon_cells,
+                   math.floor(lon_span / self.cell_size) + 2)
+        if (last_row - first_row + 1) * cols > len(self.__cells):
+            rows = range(first_row, last_row + 1)
+            for (row, col), points in self.__cells.items():
+                if row in rows and (col - first_col) % self.__lon_cells < cols:
+                    yield points
+            return
+        for row in range(first_row, last_row + 1):
+            for offset in range(cols):
+                col = (first_col + offset) % self.__lon_cells
+                points = self.__cells.get((row, col))
+                if points:
+                    yield points
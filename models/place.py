@@ -38,3 +38,8 @@ class Place(BaseModel):
     latitude: float = 0.0
     max_guest: int = 0
     amenity_ids: list = []
+
+    _indexed_attrs = ("city_id", "user_id")
+    _columnar_attrs = ("number_bathrooms", "price_by_night", "number_rooms",
+                       "longitude", "latitude", "max_guest")
+    _spatial_attrs = ("latitude", "longitude")
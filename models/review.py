@@ -22,3 +22,5 @@ class Review(BaseModel):
     text: str = ""
     user_id: str = ""
     place_id: str = ""
+
+    _indexed_attrs = ("place_id", "user_id")
@@ -3,10 +3,12 @@
 """
 from io import StringIO
 import os
+import tempfile
 import unittest
 from unittest.mock import patch
 from console import HBNBCommand
 from models import storage
+from models.engine.file_storage import FileStorage
 import json
 from models.base_model import BaseModel
 from models.user import User
@@ -22,37 +24,53 @@ class TestConsole(unittest.TestCase):
     """
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
-        storage._FileStorage__objects = {}
-        if os.path.exists(storage._FileStorage__file_path):
-            os.remove(storage._FileStorage__file_path)
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_simple(self):
         """Tests basic commands.
         """
+        listing = ("Documented commands (type help <topic>):\n"
+                   "========================================\n"
+                   "EOF  begin   compact  destroy  export  import  quit      "
+                   "select  update  within\n"
+                   "all  commit  create   explain  help    near    rollback  "
+                   "show    where")
+        all_help = ("Displays string representation of all instances.\n"
+                    "        Usage: all [<class name>] [lines] [limit=<n>] "
+                    "[offset=<n>] [after=<id>]\n"
+                    "        With options, instances are printed as they are "
+                    "read, one per line\n"
+                    "        with `lines`, starting after the instance "
+                    "`after` if given.")
         commands = ["quit", "EOF", "\n", "?", "help", "? create", "help create",
                     "? all", "help all", "? show", "help show", "? update",
                     "help update", "? destroy", "help destroy", "? quit",
                     "help quit", "? help", "help help"]
-        expected_outputs = ["", "\n", "", "", "", "Creates a new instance.",
+        expected_outputs = ["", "", "", listing, listing,
                             "Creates a new instance.",
-                            "Prints string representation of all instances.",
-                            "Prints string representation of all instances.",
-                            "Prints the string representation of an instance.",
-                            "Prints the string representation of an instance.",
+                            "Creates a new instance.",
+                            all_help, all_help,
+                            "Displays the string representation of an instance.",
+                            "Displays the string representation of an instance.",
                             "Updates an instance based on the class name and id.",
                             "Updates an instance based on the class name and id.",
                             "Deletes an instance based on the class name and id.",
                             "Deletes an instance based on the class name and id.",
-                            "Quit command to exit the program.",
-                            "Quit command to exit the program.",
-                            "To get help on a command, type help <topic>.",
-                            "To get help on a command, type help <topic>."]
-        with patch('sys.stdout', new=StringIO()) as f:
-            for command, output in zip(commands, expected_outputs):
+                            "Exits the program.",
+                            "Exits the program.",
+                            "Displays help for a command, e.g., help <topic>.",
+                            "Displays help for a command, e.g., help <topic>."]
+        for command, output in zip(commands, expected_outputs):
+            with patch('sys.stdout', new=StringIO()) as f:
                 HBNBCommand().onecmd(command)
                 self.assertEqual(f.getvalue().strip(), output)
 
@@ -62,13 +80,16 @@ class TestModelsCommands(unittest.TestCase):
     """
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
-        storage._FileStorage__objects = {}
-        if os.path.exists(storage._FileStorage__file_path):
-            os.remove(storage._FileStorage__file_path)
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_base_model_commands(self):
         """Tests commands related to BaseModel."""
@@ -76,7 +97,7 @@ class TestModelsCommands(unittest.TestCase):
             HBNBCommand().onecmd('create BaseModel')
             output = f.getvalue().strip()
             self.assertIsInstance(output, str)
-            self.assertIn(output, storage.all().keys())
+            self.assertIn("BaseModel." + output, storage.all().keys())
 
         with patch('sys.stdout', new=StringIO()) as f:
             HBNBCommand().onecmd('all BaseModel')
@@ -105,13 +126,16 @@ class TestModelsDotNotation(unittest.TestCase):
     """
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
-        storage._FileStorage__objects = {}
-        if os.path.exists(storage._FileStorage__file_path):
-            os.remove(storage._FileStorage__file_path)
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_base_model_dot_notation(self):
         """Tests dot notation commands related to BaseModel."""
@@ -119,7 +143,7 @@ class TestModelsDotNotation(unittest.TestCase):
             HBNBCommand().onecmd(HBNBCommand().precmd('BaseModel.create()'))
             output = f.getvalue().strip()
             self.assertIsInstance(output, str)
-            self.assertIn(output, storage.all().keys())
+            self.assertIn("BaseModel." + output, storage.all().keys())
 
         with patch('sys.stdout', new=StringIO()) as f:
             HBNBCommand().onecmd(HBNBCommand().precmd('BaseModel.count()'))
@@ -156,13 +180,16 @@ class TestReview(unittest.TestCase):
     """
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
-        storage._FileStorage__objects = {}
-        if os.path.exists(storage._FileStorage__file_path):
-            os.remove(storage._FileStorage__file_path)
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_create_review(self):
         """Test create review object.
@@ -230,13 +257,16 @@ class TestReviewDotNotation(unittest.TestCase):
     """
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
-        storage._FileStorage__objects = {}
-        if os.path.exists(storage._FileStorage__file_path):
-            os.remove(storage._FileStorage__file_path)
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_create_review(self):
         """Test create review object.
@@ -321,7 +351,401 @@ class TestReviewDotNotation(unittest.TestCase):
         """
         with patch('sys.stdout', new=StringIO()):
             rv = Review()
-            HBNBCommand().onecmd(HBNBCommand().precmd
+            HBNBCommand().onecmd(HBNBCommand().precmd(
+                                 f'Review.destroy({rv.id})'))
+            self.assertNotIn("Review.{}".format(
+                rv.id), storage.all().keys())
+
+
+class TestSpatialCommands(unittest.TestCase):
+    """Testing the `near` and `within` commands.
+    """
+
+    def setUp(self):
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_near(self):
+        """Test places near a point.
+        """
+        pl = Place()
+        pl.latitude = 6.5244
+        pl.longitude = 3.3792
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('near Place 6.6 3.35 20')
+            self.assertIn(pl.id, f.getvalue())
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd(HBNBCommand().precmd(
+                                 'Place.near(6.6, 3.35, 5)'))
+            self.assertNotIn(pl.id, f.getvalue())
+
+    def test_within(self):
+        """Test places inside a bounding box.
+        """
+        pl = Place()
+        pl.latitude = 6.5244
+        pl.longitude = 3.3792
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('within Place 6 3 7 4')
+            self.assertIn(pl.id, f.getvalue())
+
+    def test_errors(self):
+        """Test spatial commands with bad arguments.
+        """
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('near')
+            self.assertEqual(f.getvalue().strip(), "** class name missing **")
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('near Place 6.6')
+            self.assertEqual(f.getvalue().strip(),
+                             "** coordinates missing **")
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('within Place a b c d')
+            self.assertEqual(f.getvalue().strip(),
+                             "** invalid coordinates **")
+
+
+class TestBatchCommands(unittest.TestCase):
+    """Testing the `begin`, `commit` and `rollback` commands.
+    """
+
+    def setUp(self):
+        """Goes to an empty temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_begin_commit(self):
+        """Test that creations within a batch are saved by commit.
+        """
+        console = HBNBCommand()
+        with patch('sys.stdout', new=StringIO()) as f:
+            console.onecmd('begin')
+            console.onecmd('create User')
+            console.onecmd('create User')
+            ids = f.getvalue().split()
+        self.assertFalse(os.path.exists(storage._FileStorage__file_path))
+        console.onecmd('commit')
+        with open(storage._FileStorage__file_path) as f:
+            saved = json.load(f)
+        for id in ids:
+            self.assertIn("User." + id, saved)
+
+    def test_failed_import_in_batch(self):
+        """Test that a failed import leaves the batch in progress.
+        """
+        console = HBNBCommand()
+        with open("bad.jsonl", "w") as f:
+            f.write('{"__class__": "User"}\n{"__class__": "Nope"}\n')
+        with patch('sys.stdout', new=StringIO()) as f:
+            console.onecmd('begin')
+            console.onecmd('create State')
+            id = f.getvalue().strip()
+            console.onecmd('import bad.jsonl')
+            console.onecmd('commit')
+            self.assertNotIn("no batch", f.getvalue())
+        with open(storage._FileStorage__file_path) as f:
+            self.assertEqual(list(json.load(f)), ["State." + id])
+
+    def test_quit_commits(self):
+        """Test that a batch left open is committed on exit.
+        """
+        console = HBNBCommand()
+        with patch('sys.stdout', new=StringIO()):
+            console.onecmd('begin')
+            console.onecmd('create User')
+            self.assertTrue(console.onecmd('EOF'))
+        self.assertTrue(os.path.exists(storage._FileStorage__file_path))
+
+    def test_quit_flushes(self):
+        """Test that changes not written yet by a write-behind storage are
+        written on exit.
+        """
+        behind = FileStorage(write_delay=60)
+        behind._FileStorage__objects = {}
+        with patch('console.storage', behind), \
+                patch('models.storage', behind), \
+                patch('sys.stdout', new=StringIO()):
+            console = HBNBCommand()
+            console.onecmd('create User')
+            self.assertFalse(os.path.exists(storage._FileStorage__file_path))
+            self.assertTrue(console.onecmd('quit'))
+        self.assertTrue(os.path.exists(storage._FileStorage__file_path))
+
+    def test_no_batch(self):
+        """Test commit with no batch in progress.
+        """
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('commit')
+            self.assertEqual(f.getvalue().strip(),
+                             "** no batch in progress **")
+
+
+class TestBulkCommands(unittest.TestCase):
+    """Testing the `import` and `export` commands.
+    """
+
+    def setUp(self):
+        """Goes to a temporary directory for the files."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_import_export(self):
+        """Test importing a CSV file and exporting it as JSON Lines.
+        """
+        src = os.path.join(self.dir.name, "users.csv")
+        dst = os.path.join(self.dir.name, "users.jsonl")
+        with open(src, "w") as f:
+            f.write("id,email\nu1,a@b.c\nu2,d@e.f\n")
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('import {} User'.format(src))
+            self.assertRegex(f.getvalue(),
+                             r"^2 records imported in .* records/s\)")
+        self.assertEqual(storage.get(User, "u2").email, "d@e.f")
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('export {} User'.format(dst))
+            self.assertIn("records exported", f.getvalue())
+        with open(dst) as f:
+            self.assertEqual(len(f.readlines()), storage.count(User))
+
+    def test_errors(self):
+        """Test import and export with bad arguments.
+        """
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('import')
+            self.assertEqual(f.getvalue().strip(), "** file name missing **")
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('export out.jsonl Nope')
+            self.assertEqual(f.getvalue().strip(), "** class doesn't exist **")
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('import {}'.format(
+                os.path.join(self.dir.name, "none.csv")))
+            self.assertIn("No such file", f.getvalue())
+        bad = os.path.join(self.dir.name, "bad.jsonl")
+        with open(bad, "w") as f:
+            f.write('{"__class__": "User", "created_at": 5}\n')
+        with patch('sys.stdout', new=StringIO()) as f:
+            HBNBCommand().onecmd('import {}'.format(bad))
+            self.assertEqual(f.getvalue().strip(),
+                             "** {}:1: created_at: 5 is not a date **"
+                             .format(bad))
+
+
+class TestResultCache(unittest.TestCase):
+    """Testing the cache of the `all` and `count` outputs.
+    """
+
+    def setUp(self):
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def run_command(self, console, line):
+        """Runs a command and returns its output."""
+        with patch('sys.stdout', new=StringIO()) as f:
+            line = console.precmd(line)
+            console.onecmd(line)
+        return f.getvalue()
+
+    def test_output_is_reused(self):
+        """Test that repeated commands do not read the storage again, until
+        an object changes.
+        """
+        console = HBNBCommand()
+        us = User()
+        with patch.object(storage, "all",
+                          side_effect=storage.all) as all_objs:
+            first = self.run_command(console, "all User")
+            self.assertEqual(self.run_command(console, "all User"), first)
+            self.assertEqual(self.run_command(console, "User.all()"), first)
+            self.assertEqual(all_objs.call_count, 1)
+            us.first_name = "Betty"
+            self.assertIn("Betty", self.run_command(console, "all User"))
+            self.assertEqual(all_objs.call_count, 2)
+        self.assertEqual(self.run_command(console, "User.count()"), "1\n")
+        self.run_command(console, "destroy User {}".format(us.id))
+        self.assertEqual(self.run_command(console, "User.count()"), "0\n")
+        self.assertEqual(self.run_command(console, "all User"), "[]\n")
+
+    def test_eviction(self):
+        """Test that only the most recently used outputs are kept.
+        """
+        console = HBNBCommand()
+        console.cache_size = 2
+        with patch.object(storage, "all",
+                          side_effect=storage.all) as all_objs:
+            for name in ("User", "Place", "User", "State", "User"):
+                self.run_command(console, "all " + name)
+            self.assertEqual(all_objs.call_count, 3)
+            self.run_command(console, "all Place")
+            self.assertEqual(all_objs.call_count, 4)
+
+
+class TestStreamedAll(unittest.TestCase):
+    """Testing the streamed and paginated `all` command.
+    """
+
+    def setUp(self):
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def run_command(self, line):
+        """Runs a command and returns its output."""
+        console = HBNBCommand()
+        with patch('sys.stdout', new=StringIO()) as f:
+            console.onecmd(console.precmd(line))
+        return f.getvalue()
+
+    def test_same_output(self):
+        """Test that a streamed list is printed as the cached one."""
+        User()
+        User()
+        self.assertEqual(self.run_command("all User offset=0"),
+                         self.run_command("all User"))
+        self.assertEqual(self.run_command("all offset=0"),
+                         self.run_command("all"))
+
+    def test_pages(self):
+        """Test that limit, offset and after select a page, one instance
+        per line with lines."""
+        users = [User() for _ in range(5)]
+        lines = self.run_command("all User lines").splitlines()
+        self.assertEqual(lines, [str(us) for us in users])
+        self.assertEqual(
+            self.run_command("all User lines limit=2 offset=1").splitlines(),
+            lines[1:3])
+        self.assertEqual(
+            self.run_command("User.all(after={}, limit=2, lines)".format(
+                users[2].id)).splitlines(),
+            lines[3:5])
+        self.assertEqual(self.run_command("all User limit=1"),
+                         str([lines[0]]) + "\n")
+
+    def test_errors(self):
+        """Test invalid options and cursors."""
+        self.assertEqual(self.run_command("all User limit=x").strip(),
+                         "** invalid option: limit=x **")
+        self.assertEqual(self.run_command("all User after=nope").strip(),
+                         "** no instance found **")
+        self.assertEqual(self.run_command("all Nope lines").strip(),
+                         "** class doesn't exist **")
+
+
+class TestQueryCommands(unittest.TestCase):
+    """Testing the `where` and `select` commands.
+    """
+
+    def setUp(self):
+        """Creates a few places, in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.cheap = Place()
+        self.cheap.name = "Small house"
+        self.cheap.city_id = "query-city"
+        self.cheap.price_by_night = 50
+        self.dear = Place()
+        self.dear.name = "Big, nice house"
+        self.dear.city_id = "query-city"
+        self.dear.price_by_night = 150
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def run_command(self, line):
+        """Runs a command and returns its output."""
+        console = HBNBCommand()
+        with patch('sys.stdout', new=StringIO()) as f:
+            console.onecmd(console.precmd(line))
+        return f.getvalue().strip()
+
+    def test_where(self):
+        """Test filtering instances with predicates."""
+        self.assertEqual(
+            self.run_command(
+                'where Place city_id="query-city" price_by_night<100'),
+            str([str(self.cheap)]))
+        self.assertEqual(
+            self.run_command('Place.where(name="Big, nice house")'),
+            str([str(self.dear)]))
+        self.assertEqual(
+            self.run_command("Place.where(price_by_night>=50, "
+                             "city_id=query-city, price_by_night!=50)"),
+            str([str(self.dear)]))
+
+    def test_select(self):
+        """Test projecting attributes of the matching instances."""
+        self.assertEqual(
+            self.run_command("select Place name price_by_night "
+                             "price_by_night>100 city_id=query-city"),
+            str([{"name": "Big, nice house", "price_by_night": 150}]))
+        self.assertEqual(
+            self.run_command("Place.select(id, nope, price_by_night=50, "
+                             "city_id=query-city)"),
+            str([{"id": self.cheap.id}]))
+
+    def test_explain(self):
+        """Test showing the plan of a query."""
+        Place()
+        lines = self.run_command(
+            "Place.explain(city_id=query-city, price_by_night<100)"
+        ).splitlines()
+        self.assertEqual(lines[0], "plan: index city_id == 'query-city'")
+        self.assertIn("actual rows: 1 (2 objects read)", lines)
+        self.assertEqual(self.run_command("explain Place name"),
+                         "** invalid predicate: name **")
+
+    def test_errors(self):
+        """Test invalid commands."""
+        self.assertEqual(self.run_command("where"),
+                         "** class name missing **")
+        self.assertEqual(self.run_command("where Nope a=1"),
+                         "** class doesn't exist **")
+        self.assertEqual(self.run_command("where Place name"),
+                         "** invalid predicate: name **")
+        self.assertEqual(self.run_command("where Place price~1"),
+                         "** invalid predicate: price~1 **")
+        self.assertEqual(self.run_command("select Place price<1"),
+                         "** attribute name missing **")
 
 
 if __name__ == "__main__":
@@ -1,11 +1,15 @@
 """Unit tests for the `BaseModel` module."""
 
+import gc
 import json
 import os
+import tempfile
 import time
 import unittest
 import uuid
 from datetime import datetime
+from unittest.mock import patch
+import models
 from models.base_model import BaseModel
 from models.engine.file_storage import FileStorage
 
@@ -14,13 +18,16 @@ class TestBaseModel(unittest.TestCase):
     """Test cases for the `BaseModel` class."""
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
+        """Resets FileStorage data and removes the temporary directory."""
         FileStorage._FileStorage__objects = {}
-        if os.path.exists(FileStorage._FileStorage__file_path):
-            os.remove(FileStorage._FileStorage__file_path)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_initialization_positive(self):
         """Test positive cases for BaseModel initialization."""
@@ -87,6 +94,69 @@ class TestBaseModel(unittest.TestCase):
         string = f"[{type(b1).__name__}] ({b1.id}) {b1.__dict__}"
         self.assertEqual(b1.__str__(), string)
 
+    def test_compact(self):
+        """Test the compact variant of BaseModel."""
+        compact = BaseModel.compact()
+        self.assertIs(BaseModel.compact(), compact)
+        self.assertIs(compact.compact(), compact)
+        self.assertEqual(compact.__name__, "BaseModel")
+        b = BaseModel()
+        c = compact(**b.to_dict())
+        self.assertIsInstance(c, BaseModel)
+        self.assertEqual(c.to_dict(), b.to_dict())
+        self.assertEqual(str(c), str(b))
+        # No instance dict is created until an attribute lands there
+        self.assertFalse([ref for ref in gc.get_referents(c)
+                          if type(ref) is dict])
+        self.assertEqual(c.__dict__, {})
+        c.name = "The Weeknd"
+        self.assertEqual(c.__dict__, {"name": "The Weeknd"})
+        self.assertEqual(c.to_dict()["name"], "The Weeknd")
+        self.assertIn("'name': 'The Weeknd'", str(c))
+
+    def test_init_from_dict_does_not_touch(self):
+        """Test that building an instance from its dictionary does not
+        report each attribute to the storage."""
+        d = BaseModel().to_dict()
+        with patch.object(models.storage, "touch") as touch:
+            b = BaseModel(**d)
+            BaseModel.compact()(**d)
+            self.assertEqual(touch.call_count, 0)
+            b.name = "Tems"
+            touch.assert_called_once_with(b)
+
+    def test_cached_forms(self):
+        """Test that the string form is reused until an attribute
+        changes, and that callers get their own dict."""
+        b = BaseModel()
+        string = str(b)
+        self.assertIs(str(b), string)
+        d = b.to_dict()
+        d["name"] = "Doja Cat"
+        self.assertNotIn("name", b.to_dict())
+        self.assertEqual(b.__dict__.keys(),
+                         {"id", "created_at", "updated_at"})
+        b.name = "Doja Cat"
+        self.assertIn("'name': 'Doja Cat'", str(b))
+        self.assertEqual(b.to_dict()["name"], "Doja Cat")
+        del b.name
+        self.assertNotIn("name", b.to_dict())
+        self.assertEqual(str(b), string)
+
+    def test_cached_forms_mutated_in_place(self):
+        """Test that touching an object mutated in place refreshes its
+        forms."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        b = BaseModel(id="1", created_at=datetime.now().isoformat(),
+                      updated_at=datetime.now().isoformat(), tags=[])
+        storage.new(b)
+        self.assertEqual(b.to_dict()["tags"], [])
+        b.tags.append("pop")
+        storage.touch(b)
+        self.assertEqual(b.to_dict()["tags"], ["pop"])
+        self.assertIn("['pop']", str(b))
+
 
 if __name__ == "__main__":
     unittest.main()
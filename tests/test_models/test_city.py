@@ -2,6 +2,7 @@
 """Unit tests for the `city` module.
 """
 import os
+import tempfile
 import unittest
 from models.engine.file_storage import FileStorage
 from models import storage
@@ -17,13 +18,16 @@ class TestCity(unittest.TestCase):
     """Test cases for the `City` class."""
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
+        """Resets FileStorage data and removes the temporary directory."""
         FileStorage._FileStorage__objects = {}
-        if os.path.exists(FileStorage._FileStorage__file_path):
-            os.remove(FileStorage._FileStorage__file_path)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_params(self):
         """Test method for class attributes"""
@@ -55,6 +59,12 @@ class TestCity(unittest.TestCase):
         self.assertIn('updated_at', a_dict.keys())
         self.assertNotEqual(c1, c2)
 
+    def test_kwargs_keep_attributes(self):
+        """Test that attributes given as keyword arguments are kept"""
+        c4 = City(**{**c1.to_dict(), "state_id": "s", "name": "Lagos"})
+        self.assertEqual(c4.state_id, "s")
+        self.assertEqual(c4.name, "Lagos")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,165 @@
+#!/usr/bin/python3
+"""
+Module: test_atomic_file.py
+
+Defines unittests for the functions in `models.engine.atomic_file`.
+"""
+
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+import models
+from models.engine.atomic_file import (
+    backup_path, checksum_path, recover, verify, write_atomic)
+from models.engine.file_storage import FileStorage
+from models.engine.serializers import get_serializer, read_store
+from models.user import User
+
+
+class TestAtomicFile(unittest.TestCase):
+    """Unittests for atomic writes, checksums and backups."""
+
+    def setUp(self):
+        """Writes two versions of a snapshot in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "file.json")
+        write_atomic(self.path, lambda f: f.write(b'{"a": 1}'))
+        write_atomic(self.path, lambda f: f.write(b'{"a": 2}'))
+
+    def tearDown(self):
+        """Removes the temporary directory."""
+        self.dir.cleanup()
+
+    def damage(self, path, data):
+        """Overwrites a file, keeping its modification time."""
+        stat = os.stat(path)
+        with open(path, "wb") as f:
+            f.write(data)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    def read(self, path):
+        """Returns the content of a file."""
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_write_keeps_backup(self):
+        """Test that the previous snapshot is kept, with checksums."""
+        self.assertEqual(self.read(self.path), b'{"a": 2}')
+        self.assertEqual(self.read(backup_path(self.path)), b'{"a": 1}')
+        self.assertTrue(os.path.exists(checksum_path(self.path)))
+        self.assertTrue(verify(self.path))
+        self.assertTrue(verify(backup_path(self.path)))
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+    def test_failed_write_keeps_snapshot(self):
+        """Test that a write that fails leaves the snapshot as it was."""
+        def write(f):
+            f.write(b'{"a"')
+            raise OSError("disk full")
+        with self.assertRaises(OSError):
+            write_atomic(self.path, write)
+        self.assertEqual(self.read(self.path), b'{"a": 2}')
+        self.assertTrue(verify(self.path))
+
+    def test_verify(self):
+        """Test that damaged snapshots fail verification, and snapshots
+        written by other means are not checked."""
+        self.damage(self.path, b'{"a": 3}')
+        self.assertTrue(verify(self.path, quick=True))
+        self.assertFalse(verify(self.path))
+        self.damage(self.path, b'{"a"')
+        self.assertFalse(verify(self.path, quick=True))
+        with open(self.path, "wb") as f:
+            f.write(b'{"b": 1}')
+        os.utime(self.path, ns=(0, 0))
+        self.assertTrue(verify(self.path))
+        self.assertFalse(verify(self.path + ".missing"))
+
+    def test_recover(self):
+        """Test that a damaged snapshot is replaced by its backup."""
+        self.assertFalse(recover(self.path))
+        self.damage(self.path, b'{"a": 3}')
+        self.assertFalse(recover(self.path, quick=True))
+        with self.assertWarns(RuntimeWarning):
+            self.assertTrue(recover(self.path))
+        self.assertEqual(self.read(self.path), b'{"a": 1}')
+        self.assertTrue(verify(self.path))
+
+    def test_damaged_backup_is_not_used(self):
+        """Test that a damaged backup neither replaces the snapshot nor is
+        replaced by it."""
+        self.damage(backup_path(self.path), b'{"a": 0}')
+        self.assertFalse(recover(self.path, damaged=True))
+        self.damage(self.path, b'{"a"')
+        write_atomic(self.path, lambda f: f.write(b'{"a": 4}'))
+        self.assertEqual(self.read(backup_path(self.path)), b'{"a": 0}')
+
+    def test_read_store_recovers(self):
+        """Test that an unreadable snapshot is read from its backup, and
+        raises ValueError without one."""
+        serializer = get_serializer("json")
+        with open(self.path, "wb") as f:
+            f.write(b'{"a": ')
+        with self.assertWarns(RuntimeWarning):
+            records, _ = read_store(self.path, serializer)
+        self.assertEqual(records, {"a": 1})
+        os.remove(backup_path(self.path))
+        with open(self.path, "wb") as f:
+            f.write(b'{"a": ')
+        with self.assertRaises(ValueError):
+            read_store(self.path, serializer)
+
+
+class TestFileStorageRecovery(unittest.TestCase):
+    """Unittests for the recovery of a damaged `FileStorage` file."""
+
+    def setUp(self):
+        """Creates an empty storage in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage()
+        self.storage._FileStorage__objects = {}
+        patcher = patch.object(models, "storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        """Goes back to the previous directory and removes the temporary
+        one."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_truncated_file(self):
+        """Test that a truncated file is replaced by the previous save."""
+        us = User()
+        us.save()
+        User().save()
+        with open("file.json", "r+") as f:
+            f.truncate(40)
+        with self.assertWarns(RuntimeWarning):
+            self.storage.reload()
+        self.assertEqual(list(self.storage.all()), ["User." + us.id])
+        with open("file.json") as f:
+            self.assertEqual(list(json.load(f)), ["User." + us.id])
+
+    def test_reload_skips_crc(self):
+        """Test that reloading a good file does not compute its CRC."""
+        User().save()
+        with patch("zlib.crc32") as crc32:
+            self.storage.reload()
+        crc32.assert_not_called()
+        self.assertEqual(self.storage.count(User), 1)
+
+    def test_unreadable_file_raises(self):
+        """Test that a file with no backup is not silently dropped."""
+        with open("file.json", "w") as f:
+            f.write("{")
+        with self.assertRaises(ValueError):
+            self.storage.reload()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/python3
+"""
+Module: test_bulk.py
+
+Defines unittests for the import and export functions in
+`models.engine.bulk`.
+"""
+
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from models.engine.bulk import import_records, export_records, coerce
+from models.engine.file_storage import FileStorage
+from models.place import Place
+from models.state import State
+from models.user import User
+
+
+class TestBulk(unittest.TestCase):
+    """Unittests for importing and exporting records."""
+
+    def setUp(self):
+        """Creates an empty storage in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage()
+        self.storage._FileStorage__objects = {}
+
+    def tearDown(self):
+        """Goes back to the previous directory and removes the temporary
+        one."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def write(self, name, text):
+        """Writes a file in the temporary directory."""
+        with open(name, "w") as f:
+            f.write(text)
+        return name
+
+    def test_coerce(self):
+        """Test converting values to the annotated types."""
+        self.assertEqual(coerce(Place, "number_rooms", "3"), 3)
+        self.assertEqual(coerce(Place, "number_rooms", 3.0), 3)
+        self.assertEqual(coerce(Place, "latitude", "1.5"), 1.5)
+        self.assertEqual(coerce(Place, "amenity_ids", '["a"]'), ["a"])
+        self.assertEqual(coerce(Place, "name", 12), "12")
+        self.assertEqual(coerce(Place, "color", "red"), "red")
+        self.assertIsNone(coerce(Place, "name", None))
+        self.assertIsNone(coerce(Place, "number_rooms", None))
+        for attr, value in (("number_rooms", "many"),
+                            ("number_rooms", 2.5),
+                            ("amenity_ids", '"a"')):
+            with self.assertRaises(ValueError):
+                coerce(Place, attr, value)
+
+    def test_import_csv(self):
+        """Test importing a CSV file with type conversion."""
+        path = self.write("places.csv", "id,name,number_rooms,latitude\n"
+                                        "p1,Loft,3,48.8\n"
+                                        "p2,Hut,,\n")
+        self.assertEqual(import_records(path, Place, storage=self.storage),
+                         2)
+        p1 = self.storage.get(Place, "p1")
+        self.assertEqual((p1.name, p1.number_rooms, p1.latitude),
+                         ("Loft", 3, 48.8))
+        self.assertNotIn("number_rooms", self.storage.get(
+            Place, "p2").__dict__)
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 2)
+
+    def test_import_jsonl(self):
+        """Test importing a JSON Lines file naming the record classes."""
+        path = self.write("data.jsonl",
+                          '{"__class__": "User", "email": "a@b.c"}\n\n'
+                          '{"__class__": "Place", "max_guest": "4"}\n')
+        self.assertEqual(import_records(path, storage=self.storage), 2)
+        self.assertEqual(self.storage.count(User), 1)
+        pl = list(self.storage.all(Place).values())[0]
+        self.assertEqual(pl.max_guest, 4)
+        self.assertEqual(pl.created_at, pl.updated_at)
+
+    def test_invalid_record_is_rolled_back(self):
+        """Test that an invalid record discards its batch."""
+        path = self.write("data.jsonl",
+                          '{"__class__": "User"}\n'
+                          '{"__class__": "Place", "max_guest": "x"}\n')
+        with self.assertRaisesRegex(ValueError, "data.jsonl:2"):
+            import_records(path, storage=self.storage)
+        self.assertEqual(self.storage.count(), 0)
+        for text in ('{"__class__": "Nope"}\n', '[1]\n', '{\n',
+                     '{"__class__": "User", "created_at": 5}\n',
+                     '{"__class__": "User", "updated_at": "soon"}\n'):
+            with self.assertRaises(ValueError):
+                import_records(self.write("bad.jsonl", text),
+                               storage=self.storage)
+        with self.assertRaises(ValueError):
+            import_records(self.write("user.jsonl", '{"__class__": "User"}'),
+                           Place, storage=self.storage)
+        with self.assertRaises(ValueError):
+            import_records(self.write("data.txt", ""), storage=self.storage)
+
+    def test_failed_import_keeps_caller_batch(self):
+        """Test that a failed import only takes its own records out, and
+        leaves the batch of the caller open."""
+        us = User(id="u1", email="old", created_at="2024-01-01T00:00:00",
+                  updated_at="2024-01-01T00:00:00")
+        self.storage.new(us)
+        self.storage.begin()
+        st = State(id="s1", created_at="2024-01-01T00:00:00",
+                   updated_at="2024-01-01T00:00:00")
+        self.storage.new(st)
+        path = self.write("data.jsonl",
+                          '{"__class__": "User", "id": "u1"}\n'
+                          '{"__class__": "User", "id": "u2"}\n'
+                          '{"__class__": "Nope"}\n')
+        with self.assertRaises(ValueError):
+            import_records(path, storage=self.storage)
+        self.assertIs(self.storage.get(User, "u1"), us)
+        self.assertIsNone(self.storage.get(User, "u2"))
+        self.storage.save()
+        self.storage.commit()
+        with open("file.json") as f:
+            self.assertEqual(sorted(json.load(f)), ["State.s1", "User.u1"])
+
+    def test_batch_size(self):
+        """Test that batches before an invalid record are kept."""
+        path = self.write("users.csv", "id,email\n1,a\n2,b\n3,c\n")
+        self.assertEqual(import_records(path, User, storage=self.storage,
+                                        batch_size=2), 3)
+        path = self.write("places.csv", "id,max_guest\n1,1\n2,2\n3,x\n")
+        with self.assertRaises(ValueError):
+            import_records(path, Place, storage=self.storage, batch_size=2)
+        self.assertEqual(self.storage.count(Place), 2)
+        self.assertEqual(self.storage.count(User), 3)
+
+    def test_export_round_trip(self):
+        """Test that exported files import back the same objects."""
+        path = self.write("places.csv", "id,name,amenity_ids\n"
+                                        'p1,Loft,"[""a"", ""b""]"\n')
+        import_records(path, Place, storage=self.storage)
+        before = self.storage.get(Place, "p1").to_dict()
+        for name in ("out.jsonl", "out.csv"):
+            self.assertEqual(export_records(name, storage=self.storage), 1)
+            storage = FileStorage()
+            storage._FileStorage__objects = {}
+            os.remove("file.json")
+            self.assertEqual(import_records(name, storage=storage), 1)
+            self.assertEqual(storage.get(Place, "p1").to_dict(), before)
+
+    def test_export_streams(self):
+        """Test that exporting streams the objects instead of loading
+        them all."""
+        path = self.write("users.csv", "id,email\n1,a\n2,b\n3,\n")
+        import_records(path, User, storage=self.storage)
+        with patch.object(self.storage, "all", side_effect=AssertionError):
+            for name in ("out.jsonl", "out.csv"):
+                self.assertEqual(export_records(name, User,
+                                                storage=self.storage), 3)
+        with open("out.csv") as f:
+            self.assertEqual(f.readline().strip().split(",")[0],
+                             "__class__")
+            self.assertEqual(len(f.readlines()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+"""
+Module: test_column_store.py
+
+Defines unittests for the `ColumnStore` class in
+`models.engine.column_store`.
+"""
+
+import random
+import unittest
+from unittest.mock import patch
+from models.engine import column_store
+from models.engine.column_store import ColumnStore, matches
+
+
+class TestColumnStore(unittest.TestCase):
+    """Unittests for testing the `ColumnStore` class."""
+
+    def setUp(self):
+        """Sets up a store with a few rows."""
+        self.store = ColumnStore(("price", "rooms"))
+        self.store.set("a", {"price": 50, "rooms": 1})
+        self.store.set("b", {"price": 90, "rooms": 3})
+        self.store.set("c", {"price": 150, "rooms": 4})
+
+    def test_len(self):
+        """Test the number of keys in the store."""
+        self.assertEqual(len(self.store), 3)
+
+    def test_select(self):
+        """Test selecting keys with several predicates."""
+        keys, irregular = self.store.select(
+            [("price", "<", 100), ("rooms", ">=", 3)])
+        self.assertEqual(keys, ["b"])
+        self.assertEqual(irregular, [])
+        keys, _ = self.store.select([("rooms", "!=", 3)])
+        self.assertEqual(sorted(keys), ["a", "c"])
+
+    def test_set_replaces_values(self):
+        """Test that setting a key again replaces its values."""
+        self.store.set("a", {"price": 500, "rooms": 1})
+        keys, _ = self.store.select([("price", ">", 400)])
+        self.assertEqual(keys, ["a"])
+        self.assertEqual(len(self.store), 3)
+
+    def test_remove_reuses_rows(self):
+        """Test that removed keys are not selected and rows are reused."""
+        self.store.remove("b")
+        self.store.remove("nope")
+        keys, _ = self.store.select([("price", ">", 0)])
+        self.assertEqual(sorted(keys), ["a", "c"])
+        self.store.set("d", {"price": 10, "rooms": 2})
+        keys, _ = self.store.select([("price", "<", 20)])
+        self.assertEqual(keys, ["d"])
+
+    def test_irregular_values(self):
+        """Test that non-numeric values are returned for rechecking."""
+        self.store.set("e", {"price": "cheap", "rooms": 2})
+        keys, irregular = self.store.select([("price", "<", 100)])
+        self.assertEqual(sorted(keys), ["a", "b"])
+        self.assertEqual(irregular, ["e"])
+        self.store.set("e", {"price": 20, "rooms": 2})
+        keys, irregular = self.store.select([("price", "<", 100)])
+        self.assertEqual(sorted(keys), ["a", "b", "e"])
+        self.assertEqual(irregular, [])
+
+    def test_can_select(self):
+        """Test which predicates the store can evaluate."""
+        self.assertTrue(self.store.can_select(("price", "<=", 1.5)))
+        self.assertFalse(self.store.can_select(("name", "==", 1)))
+        self.assertFalse(self.store.can_select(("price", "==", "1")))
+        self.assertFalse(self.store.can_select(("price", "~", 1)))
+
+
+class TestColumnStoreScan(unittest.TestCase):
+    """Unittests comparing `select()` with checking each object in turn,
+    with NumPy columns and with the pure Python fallback."""
+
+    PREDICATES = [
+        [("price", "<", 100)],
+        [("price", ">=", 30), ("rooms", "<=", 3)],
+        [("rooms", "==", 2)],
+        [("rooms", "!=", 2), ("price", ">", 180.5)],
+        [("price", ">", 1000)],
+    ]
+
+    def fill(self):
+        """
+        Fills a store with random rows, enough to grow its columns several
+        times, removing and replacing some of them on the way.
+
+        Returns:
+            tuple: The store and the values of each key left in it.
+        """
+        rand = random.Random(7)
+        store = ColumnStore(("price", "rooms"))
+        values = {}
+        for i in range(300):
+            key = str(i)
+            values[key] = {"price": rand.uniform(0, 200),
+                           "rooms": rand.randint(1, 5)}
+            store.set(key, values[key])
+            if i % 7 == 6:
+                gone = rand.choice(sorted(values))
+                store.remove(gone)
+                del values[gone]
+            if i % 11 == 10:
+                key = rand.choice(sorted(values))
+                values[key] = {"price": rand.uniform(0, 200), "rooms": 9}
+                store.set(key, values[key])
+        return store, values
+
+    def check(self):
+        """Compares every selection with the matching values."""
+        store, values = self.fill()
+        self.assertEqual(len(store), len(values))
+        for predicates in self.PREDICATES:
+            keys, irregular = store.select(predicates)
+            expected = [key for key, attrs in values.items()
+                        if matches(type("Row", (), attrs), predicates)]
+            self.assertEqual(sorted(keys), sorted(expected), predicates)
+            self.assertEqual(irregular, [])
+
+    @unittest.skipUnless(column_store.numpy, "NumPy is not installed")
+    def test_numpy(self):
+        """Test selecting from NumPy columns."""
+        self.check()
+
+    def test_fallback(self):
+        """Test selecting from `array` columns, without NumPy."""
+        with patch.object(column_store, "numpy", None):
+            self.check()
+
+
+if __name__ == "__main__":
+    unittest.main()
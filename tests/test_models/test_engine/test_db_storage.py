@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+Module: test_db_storage.py
+
+Defines unittests for the `DBStorage` class in `models.engine.db_storage`.
+"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+import models
+from models.engine.db_storage import DBStorage
+from models.user import User
+from models.place import Place
+from models.review import Review
+
+
+class TestDBStorage(unittest.TestCase):
+    """Unittests for testing the `DBStorage` class."""
+
+    def setUp(self):
+        """Creates a database storage in a temporary directory and makes
+        it the storage the models report to."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "file.db")
+        self.storage = DBStorage(self.path)
+        self.storage.reload()
+        patcher = patch.object(models, "storage", self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pl = Place()
+        self.pl.city_id = "c"
+        self.pl.price_by_night = 80
+        self.pl.latitude = 48.8566
+        self.pl.longitude = 2.3522
+        self.rv = Review()
+        self.rv.place_id = self.pl.id
+        self.storage.save()
+
+    def tearDown(self):
+        """Removes the temporary directory."""
+        self.dir.cleanup()
+
+    def reopened(self):
+        """Returns another storage on the same database."""
+        storage = DBStorage(self.path)
+        storage.reload()
+        return storage
+
+    def test_tables(self):
+        """Test that each class has a table with indexed foreign keys."""
+        db = sqlite3.connect(self.path)
+        columns = {row[1] for row in db.execute('PRAGMA table_info("Review")')}
+        self.assertEqual(columns, {"id", "data", "place_id", "user_id"})
+        indexes = {row[1] for row in db.execute('PRAGMA index_list("Place")')}
+        self.assertIn("Place_city_id", indexes)
+        self.assertIn("Place_spatial", indexes)
+        db.close()
+
+    def test_save_and_reload(self):
+        """Test that saved objects are read back from the database."""
+        storage = self.reopened()
+        pl = storage.get(Place, self.pl.id)
+        self.assertEqual(pl.to_dict(), self.pl.to_dict())
+        self.assertIs(storage.get("Place", self.pl.id), pl)
+        self.assertIsNone(storage.get(Place, "nope"))
+        self.assertEqual(storage.count(), 2)
+        self.assertEqual(storage.count(Review), 1)
+        self.assertEqual(list(storage.all(Review)), ["Review." + self.rv.id])
+
+    def test_unsaved_changes(self):
+        """Test that changes are visible at once and rolled back by
+        'reload'."""
+        us = User()
+        self.pl.name = "Loft"
+        self.assertIs(self.storage.all()["User." + us.id], us)
+        self.assertIsNone(self.reopened().get(User, us.id))
+        self.storage.reload()
+        self.assertIsNone(self.storage.get(User, us.id))
+        self.assertEqual(self.storage.get(Place, self.pl.id).name, "")
+
+    def test_delete(self):
+        """Test that deleted objects are removed on save."""
+        self.storage.delete(self.rv)
+        self.storage.delete(None)
+        self.assertIsNone(self.storage.get(Review, self.rv.id))
+        self.assertEqual(self.storage.count(Review), 0)
+        self.storage.save()
+        self.assertIsNone(self.reopened().get(Review, self.rv.id))
+
+    def test_generation(self):
+        """Test that the generation changes with the objects stored here
+        and with the changes other connections commit."""
+        generation = self.storage.generation
+        self.assertEqual(self.storage.generation, generation)
+        other = self.reopened()
+        with patch.object(models, "storage", other):
+            User()
+            other.save()
+        self.assertNotEqual(self.storage.generation, generation)
+        generation = self.storage.generation
+        self.assertEqual(self.storage.count(User), 1)
+        self.assertEqual(self.storage.generation, generation)
+        User()
+        self.assertNotEqual(self.storage.generation, generation)
+
+    def test_find(self):
+        """Test finding objects by foreign key and other attributes."""
+        found = self.reopened().find(Review, place_id=self.pl.id)
+        self.assertEqual(list(found), ["Review." + self.rv.id])
+        self.assertEqual(self.storage.find(Review, place_id="other"), {})
+        self.assertEqual(len(self.storage.find(Place, city_id="c",
+                                               name="")), 1)
+        self.assertEqual(self.storage.find(Place, amenity_ids=["a"]), {})
+
+    def test_where(self):
+        """Test comparisons evaluated in SQL and on the objects."""
+        pl = Place()
+        pl.price_by_night = "cheap"
+        self.assertEqual(list(self.storage.where(
+            Place, ("price_by_night", "<", 100))), ["Place." + self.pl.id])
+        self.assertEqual(len(self.storage.where(
+            Place, ("price_by_night", "!=", 80))), 1)
+        self.assertEqual(len(self.storage.where(
+            Place, ("name", "==", ""), ("max_guest", ">=", 0))), 2)
+        with self.assertRaises(ValueError):
+            self.storage.where(Place, ("price_by_night", "~", 1))
+
+    def test_near_and_within(self):
+        """Test spatial queries."""
+        far = Place()
+        far.latitude, far.longitude = 40.7128, -74.0060
+        self.assertEqual(list(self.storage.near(Place, 48.86, 2.35, 10)),
+                         ["Place." + self.pl.id])
+        self.assertEqual(len(self.storage.near(Place, 48.86, 2.35, 6000)), 2)
+        self.assertEqual(list(self.storage.within(Place, 40, -80, 41, -70)),
+                         ["Place." + far.id])
+        self.assertEqual(self.storage.near(Review, 0, 0, 10), {})
+
+    def test_new_column_is_filled(self):
+        """Test that columns added to a class are filled for old rows."""
+        with patch.object(Review, "_indexed_attrs",
+                          ("place_id", "user_id", "text")):
+            storage = self.reopened()
+            found = storage.find(Review, text="")
+        self.assertEqual(list(found), ["Review." + self.rv.id])
+
+    def test_batch(self):
+        """Test that a batch is committed as one transaction, or rolled
+        back."""
+        with self.storage.batch():
+            us = User()
+            us.save()
+            self.assertIsNone(self.reopened().get(User, us.id))
+        self.assertIsNotNone(self.reopened().get(User, us.id))
+        with self.assertRaises(KeyError):
+            with self.storage.batch():
+                self.storage.delete(self.rv)
+                self.storage.save()
+                raise KeyError("boom")
+        self.assertIsNotNone(self.storage.get(Review, self.rv.id))
+        with self.assertRaises(RuntimeError):
+            self.storage.commit()
+
+
+    def test_stream(self):
+        """Test that 'stream' reads the rows page by page, in id order,
+        and resumes after a key."""
+        self.storage.page_size = 2
+        users = sorted((User() for _ in range(5)), key=lambda us: us.id)
+        keys = ["User." + us.id for us in users]
+        self.assertEqual(list(self.storage.stream(User)),
+                         [(k, us) for k, us in zip(keys, users)])
+        self.assertEqual([k for k, _ in self.storage.stream(User, keys[1])],
+                         keys[2:])
+        self.storage.delete(users[3])
+        self.assertEqual([k for k, _ in self.storage.stream(after=keys[1])],
+                         [keys[2], keys[4], "Place." + self.pl.id,
+                          "Review." + self.rv.id])
+        self.assertEqual(len(list(self.storage.stream())), 6)
+
+
+    def test_explain(self):
+        """Test that 'explain' reports the SQLite plan and the rows."""
+        plan = self.storage.explain(Place, ("city_id", "==", "c"),
+                                    ("price_by_night", "<", 100))
+        self.assertEqual(plan.path, "sql")
+        self.assertIn("Place_city_id", plan.detail)
+        self.assertEqual((plan.examined, plan.rows), (1, 1))
+        self.assertIsNone(plan.estimated)
+        self.assertEqual(self.storage.explain("Nope").rows, 0)
+        with self.assertRaises(ValueError):
+            self.storage.explain(Place, ("price_by_night", "~", 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
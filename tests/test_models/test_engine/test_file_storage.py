@@ -6,9 +6,20 @@ Defines unittests for the `FileStorage` class in `models.engine.file_storage`.
 """
 
 import os
+import sys
+import json
+import time
+import shutil
+import tempfile
 import unittest
+import threading
+import subprocess
+from unittest.mock import patch
+import models
 from models.base_model import BaseModel
+from models.engine import column_store
 from models.engine.file_storage import FileStorage
+from models.engine.shards import bucket_of
 from models.user import User
 from models.state import State
 from models.place import Place
@@ -46,13 +57,16 @@ class TestFileStorageMethods(unittest.TestCase):
     """Unittests for testing methods of the `FileStorage` class."""
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data after each test."""
+        """Resets FileStorage data and removes the temporary directory."""
         FileStorage._FileStorage__objects = {}
-        if os.path.exists(FileStorage._FileStorage__file_path):
-            os.remove(FileStorage._FileStorage__file_path)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_all(self):
         """Test the 'all' method."""
@@ -60,10 +74,224 @@ class TestFileStorageMethods(unittest.TestCase):
 
     def test_all_with_arg(self):
         """Test the 'all' method with an argument."""
+        self.assertIs(models.storage.all(None), models.storage.all())
         with self.assertRaises(TypeError):
-            models.storage.all(None)
+            models.storage.all(None, None)
+
+    def test_all_by_class(self):
+        """Test the 'all' method filtered by class."""
+        us = User()
+        st = State()
+        users = models.storage.all(User)
+        self.assertIs(users["User." + us.id], us)
+        self.assertNotIn("State." + st.id, users)
+        self.assertTrue(all(type(v) is User for v in users.values()))
+        self.assertIs(models.storage.all("State")["State." + st.id], st)
+        self.assertEqual(models.storage.all("Nope"), {})
+        models.storage.delete(us)
+        self.assertNotIn("User." + us.id, models.storage.all(User))
+
+    def test_count(self):
+        """Test the 'count' method."""
+        users = models.storage.count(User)
+        states = models.storage.count("State")
+        User()
+        User()
+        State()
+        self.assertEqual(models.storage.count(), len(models.storage.all()))
+        self.assertEqual(models.storage.count(User), users + 2)
+        self.assertEqual(models.storage.count("State"), states + 1)
+        self.assertEqual(models.storage.count("Nope"), 0)
+
+    def test_stream(self):
+        """Test that 'stream' yields the objects by class, and resumes
+        after a key."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        users = [User() for _ in range(3)]
+        st = State()
+        for obj in users + [st]:
+            storage.new(obj)
+        keys = ["User." + us.id for us in users]
+        self.assertEqual(list(storage.stream(User)),
+                         [(k, us) for k, us in zip(keys, users)])
+        self.assertEqual([k for k, _ in storage.stream(User, keys[0])],
+                         keys[1:])
+        self.assertEqual([k for k, _ in storage.stream(after=keys[2])],
+                         ["State." + st.id])
+        self.assertEqual(len(list(storage.stream())), 4)
+        self.assertEqual(list(storage.stream("Nope")), [])
+        with self.assertRaises(KeyError):
+            next(storage.stream(User, "User.nope"))
+
+    def test_count_after_reload(self):
+        """Test that the class index follows reload."""
+        us = User()
+        models.storage.save()
+        users = models.storage.count(User)
+        models.storage.delete(us)
+        self.assertEqual(models.storage.count(User), users - 1)
+        models.storage.reload()
+        self.assertEqual(models.storage.count(User), users)
+
+    def test_find(self):
+        """Test the 'find' method on indexed and plain attributes."""
+        pl = Place()
+        rv1 = Review()
+        rv2 = Review()
+        rv1.place_id = pl.id
+        rv2.place_id = pl.id
+        rv2.text = "Great"
+        self.assertEqual(models.storage.find(Review, place_id=pl.id),
+                         {"Review." + rv1.id: rv1, "Review." + rv2.id: rv2})
+        self.assertEqual(
+            models.storage.find("Review", place_id=pl.id, text="Great"),
+            {"Review." + rv2.id: rv2})
+        self.assertEqual(models.storage.find(Review, text="Great"),
+                         {"Review." + rv2.id: rv2})
+        self.assertEqual(models.storage.find(Review, place_id="nope"), {})
+
+    def test_where(self):
+        """Test the 'where' method, with and without indexed attributes."""
+        pl1 = Place()
+        pl2 = Place()
+        pl1.city_id = pl2.city_id = "where-city"
+        pl1.price_by_night = 50
+        pl2.price_by_night = 150
+        self.assertEqual(
+            models.storage.where(Place, ("city_id", "==", "where-city"),
+                                 ("price_by_night", "<", 100)),
+            {"Place." + pl1.id: pl1})
+        self.assertEqual(
+            models.storage.where(Place, ("price_by_night", ">", 100),
+                                 ("city_id", "==", "where-city")),
+            {"Place." + pl2.id: pl2})
+        self.assertEqual(
+            models.storage.where(Place, ("city_id", "==", "nope")), {})
+        with self.assertRaises(ValueError):
+            models.storage.where(Place, ("price_by_night", "~", 1))
+        pl1.amenity_ids = ["where-amenity"]
+        self.assertEqual(
+            models.storage.where(Place, ("amenity_ids", "==",
+                                         ["where-amenity"])),
+            {"Place." + pl1.id: pl1})
+        self.assertEqual(
+            models.storage.where(Place, ("city_id", "==", "where-city"),
+                                 ("amenity_ids", "!=", [])),
+            {"Place." + pl1.id: pl1})
+
+    def test_explain(self):
+        """Test that 'explain' picks the cheapest access path and reports
+        the actual rows."""
+        storage = FileStorage(columnar=True)
+        storage._FileStorage__objects = {}
+        places = [Place(id=str(i), city_id="c{}".format(i % 10),
+                        price_by_night=i, latitude=i / 10, longitude=0.0,
+                        created_at="2024-01-01T00:00:00",
+                        updated_at="2024-01-01T00:00:00")
+                  for i in range(100)]
+        for pl in places:
+            storage.new(pl)
+        plan = storage.explain(Place, ("price_by_night", "<", 50),
+                               ("city_id", "==", "c3"))
+        self.assertEqual((plan.path, plan.cost, plan.rows), ("index", 10, 5))
+        self.assertAlmostEqual(plan.estimated, 5, delta=1)
+        self.assertEqual({p.path for p in plan.rejected},
+                         {"columns", "scan"})
+        plan = storage.explain(Place, ("latitude", ">=", 2),
+                               ("latitude", "<", 2.5))
+        self.assertEqual((plan.path, plan.rows), ("spatial", 5))
+        self.assertLess(plan.examined, 20)
+        plan = storage.explain(Place, ("price_by_night", ">=", 10))
+        # Comparing whole columns only beats a scan with NumPy
+        if column_store.numpy is None:
+            self.assertEqual((plan.path, plan.examined), ("scan", 100))
+        else:
+            self.assertEqual((plan.path, plan.examined), ("columns", 90))
+        self.assertEqual(plan.rows, 90)
+        self.assertAlmostEqual(plan.estimated, 90, delta=1)
+        self.assertEqual(storage.explain(Place, ("city_id", "==", "x")).rows,
+                         0)
+        self.assertEqual(
+            storage.where(Place, ("latitude", ">=", 2),
+                          ("latitude", "<", 2.5)),
+            {"Place." + pl.id: pl for pl in places[20:25]})
+        far = Place(id="far", latitude=95.0, longitude=200.0,
+                    created_at="2024-01-01T00:00:00",
+                    updated_at="2024-01-01T00:00:00")
+        storage.new(far)
+        plan = storage.explain(Place, ("latitude", ">", 60))
+        self.assertEqual((plan.path, plan.rows), ("spatial", 1))
+        self.assertEqual(storage.where(Place, ("longitude", ">", 190)),
+                         {"Place.far": far})
+
+    def test_spatial_plan_matches_scan(self):
+        """Test that the spatial plan finds what a scan finds, with
+        coordinates out of range or stored as strings."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        coordinates = [(i / 2, i / 3) for i in range(40)] + \
+            [(10.0, "3.3"), ("7", 4.0), (95.0, 200.0), (-95.0, -3.0)]
+        for i, (lat, lon) in enumerate(coordinates):
+            storage.new(Place(id=str(i), latitude=lat, longitude=lon,
+                              created_at="2024-01-01T00:00:00",
+                              updated_at="2024-01-01T00:00:00"))
+        places = storage.all(Place)
+        for predicates in ([("latitude", ">", 5)],
+                           [("latitude", ">", 60)],
+                           [("longitude", "<", 5), ("latitude", ">=", 9)],
+                           [("latitude", "==", 10.0)]):
+            plan = storage.explain(Place, *predicates)
+            self.assertEqual(plan.path, "spatial", predicates)
+            self.assertEqual(
+                storage.where(Place, *predicates),
+                {k: v for k, v in places.items()
+                 if column_store.matches(v, predicates)}, predicates)
+
+    def test_query_structures_built_on_first_query(self):
+        """Test that the spatial index and statistics of a class are only
+        built by its first spatial query or where(), then kept up to
+        date."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        pl = Place(id="1", latitude=6.5, longitude=3.4,
+                   created_at="2024-01-01T00:00:00",
+                   updated_at="2024-01-01T00:00:00")
+        storage.new(pl)
+        storage.all(Place)
+        self.assertEqual(storage._FileStorage__grids, {})
+        stats = storage._FileStorage__stats
+        self.assertIsNone(stats.bounds("Place", "latitude"))
+        self.assertEqual(list(storage.within(Place, 6, 3, 7, 4)),
+                         ["Place.1"])
+        self.assertEqual(stats.bounds("Place", "latitude"), (6.5, 6.5))
+        with patch.object(models, "storage", storage):
+            pl.latitude = 9.5
+        self.assertEqual(list(storage.within(Place, 9, 3, 10, 4)),
+                         ["Place.1"])
+        self.assertEqual(stats.bounds("Place", "latitude"), (6.5, 9.5))
+        self.assertEqual(storage.where(Review, ("place_id", "==", "1")), {})
+
+    def test_find_follows_updates(self):
+        """Test that attribute indexes follow updates and deletes."""
+        cy = City()
+        cy.state_id = "a"
+        cy.state_id = "b"
+        self.assertEqual(models.storage.find(City, state_id="a"), {})
+        self.assertIn("City." + cy.id, models.storage.find(City, state_id="b"))
+        models.storage.delete(cy)
+        self.assertEqual(models.storage.find(City, state_id="b"), {})
+
+    def test_find_after_reload(self):
+        """Test that attribute indexes are rebuilt by reload."""
+        pl = Place()
+        pl.user_id = "u"
+        models.storage.save()
+        models.storage.reload()
+        self.assertIn("Place." + pl.id,
+                      models.storage.find(Place, user_id="u"))
+
 
-    def test_new(self):
         """Test the 'new' method."""
         bm = BaseModel()
         us = User()
@@ -160,4 +388,837 @@ class TestFileStorageMethods(unittest.TestCase):
         self.assertIn("User." + us.id, objs)
         self.assertIn("State." + st.id, objs)
         self.assertIn("Place." + pl.id, objs)
-        self.assertIn("City." + cy.id, objs
+        self.assertIn("City." + cy.id, objs)
+        self.assertIn("Amenity." + am.id, objs)
+        self.assertIn("Review." + rv.id, objs)
+
+    def test_generation(self):
+        """Test that the generation changes with the stored objects."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        us = User()
+        generations = [storage.generation]
+        storage.new(us)
+        generations.append(storage.generation)
+        self.assertEqual(storage.generation, generations[-1])
+        storage.touch(us)
+        generations.append(storage.generation)
+        storage.delete(us)
+        generations.append(storage.generation)
+        storage._FileStorage__objects = {}
+        generations.append(storage.generation)
+        self.assertEqual(len(set(generations)), 5)
+
+    def test_reload_with_arg(self):
+        """Test the 'reload' method with an argument."""
+        with self.assertRaises(TypeError):
+            models.storage.reload(None)
+
+    def test_delete(self):
+        """Test the 'delete' method."""
+        us = User()
+        models.storage.delete(us)
+        self.assertNotIn("User." + us.id, models.storage.all())
+        models.storage.delete(None)
+
+    def test_save_reencodes_only_modified(self):
+        """Test that save only serializes objects changed since last save."""
+        us = User()
+        st = State()
+        models.storage.save()
+        us.first_name = "Ada"
+        with patch.object(State, "to_dict") as st_to_dict:
+            models.storage.save()
+            st_to_dict.assert_not_called()
+        with open("file.json", "r") as f:
+            saved = json.load(f)
+        self.assertEqual(saved["User." + us.id]["first_name"], "Ada")
+        self.assertEqual(saved["State." + st.id], st.to_dict())
+
+    def test_reload_compact_models(self):
+        """Test that reload can create compact objects."""
+        pl = Place()
+        pl.name = "Home"
+        models.storage.save()
+        storage = FileStorage(compact_models=True)
+        storage._FileStorage__objects = {}
+        storage.reload()
+        reloaded = storage.get(Place, pl.id)
+        self.assertIs(type(reloaded), Place.compact())
+        self.assertEqual(reloaded.to_dict(), pl.to_dict())
+
+
+class TestFileStorageJournal(unittest.TestCase):
+    """Unittests for the journal mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Sets up a journaled storage in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage(journal=True)
+        self.journal_path = FileStorage._FileStorage__file_path + ".log"
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_first_save_writes_snapshot(self):
+        """Test that the first save writes a full snapshot."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        self.assertTrue(os.path.isfile("file.json"))
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def test_save_appends_changes(self):
+        """Test that later saves only append the changed records."""
+        us = User()
+        st = State()
+        self.storage.new(us)
+        self.storage.new(st)
+        self.storage.save()
+        with open("file.json", "r") as f:
+            snapshot = f.read()
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.save()
+        with open("file.json", "r") as f:
+            self.assertEqual(f.read(), snapshot)
+        with open(self.journal_path, "r") as f:
+            lines = f.readlines()
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(json.loads(lines[0]), {"op": "begin"})
+        self.assertIn("User." + us.id, lines[1])
+        self.assertNotIn("State." + st.id, lines[1])
+        self.assertEqual(json.loads(lines[2]), {"op": "commit"})
+
+    def test_reload_replays_journal(self):
+        """Test that reload applies the journal on top of the snapshot."""
+        us = User()
+        st = State()
+        self.storage.new(us)
+        self.storage.new(st)
+        self.storage.save()
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.delete(st)
+        cy = City()
+        self.storage.new(cy)
+        self.storage.save()
+        self.storage.reload()
+        objs = self.storage.all()
+        self.assertEqual(objs["User." + us.id].first_name, "Ada")
+        self.assertNotIn("State." + st.id, objs)
+        self.assertIn("City." + cy.id, objs)
+
+    def test_reload_ignores_torn_entry(self):
+        """Test that a truncated last journal entry is ignored."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.save()
+        with open(self.journal_path, "a") as f:
+            f.write('{"op": "set", "key": "User.')
+        self.storage.reload()
+        self.assertEqual(
+            self.storage.all()["User." + us.id].first_name, "Ada")
+
+    def test_reload_ignores_uncommitted_save(self):
+        """Test that a save cut short before its commit marker is ignored
+        as a whole."""
+        us = User()
+        st = State()
+        self.storage.new(us)
+        self.storage.new(st)
+        self.storage.save()
+        us.first_name = "Ada"
+        st.name = "Lagos"
+        self.storage.touch(us)
+        self.storage.touch(st)
+        self.storage.save()
+        with open(self.journal_path, "r") as f:
+            lines = f.readlines()
+        with open(self.journal_path, "w") as f:
+            f.writelines(lines[:2])
+        self.storage.reload()
+        objects = self.storage.all()
+        self.assertNotIn("first_name", objects["User." + us.id].to_dict())
+        self.assertNotIn("name", objects["State." + st.id].to_dict())
+
+    def test_full_save_drops_journal(self):
+        """Test that a full rewrite folds the journal into the snapshot."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.save()
+        FileStorage().save()
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.storage.reload()
+        self.assertEqual(
+            self.storage.all()["User." + us.id].first_name, "Ada")
+
+
+    def test_compact(self):
+        """Test that compact folds the journal into the snapshot."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.save()
+        self.storage.compact()
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(os.path.exists(self.journal_path + ".old"))
+        with open("file.json", "r") as f:
+            self.assertIn("Ada", f.read())
+
+    def test_compact_in_background(self):
+        """Test that saves during a background compaction are kept."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.save()
+        writer = self.storage.compact(background=True)
+        us.last_name = "Lovelace"
+        self.storage.touch(us)
+        self.storage.save()
+        writer.join()
+        self.storage.reload()
+        user = self.storage.all()["User." + us.id]
+        self.assertEqual(user.first_name, "Ada")
+        self.assertEqual(user.last_name, "Lovelace")
+
+    def test_compact_threshold(self):
+        """Test that the journal is compacted once it is large enough."""
+        storage = FileStorage(journal=True, compact_threshold=2)
+        us = User()
+        storage.new(us)
+        storage.save()
+        for name in ("Ada", "Grace"):
+            us.first_name = name
+            storage.touch(us)
+            storage.save()
+        storage.reload()
+        self.assertFalse(os.path.exists(self.journal_path))
+        with open("file.json", "r") as f:
+            self.assertIn("Grace", f.read())
+
+
+class TestFileStorageLazy(unittest.TestCase):
+    """Unittests for the lazy mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Saves a few objects in a temporary directory and reloads them
+        lazily."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.pl = Place()
+        self.pl.city_id = "c"
+        self.us = User()
+        self.rv = Review()
+        self.rv.place_id = self.pl.id
+        with open("file.json", "w") as f:
+            json.dump({"{}.{}".format(type(o).__name__, o.id): o.to_dict()
+                       for o in (self.pl, self.us, self.rv)}, f)
+        self.storage = FileStorage(lazy=True)
+        self.storage._FileStorage__objects = {}
+        self.storage.reload()
+
+    def tearDown(self) -> None:
+        """Resets FileStorage data and removes the temporary directory."""
+        FileStorage._FileStorage__objects = {}
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def materialized(self):
+        """Returns the keys of the objects created so far."""
+        return set(self.storage._FileStorage__objects)
+
+    def test_reload_creates_no_objects(self):
+        """Test that a lazy reload only indexes the records."""
+        self.assertEqual(self.materialized(), set())
+        self.assertEqual(self.storage.count(Place), 1)
+        self.assertEqual(self.storage.count(), 3)
+
+    def test_get_materializes_one_object(self):
+        """Test that 'get' only creates the requested object."""
+        us = self.storage.get(User, self.us.id)
+        self.assertIsInstance(us, User)
+        self.assertEqual(us.id, self.us.id)
+        self.assertIs(self.storage.get(User, self.us.id), us)
+        self.assertEqual(self.materialized(), {"User." + self.us.id})
+
+    def test_find_uses_raw_records(self):
+        """Test that indexes cover records that were not created yet."""
+        found = self.storage.find(Review, place_id=self.pl.id)
+        self.assertEqual(list(found), ["Review." + self.rv.id])
+        self.assertNotIn("Place." + self.pl.id, self.materialized())
+        self.assertEqual(len(self.storage.find(Place, city_id="c")), 1)
+
+    def test_all_materializes_everything(self):
+        """Test that 'all' creates every object."""
+        self.assertEqual(len(self.storage.all(User)), 1)
+        self.assertEqual(self.materialized(), {"User." + self.us.id})
+        self.assertEqual(len(self.storage.all()), 3)
+        self.assertEqual(len(self.materialized()), 3)
+
+    def test_stream_materializes_as_it_goes(self):
+        """Test that 'stream' only creates the objects it has yielded."""
+        stream = self.storage.stream()
+        key, obj = next(stream)
+        self.assertEqual(self.materialized(), {key})
+        self.assertEqual(len(list(stream)), 2)
+        self.assertEqual(len(self.materialized()), 3)
+
+    def test_save_keeps_raw_records(self):
+        """Test that records never accessed are saved back."""
+        with open("file.json", "r") as f:
+            before = json.load(f)
+        self.storage.get(User, self.us.id).first_name = "Ada"
+        self.storage.save()
+        with open("file.json", "r") as f:
+            after = json.load(f)
+        self.assertEqual(after.keys(), before.keys())
+        self.assertEqual(after["Place." + self.pl.id],
+                         before["Place." + self.pl.id])
+        self.assertEqual(after["User." + self.us.id]["first_name"], "Ada")
+
+
+class TestFileStorageMapped(unittest.TestCase):
+    """Unittests for the mapped mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Saves a few objects to a mapped store in a temporary directory
+        and maps it again."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        storage = FileStorage(mapped=True)
+        storage._FileStorage__objects = {}
+        self.pl = Place()
+        self.pl.city_id = "c"
+        self.us = User()
+        self.rv = Review()
+        self.rv.place_id = self.pl.id
+        for obj in (self.pl, self.us, self.rv):
+            storage.new(obj)
+        storage.save()
+        self.storage = FileStorage(mapped=True)
+        self.storage._FileStorage__objects = {}
+        self.storage.reload()
+
+    def tearDown(self) -> None:
+        """Removes the temporary directory."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def materialized(self):
+        """Returns the keys of the objects created so far."""
+        return set(self.storage._FileStorage__objects)
+
+    def test_mapped_requires_binary(self):
+        """Test that mapped mode only supports the binary format."""
+        with self.assertRaises(ValueError):
+            FileStorage(mapped=True, format="json")
+
+    def test_get_reads_one_record(self):
+        """Test that 'get' builds no index and creates one object."""
+        us = self.storage.get(User, self.us.id)
+        self.assertEqual(us.to_dict(), self.us.to_dict())
+        self.assertIsNone(self.storage.get(User, "nope"))
+        self.assertEqual(self.materialized(), {"User." + self.us.id})
+        self.assertIsNone(self.storage._FileStorage__indexed)
+        self.assertEqual(self.storage.count(), 3)
+
+    def test_queries_build_indexes(self):
+        """Test that queries see the records of the snapshot."""
+        self.assertEqual(self.storage.count(Place), 1)
+        found = self.storage.find(Review, place_id=self.pl.id)
+        self.assertEqual(list(found), ["Review." + self.rv.id])
+
+    def test_update_and_destroy_are_journaled(self):
+        """Test that changes are appended to the journal and survive."""
+        size = os.path.getsize("file.bin")
+        us = self.storage.get(User, self.us.id)
+        us.first_name = "Ada"
+        self.storage.touch(us)  # Models report to models.storage
+        self.storage.delete(self.storage.get(Review, self.rv.id))
+        self.storage.save()
+        self.assertEqual(os.path.getsize("file.bin"), size)
+        self.assertTrue(os.path.exists("file.bin.log"))
+        storage = FileStorage(mapped=True)
+        storage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(User, self.us.id).first_name, "Ada")
+        self.assertIsNone(storage.get(Review, self.rv.id))
+        self.assertEqual(storage.count(), 2)
+
+    def test_compact_rewrites_index(self):
+        """Test that compaction folds the journal into the mapped file."""
+        us = self.storage.get(User, self.us.id)
+        us.first_name = "Ada"
+        self.storage.touch(us)
+        self.storage.save()
+        self.storage.compact()
+        self.assertFalse(os.path.exists("file.bin.log"))
+        storage = FileStorage(mapped=True)
+        storage._FileStorage__objects = {}
+        storage.reload()
+        self.assertEqual(storage.get(User, self.us.id).first_name, "Ada")
+        self.assertEqual(storage.get(Place, self.pl.id).city_id, "c")
+
+
+    def test_reload_unmaps_previous_snapshot(self):
+        """Test that reloading and rolling back close the mapped file they
+        replace."""
+        for replace in (self.storage.reload, self.storage.rollback):
+            records = self.storage._FileStorage__raw
+            with patch.object(records, "close",
+                              wraps=records.close) as close:
+                replace()
+            close.assert_called_once_with()
+            self.assertIsNot(self.storage._FileStorage__raw, records)
+            self.assertEqual(self.storage.count(), 3)
+
+
+class TestFileStorageBatch(unittest.TestCase):
+    """Unittests for the batches of the `FileStorage` class."""
+
+    def setUp(self):
+        """Creates a storage in an empty temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage()
+        self.storage._FileStorage__objects = {}
+
+    def tearDown(self) -> None:
+        """Removes the temporary directory."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_batch_saves_once(self):
+        """Test that saves within a batch happen when it ends."""
+        with patch.object(FileStorage, "_FileStorage__encode_all",
+                          autospec=True,
+                          side_effect=FileStorage._FileStorage__encode_all
+                          ) as encode_all:
+            with self.storage.batch():
+                for _ in range(3):
+                    self.storage.new(User())
+                    self.storage.save()
+                self.assertFalse(os.path.exists("file.json"))
+            self.assertEqual(encode_all.call_count, 1)
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 3)
+
+    def test_nested_batches(self):
+        """Test that only the outermost batch saves."""
+        self.storage.begin()
+        self.storage.begin()
+        self.storage.new(User())
+        self.storage.save()
+        self.storage.commit()
+        self.assertFalse(os.path.exists("file.json"))
+        self.storage.commit()
+        self.assertTrue(os.path.exists("file.json"))
+        with self.assertRaises(RuntimeError):
+            self.storage.commit()
+
+    def test_failed_batch_is_rolled_back(self):
+        """Test that a batch that raises saves nothing and discards its
+        changes."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        with self.assertRaises(KeyError):
+            with self.storage.batch():
+                self.storage.delete(us)
+                self.storage.new(User())
+                self.storage.save()
+                raise KeyError("boom")
+        with open("file.json") as f:
+            self.assertEqual(list(json.load(f)), ["User." + us.id])
+        self.assertEqual(list(self.storage.all()), ["User." + us.id])
+        self.assertIsNone(self.storage.compact())
+
+
+class TestFileStorageWriteBehind(unittest.TestCase):
+    """Unittests for the write-behind mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Creates a write-behind storage in an empty temporary
+        directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage(write_delay=0.05)
+        self.storage._FileStorage__objects = {}
+
+    def tearDown(self) -> None:
+        """Writes what is left to write, then removes the temporary
+        directory."""
+        self.storage.flush()
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_saves_are_coalesced(self):
+        """Test that a burst of saves is written once, after the delay."""
+        with patch.object(FileStorage, "_FileStorage__encode_all",
+                          autospec=True,
+                          side_effect=FileStorage._FileStorage__encode_all
+                          ) as encode_all:
+            for _ in range(3):
+                self.storage.new(User())
+                self.storage.save()
+            self.assertFalse(os.path.exists("file.json"))
+            deadline = time.time() + 5
+            while not os.path.exists("file.json") and time.time() < deadline:
+                time.sleep(0.01)
+            self.storage.flush()
+            self.assertEqual(encode_all.call_count, 1)
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 3)
+
+    def test_flush(self):
+        """Test that flush() writes the saved changes at once."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        self.storage.flush()
+        with open("file.json") as f:
+            self.assertEqual(list(json.load(f)), ["User." + us.id])
+
+    def test_reload_and_batch_write_first(self):
+        """Test that saved changes survive a reload or a rolled back
+        batch."""
+        us = User()
+        self.storage.new(us)
+        self.storage.save()
+        self.storage.reload()
+        self.assertEqual(list(self.storage.all()), ["User." + us.id])
+        self.storage.delete(us)
+        self.storage.save()
+        with self.assertRaises(KeyError):
+            with self.storage.batch():
+                self.storage.new(User())
+                raise KeyError("boom")
+        self.assertEqual(self.storage.all(), {})
+
+    def test_write_error_is_raised(self):
+        """Test that a failed background write is raised by the next save
+        and retried."""
+        self.storage.new(User())
+        with patch.object(FileStorage, "_FileStorage__write_snapshot",
+                          side_effect=OSError("disk full")):
+            self.storage.save()
+            deadline = time.time() + 5
+            while (self.storage._FileStorage__write_error is None and
+                   time.time() < deadline):
+                time.sleep(0.01)
+        with self.assertRaises(OSError):
+            self.storage.save()
+        self.storage.flush()
+        with open("file.json") as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+
+class TestFileStorageShared(unittest.TestCase):
+    """Unittests for the shared mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+
+    def tearDown(self):
+        """Goes back to the previous directory and removes the temporary
+        one."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def storages(self, **options):
+        """Returns two shared storages on the same file, as two processes
+        would use it."""
+        storages = []
+        for _ in range(2):
+            storage = FileStorage(shared=True, **options)
+            storage._FileStorage__objects = {}
+            storage.reload()
+            storages.append(storage)
+        return storages
+
+    def saved(self):
+        """Returns the keys saved in the storage file."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        storage.reload()
+        return set(storage.all())
+
+    def test_changes_are_merged(self):
+        """Test that each storage only writes its own changes."""
+        for options in ({}, {"journal": True}, {"lazy": True},
+                        {"mapped": True}):
+            with self.subTest(**options):
+                for name in os.listdir():
+                    os.remove(name)
+                a, b = self.storages(**options)
+                us, pl = User(), Place()
+                a.new(us)
+                a.save()
+                b.new(pl)
+                b.save()
+                self.assertEqual(set(b.all()),
+                                 {"User." + us.id, "Place." + pl.id})
+                self.assertIsNone(a.get(Place, pl.id))
+                a.sync()
+                self.assertEqual(a.get(Place, pl.id).id, pl.id)
+                if options.get("mapped"):
+                    continue
+                self.assertEqual(self.saved(),
+                                 {"User." + us.id, "Place." + pl.id})
+
+    def test_unsaved_changes_win(self):
+        """Test that changes of other processes do not overwrite changes
+        not saved yet."""
+        for options in ({}, {"journal": True}):
+            with self.subTest(**options):
+                for name in os.listdir():
+                    os.remove(name)
+                a, b = self.storages(**options)
+                us = User()
+                a.new(us)
+                a.save()
+                b.sync()
+                theirs = b.get(User, us.id)
+                theirs.first_name = "Betty"
+                b.touch(theirs)
+                b.save()
+                mine = a.get(User, us.id)
+                mine.last_name = "Holberton"
+                a.touch(mine)
+                a.sync()
+                self.assertIs(a.get(User, us.id), mine)
+                self.assertEqual(a.get(User, us.id).first_name, "")
+                b.delete(theirs)
+                b.save()
+                a.sync()
+                self.assertIs(a.get(User, us.id), mine)
+                a.save()
+                self.assertEqual(self.saved(), {"User." + us.id})
+
+    def test_processes(self):
+        """Test that processes saving concurrently lose no object."""
+        code = ("import sys; sys.path.insert(0, sys.argv[1]); "
+                "from models.engine.file_storage import FileStorage; "
+                "from models.user import User; "
+                "s = FileStorage(shared=True); s.reload(); "
+                "[(s.new(User()), s.save()) for _ in range(20)]")
+        root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__)))))
+        workers = [subprocess.Popen([sys.executable, "-c", code, root])
+                   for _ in range(3)]
+        for worker in workers:
+            self.assertEqual(worker.wait(), 0)
+        self.assertEqual(len(self.saved()), 60)
+
+
+class TestFileStorageThreadSafe(unittest.TestCase):
+    """Unittests for the thread-safe mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Creates a thread-safe storage in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage(threadsafe=True, journal=True)
+        self.storage._FileStorage__objects = {}
+
+    def tearDown(self):
+        """Goes back to the previous directory and removes the temporary
+        one."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_all_is_a_snapshot(self):
+        """Test that all() returns a read-only snapshot, shared until the
+        stored objects change."""
+        us = User()
+        self.storage.new(us)
+        view = self.storage.all()
+        self.assertIs(self.storage.all(), view)
+        with self.assertRaises(TypeError):
+            view["User.x"] = us
+        pl = Place()
+        self.storage.new(pl)
+        self.assertNotIn("Place." + pl.id, view)
+        self.assertIn("Place." + pl.id, self.storage.all())
+        self.storage.touch(us)
+        self.assertIs(self.storage.all(), self.storage.all())
+        self.storage.delete(us)
+        self.assertNotIn("User." + us.id, self.storage.all())
+        self.assertIs(self.storage.get(Place, pl.id), pl)
+
+    def test_concurrent_use(self):
+        """Test that threads can iterate the objects while others create,
+        delete and save them."""
+        errors = []
+        stop = threading.Event()
+        for _ in range(500):
+            self.storage.new(User())
+
+        def write():
+            try:
+                for _ in range(200):
+                    us = User()
+                    self.storage.new(us)
+                    self.storage.save()
+                    self.storage.delete(us)
+            except Exception as e:
+                errors.append(e)
+
+        def read():
+            try:
+                while not stop.is_set():
+                    for key, obj in self.storage.all().items():
+                        obj.to_dict()
+                    self.storage.count(User)
+            except Exception as e:
+                errors.append(e)
+        readers = [threading.Thread(target=read) for _ in range(2)]
+        writers = [threading.Thread(target=write) for _ in range(2)]
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for thread in readers + writers:
+                thread.start()
+            for thread in writers:
+                thread.join()
+            stop.set()
+            for thread in readers:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        self.assertEqual(errors, [])
+        self.assertEqual(self.storage.count(), 500)
+
+
+class TestFileStorageSharded(unittest.TestCase):
+    """Unittests for the sharded mode of the `FileStorage` class."""
+
+    def setUp(self):
+        """Saves a few objects to a sharded store in a temporary
+        directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        storage = self.sharded()
+        self.users = [User() for _ in range(8)]
+        self.pl = Place()
+        for obj in self.users + [self.pl]:
+            storage.new(obj)
+        storage.save()
+
+    def tearDown(self):
+        """Goes back to the previous directory and removes the temporary
+        one."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def sharded(self, **options):
+        """Returns an empty sharded storage with 4 shards per class."""
+        storage = FileStorage(shards=4, **options)
+        storage._FileStorage__objects = {}
+        return storage
+
+    def reloaded(self, **options):
+        """Returns a sharded storage reloaded from the files."""
+        storage = self.sharded(**options)
+        storage.reload()
+        return storage
+
+    def test_layout(self):
+        """Test that each class is saved in its own shard files."""
+        self.assertFalse(os.path.exists("file.json"))
+        self.assertEqual(sorted(os.listdir("file.shards")),
+                         ["Place", "User"])
+        users = [f for f in os.listdir("file.shards/User")
+                 if f.endswith(".json")]
+        self.assertLessEqual(len(users), 4)
+        saved = {}
+        for name in users:
+            with open(os.path.join("file.shards/User", name)) as f:
+                saved.update(json.load(f))
+        self.assertEqual(set(saved), {"User." + u.id for u in self.users})
+
+    def test_classes_are_read_when_needed(self):
+        """Test that reload reads no shard until its class is needed."""
+        for options in ({}, {"lazy": True}):
+            with self.subTest(**options):
+                storage = self.reloaded(**options)
+                self.assertEqual(storage._FileStorage__objects, {})
+                self.assertEqual(storage.get(Place, self.pl.id).id,
+                                 self.pl.id)
+                self.assertEqual(storage.count(Place), 1)
+                self.assertIn("User", storage._FileStorage__unloaded)
+                self.assertEqual(storage.count(), 9)
+
+    def test_save_rewrites_dirty_shards(self):
+        """Test that a save only rewrites the shards of changed objects."""
+        storage = self.reloaded()
+        us = storage.get(User, self.users[0].id)
+        storage.touch(us)
+        with patch("models.engine.file_storage.write_atomic",
+                   autospec=True) as write:
+            storage.save()
+        self.assertEqual([c.args[0] for c in write.call_args_list],
+                         [os.path.join("file.shards", "User", "{:02x}.json"
+                                       .format(bucket_of(
+                                           "User." + us.id, 4)))])
+
+    def test_changes_before_reading(self):
+        """Test that objects created or deleted before their class is read
+        are saved along with the others."""
+        storage = self.reloaded()
+        us = User()
+        storage.new(us)
+        storage.delete(storage.get(User, self.users[1].id))
+        storage.save()
+        keys = set(self.reloaded().all())
+        self.assertIn("User." + us.id, keys)
+        self.assertNotIn("User." + self.users[1].id, keys)
+        self.assertEqual(len(keys), 9)
+
+    def test_unsharded_store_is_split(self):
+        """Test that a store saved in one file is split by the next save."""
+        storage = FileStorage()
+        storage._FileStorage__objects = {}
+        us = User()
+        storage.new(us)
+        storage.save()
+        shutil.rmtree("file.shards")
+        storage = self.reloaded()
+        storage.save()
+        self.assertEqual(list(self.reloaded().all()), ["User." + us.id])
+
+    def test_invalid_options(self):
+        """Test that sharding excludes journaled, mapped and shared
+        storages."""
+        for option in ("journal", "mapped", "shared"):
+            with self.assertRaises(ValueError):
+                FileStorage(shards=4, **{option: True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+"""
+Module: test_query_planner.py
+
+Defines unittests for the statistics and plans in
+`models.engine.query_planner`.
+"""
+
+import unittest
+from models.engine.query_planner import (
+    Plan, Statistics, bounding_box, choose)
+
+
+class TestStatistics(unittest.TestCase):
+    """Unittests for testing the `Statistics` class."""
+
+    def setUp(self):
+        """Observes prices from 0 to 100."""
+        self.stats = Statistics()
+        for price in (50, 0, 100, 20):
+            self.stats.observe("Place", "price", price)
+
+    def test_bounds(self):
+        """Test that bounds only widen, until cleared."""
+        self.assertEqual(self.stats.bounds("Place", "price"), (0, 100))
+        self.assertIsNone(self.stats.bounds("Place", "rooms"))
+        self.stats.clear()
+        self.assertIsNone(self.stats.bounds("Place", "price"))
+
+    def test_ranges(self):
+        """Test that ranges split the bounds uniformly, combined by
+        attribute."""
+        self.assertAlmostEqual(self.stats.selectivity(
+            "Place", [("price", "<", 25)]), 0.25)
+        self.assertAlmostEqual(self.stats.selectivity(
+            "Place", [("price", ">=", 25), ("price", "<=", 75)]), 0.5)
+        self.assertEqual(self.stats.selectivity(
+            "Place", [("price", ">", 75), ("price", "<", 25)]), 0.0)
+        self.assertEqual(self.stats.selectivity(
+            "Place", [("price", "<", 200)]), 1.0)
+
+    def test_defaults(self):
+        """Test the selectivities of predicates nothing is known about."""
+        self.assertAlmostEqual(self.stats.selectivity(
+            "Place", [("name", "==", "x"), ("rooms", ">", 2)]), 0.1 / 3)
+        self.assertEqual(self.stats.selectivity(
+            "Place", [("price", "==", 500)]), 0.0)
+        self.assertEqual(self.stats.selectivity(
+            "Place", [("price", "!=", 500)]), 1.0)
+        self.assertEqual(self.stats.selectivity("Place", []), 1.0)
+
+
+class TestPlans(unittest.TestCase):
+    """Unittests for choosing and describing plans."""
+
+    def test_choose(self):
+        """Test that the cheapest plan wins, and the scan wins ties."""
+        scan = Plan("scan", "", 100, 10)
+        index = Plan("index", "city_id == 'c'", 20, 10)
+        columns = Plan("columns", "price < 5", 100, 10)
+        self.assertIs(choose([scan, index, columns]), index)
+        self.assertEqual(index.rejected, [scan, columns])
+        self.assertIs(choose([scan, columns]), scan)
+
+    def test_str(self):
+        """Test the description of a plan that has run."""
+        plan = choose([Plan("scan", "", 100, 10.4),
+                       Plan("index", "city_id == 'c'", 20, 10.4)])
+        plan.rows = 12
+        plan.examined = 20
+        self.assertEqual(str(plan), "\n".join([
+            "plan: index city_id == 'c'",
+            "estimated cost: 20",
+            "estimated rows: 10",
+            "actual rows: 12 (20 objects read)",
+            "rejected: scan (cost 100)"]))
+        self.assertEqual(str(Plan("sql", "SCAN Place", None, None)),
+                         "plan: sql SCAN Place")
+
+    def test_bounding_box(self):
+        """Test the boxes derived from predicates on coordinates."""
+        self.assertEqual(bounding_box(
+            [("lat", ">=", 6), ("lat", "<", 7), ("lon", "==", 3),
+             ("name", "==", "x")], "lat", "lon"), (6, 3, 7, 3))
+        self.assertEqual(bounding_box([("lat", ">", 80)], "lat", "lon"),
+                         (80, -180.0, 90.0, 180.0))
+        self.assertIsNone(bounding_box([("name", "==", "x")], "lat", "lon"))
+        self.assertIsNone(bounding_box([("lat", "!=", 1)], "lat", "lon"))
+        self.assertIsNone(bounding_box(
+            [("lon", ">", 10), ("lon", "<", 5)], "lat", "lon"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+Module: test_record_file.py
+
+Defines unittests for the `RecordFile` class in
+`models.engine.record_file`.
+"""
+
+import os
+import tempfile
+import unittest
+from models.engine.record_file import RecordFile, index_path, write_index
+from models.engine.serializers import get_serializer
+
+
+def record(id, **attrs):
+    """Returns a Review record with the given id and attributes."""
+    return dict({"__class__": "Review", "id": id,
+                 "created_at": "2017-09-28T21:05:54.119427",
+                 "updated_at": "2017-09-28T21:05:54.119427"}, **attrs)
+
+
+class TestRecordFile(unittest.TestCase):
+    """Unittests for testing the `RecordFile` class."""
+
+    def setUp(self):
+        """Writes a binary snapshot of a few records and maps it."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "file.bin")
+        self.serializer = get_serializer("binary")
+        self.ids = ["d", "a", "c", "b", "e"]
+        with open(self.path, "wb") as f:
+            self.serializer.write_snapshot(f, [
+                (f"Review.{i}", self.serializer.encode(record(i, text=i)))
+                for i in self.ids])
+        self.records = RecordFile(self.path, self.serializer)
+
+    def tearDown(self):
+        """Unmaps the snapshot and removes the temporary directory."""
+        self.records.close()
+        self.dir.cleanup()
+
+    def test_index_is_built(self):
+        """Test that a missing index is built on first use."""
+        self.assertTrue(os.path.exists(index_path(self.path)))
+        self.assertEqual(write_index(self.path, self.serializer), 5)
+
+    def test_lookup(self):
+        """Test reading records by key."""
+        for i in self.ids:
+            self.assertIn(f"Review.{i}", self.records)
+            self.assertEqual(self.records[f"Review.{i}"]["text"], i)
+        self.assertNotIn("Review.f", self.records)
+        self.assertNotIn("User.a", self.records)
+        with self.assertRaises(KeyError):
+            self.records["Review.0"]
+
+    def test_iteration_and_len(self):
+        """Test that keys come in file order, then new keys."""
+        self.records["Review.z"] = record("z")
+        self.assertEqual(list(self.records),
+                         [f"Review.{i}" for i in self.ids] + ["Review.z"])
+        self.assertEqual(len(self.records), 6)
+
+    def test_set_and_delete(self):
+        """Test that changes are kept on top of the snapshot."""
+        self.records["Review.a"] = record("a", text="new")
+        self.assertEqual(self.records["Review.a"]["text"], "new")
+        self.assertEqual(len(self.records), 5)
+        del self.records["Review.a"]
+        del self.records["Review.b"]
+        self.assertNotIn("Review.a", self.records)
+        self.assertEqual(self.records.pop("Review.b", None), None)
+        self.assertEqual(len(self.records), 3)
+        with self.assertRaises(KeyError):
+            del self.records["Review.b"]
+
+    def test_journal_is_replayed(self):
+        """Test that the journals of the snapshot are applied."""
+        with open(self.path + ".log", "wb") as f:
+            f.write(self.serializer.journal_entry("del", "Review.c"))
+            f.write(self.serializer.journal_entry(
+                "set", "Review.f", self.serializer.encode(record("f"))))
+        records = RecordFile(self.path, self.serializer)
+        self.assertNotIn("Review.c", records)
+        self.assertEqual(records["Review.f"]["id"], "f")
+        self.assertEqual(records.journal_entries, 2)
+        records.close()
+
+    def test_stale_index_is_rebuilt(self):
+        """Test that an index built for another snapshot is not used."""
+        with open(self.path, "wb") as f:
+            self.serializer.write_snapshot(f, [
+                ("Review.x", self.serializer.encode(record("x")))])
+        records = RecordFile(self.path, self.serializer)
+        self.assertEqual(list(records), ["Review.x"])
+        self.assertIn("Review.x", records)
+        self.assertNotIn("Review.a", records)
+        records.close()
+
+    def test_not_a_binary_snapshot(self):
+        """Test that other files raise ValueError."""
+        with open(self.path, "wb") as f:
+            f.write(b"{}")
+        with self.assertRaises(ValueError):
+            RecordFile(self.path, self.serializer)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+"""
+Module: test_serializers.py
+
+Defines unittests for the storage formats in `models.engine.serializers`.
+"""
+
+import io
+import os
+import json
+import tempfile
+import unittest
+from datetime import datetime
+from models.engine.file_storage import FileStorage
+from models.engine.serializers import (
+    get_serializer, serializer_for, read_store, convert)
+from models.review import Review
+
+RECORD = {
+    "__class__": "Review",
+    "id": "1234",
+    "created_at": "2017-09-28T21:05:54.119427",
+    "updated_at": "2017-09-28T21:05:54.119572",
+    "text": "Great stay",
+    "place_id": "p1",
+    "rating": 4,
+}
+
+
+class TestSerializers(unittest.TestCase):
+    """Unittests for the JSON and binary serializers."""
+
+    def snapshot(self, serializer, records):
+        """Returns a snapshot of records, by key, written in memory."""
+        f = io.BytesIO()
+        serializer.write_snapshot(
+            f, [(k, serializer.encode(v)) for k, v in records.items()])
+        f.seek(0)
+        return f
+
+    def test_get_serializer(self):
+        """Test looking up serializers by name and by extension."""
+        self.assertEqual(get_serializer("json").name, "json")
+        self.assertEqual(get_serializer("binary").name, "binary")
+        self.assertEqual(serializer_for("file.bin").name, "binary")
+        self.assertEqual(serializer_for("file.json").name, "json")
+        with self.assertRaises(ValueError):
+            get_serializer("xml")
+
+    def test_json_snapshot_matches_json_dump(self):
+        """Test that JSON snapshots are written as `json.dump` would."""
+        f = self.snapshot(get_serializer("json"), {"Review.1234": RECORD})
+        self.assertEqual(f.getvalue().decode(),
+                         json.dumps({"Review.1234": RECORD}))
+
+    def test_binary_round_trip(self):
+        """Test that binary records decode with datetime timestamps."""
+        serializer = get_serializer("binary")
+        f = self.snapshot(serializer, {"Review.1234": RECORD})
+        record = serializer.read_snapshot(f)["Review.1234"]
+        self.assertEqual(record["created_at"],
+                         datetime.fromisoformat(RECORD["created_at"]))
+        self.assertEqual(record["updated_at"],
+                         datetime.fromisoformat(RECORD["updated_at"]))
+        for attr in ("__class__", "id", "text", "place_id", "rating"):
+            self.assertEqual(record[attr], RECORD[attr])
+
+    def test_binary_rejects_other_files(self):
+        """Test that a binary snapshot must start with the magic bytes."""
+        with self.assertRaises(ValueError):
+            get_serializer("binary").read_snapshot(io.BytesIO(b"{}"))
+
+    def test_iter_snapshot(self):
+        """Test streaming snapshots across small read chunks."""
+        records = {"Review.1234": RECORD,
+                   "Review.5678": dict(RECORD, id="5678", rating=12345)}
+        text = json.dumps(records, indent=4).encode()
+        for chunk_size in (1, 7, 1 << 16):
+            self.assertEqual(dict(get_serializer("json").iter_snapshot(
+                io.BytesIO(text), chunk_size)), records)
+        self.assertEqual(list(get_serializer("json").iter_snapshot(
+            io.BytesIO(b" { } "))), [])
+        f = self.snapshot(get_serializer("binary"), records)
+        streamed = dict(get_serializer("binary").iter_snapshot(f))
+        self.assertEqual(streamed["Review.5678"]["rating"], 12345)
+
+    def test_iter_snapshot_corrupt(self):
+        """Test that streaming a truncated snapshot raises ValueError."""
+        for name in ("json", "binary"):
+            serializer = get_serializer(name)
+            data = self.snapshot(serializer, {"Review.1234": RECORD,
+                                              "Review.5678": RECORD})
+            with self.assertRaises(ValueError):
+                list(serializer.iter_snapshot(
+                    io.BytesIO(data.getvalue()[:-5])))
+
+    def test_journal_stops_at_torn_entry(self):
+        """Test that journals are replayed up to a torn entry."""
+        for name in ("json", "binary"):
+            serializer = get_serializer(name)
+            data = serializer.journal_entry(
+                "set", "Review.1234", serializer.encode(RECORD)) + \
+                serializer.journal_entry("del", "Review.1234")
+            torn = serializer.journal_entry(
+                "set", "Review.5678", serializer.encode(RECORD))
+            entries = list(serializer.read_journal(
+                io.BytesIO(data + torn[:-3])))
+            self.assertEqual([op for op, _, _ in entries], ["set", "del"])
+            self.assertEqual(entries[0][2]["text"], "Great stay")
+            self.assertEqual(entries[1][1:], ("Review.1234", None))
+
+    def test_journal_drops_uncommitted_frame(self):
+        """Test that only the committed frames of a journal are replayed,
+        with the entries written outside any frame."""
+        commits = {"json": b'{"op": "commit"}\n', "binary": b"C"}
+        for name, commit in commits.items():
+            serializer = get_serializer(name)
+            single = serializer.journal_entry("del", "Review.1")
+            frame = serializer.journal_frame([
+                serializer.journal_entry("del", "Review.2"),
+                serializer.journal_entry("del", "Review.3")])
+            begun = serializer.journal_frame([
+                serializer.journal_entry("del", "Review.4")])[:-len(commit)]
+            for data in (single + frame + begun,
+                         single + begun + frame):
+                entries = list(serializer.read_journal(io.BytesIO(data)))
+                self.assertEqual([key for _, key, _ in entries],
+                                 ["Review.1", "Review.2", "Review.3"])
+
+
+class TestConvert(unittest.TestCase):
+    """Unittests for converting stores between formats."""
+
+    def setUp(self):
+        """Creates a JSON store with a journal in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.json_path = os.path.join(self.dir.name, "file.json")
+        self.bin_path = os.path.join(self.dir.name, "file.bin")
+        serializer = get_serializer("json")
+        with open(self.json_path, "wb") as f:
+            f.write(self.snapshot_bytes(serializer))
+        with open(self.json_path + ".log", "wb") as f:
+            f.write(serializer.journal_entry("del", "Review.1234"))
+
+    def tearDown(self):
+        """Removes the temporary directory."""
+        self.dir.cleanup()
+
+    def snapshot_bytes(self, serializer):
+        """Returns a snapshot of two records."""
+        f = io.BytesIO()
+        serializer.write_snapshot(f, [
+            ("Review.1234", serializer.encode(RECORD)),
+            ("Review.5678", serializer.encode(dict(RECORD, id="5678")))])
+        return f.getvalue()
+
+    def test_convert_round_trip(self):
+        """Test that a store converts to binary and back."""
+        self.assertEqual(convert(self.json_path, self.bin_path), 1)
+        records, entries = read_store(self.bin_path, get_serializer("binary"))
+        self.assertEqual(list(records), ["Review.5678"])
+        self.assertEqual(entries, 0)
+        back = os.path.join(self.dir.name, "back.json")
+        self.assertEqual(convert(self.bin_path, back), 1)
+        with open(back) as f:
+            self.assertEqual(json.load(f)["Review.5678"],
+                             dict(RECORD, id="5678"))
+
+    def test_convert_missing_store(self):
+        """Test that converting a missing store raises ValueError."""
+        with self.assertRaises(ValueError):
+            convert(os.path.join(self.dir.name, "nope.json"), self.bin_path)
+
+
+class TestBinaryFileStorage(unittest.TestCase):
+    """Unittests for `FileStorage` with the binary format."""
+
+    def setUp(self):
+        """Creates a binary storage in a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
+        self.storage = FileStorage(format="binary")
+        self.storage._FileStorage__objects = {}
+
+    def tearDown(self):
+        """Goes back to the previous directory and removes the temporary
+        one."""
+        os.chdir(self.cwd)
+        self.dir.cleanup()
+
+    def test_save_reload(self):
+        """Test that objects survive a save and a reload."""
+        review = Review()
+        review.text = "Great stay"
+        self.storage.new(review)
+        self.storage.save()
+        self.assertTrue(os.path.exists("file.bin"))
+        self.assertFalse(os.path.exists("file.json"))
+        storage = FileStorage(format="binary")
+        storage._FileStorage__objects = {}
+        storage.reload()
+        loaded = storage.get(Review, review.id)
+        self.assertEqual(loaded.to_dict(), review.to_dict())
+
+    def test_unknown_format(self):
+        """Test that an unknown format raises ValueError."""
+        with self.assertRaises(ValueError):
+            FileStorage(format="xml")
+
+
+if __name__ == "__main__":
+    unittest.main()
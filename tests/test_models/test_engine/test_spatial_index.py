@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""
+Module: test_spatial_index.py
+
+Defines unittests for the `GridIndex` class in
+`models.engine.spatial_index`.
+"""
+
+import unittest
+from models.engine.spatial_index import GridIndex, distance_km
+
+
+class TestDistance(unittest.TestCase):
+    """Unittests for testing the `distance_km` function."""
+
+    def test_distance(self):
+        """Test known distances."""
+        self.assertEqual(distance_km(6.5, 3.4, 6.5, 3.4), 0)
+        # One degree of latitude is about 111.2 km
+        self.assertAlmostEqual(distance_km(0, 0, 1, 0), 111.2, places=1)
+        # Lagos to Abuja is about 530 km
+        self.assertAlmostEqual(
+            distance_km(6.5244, 3.3792, 9.0765, 7.3986), 530, delta=10)
+
+
+class TestGridIndex(unittest.TestCase):
+    """Unittests for testing the `GridIndex` class."""
+
+    def setUp(self):
+        """Sets up an index with a few points."""
+        self.grid = GridIndex()
+        self.grid.set("lagos", 6.5244, 3.3792)
+        self.grid.set("ikeja", 6.6018, 3.3515)
+        self.grid.set("abuja", 9.0765, 7.3986)
+        self.grid.set("fiji", -17.7, 179.95)
+        self.grid.set("samoa", -13.8, -172.1)
+
+    def test_near(self):
+        """Test radius search, closest first."""
+        found = self.grid.near(6.5244, 3.3792, 20)
+        self.assertEqual([key for key, _ in found], ["lagos", "ikeja"])
+        self.assertEqual(found[0][1], 0)
+        self.assertEqual(self.grid.near(0, 0, 100), [])
+
+    def test_near_large_radius(self):
+        """Test a radius larger than half the globe."""
+        found = self.grid.near(0, 0, 30000)
+        self.assertEqual(len(found), len(self.grid))
+
+    def test_near_antimeridian(self):
+        """Test radius search across the antimeridian."""
+        found = self.grid.near(-17.7, -179.9, 50)
+        self.assertEqual([key for key, _ in found], ["fiji"])
+
+    def test_estimate(self):
+        """Test that estimates count the points of overlapping cells."""
+        self.assertEqual(self.grid.estimate(6, 3, 7, 4), 2)
+        self.assertGreaterEqual(self.grid.estimate(6.55, 3.3, 6.65, 3.4),
+                                len(self.grid.within(6.55, 3.3, 6.65, 3.4)))
+        self.assertEqual(self.grid.estimate(-20, 170, -10, -170), 2)
+        self.assertEqual(self.grid.estimate(40, 0, 50, 10), 0)
+
+    def test_within(self):
+        """Test bounding-box search."""
+        self.assertEqual(sorted(self.grid.within(6, 3, 7, 4)),
+                         ["ikeja", "lagos"])
+        self.assertEqual(sorted(self.grid.within(-20, 170, -10, -170)),
+                         ["fiji", "samoa"])
+        self.assertEqual(self.grid.within(50, 50, 60, 60), [])
+
+    def test_set_moves_and_remove(self):
+        """Test moving and removing points."""
+        self.grid.set("lagos", 9.08, 7.4)
+        self.assertEqual(sorted(self.grid.within(6, 3, 7, 4)), ["ikeja"])
+        self.grid.remove("ikeja")
+        self.grid.remove("nope")
+        self.assertEqual(self.grid.within(6, 3, 7, 4), [])
+        self.assertEqual(len(self.grid), 4)
+
+    def test_irregular_points(self):
+        """Test that points out of range are kept aside and checked by
+        every search."""
+        self.grid.set("nowhere", 95, 200)
+        self.assertEqual(self.grid.irregular(), ["nowhere"])
+        self.assertEqual(self.grid.within(90, 190, 100, 210), ["nowhere"])
+        self.assertEqual(self.grid.within(-20, -170, -10, -150), [])
+        self.assertEqual(self.grid.estimate(40, 0, 50, 10), 1)
+        self.grid.set("nowhere", 6.6, 3.4)
+        self.assertEqual(self.grid.irregular(), [])
+        self.grid.set("nowhere", -91, 0)
+        self.grid.remove("nowhere")
+        self.grid.set("text", 6.6, "3.4")
+        self.assertEqual(self.grid.irregular(), ["text"])
+        self.assertEqual(sorted(self.grid.within(6, 3, 7, 4)),
+                         ["ikeja", "lagos"])
+        self.assertNotIn("text", dict(self.grid.near(6.6, 3.4, 20)))
+        self.grid.remove("text")
+        self.assertEqual(self.grid.irregular(), [])
+        self.assertEqual(len(self.grid), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@
 """Unit tests for the `Place` module."""
 
 import os
+import tempfile
 import unittest
 from datetime import datetime
 from models.engine.file_storage import FileStorage
@@ -13,13 +14,16 @@ class TestPlace(unittest.TestCase):
     """Test cases for the `Place` class."""
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
+        """Resets FileStorage data and removes the temporary directory."""
         FileStorage._FileStorage__objects = {}
-        if os.path.exists(FileStorage._FileStorage__file_path):
-            os.remove(FileStorage._FileStorage__file_path)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_params(self):
         """Test method for checking class attributes"""
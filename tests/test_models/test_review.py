@@ -2,6 +2,7 @@
 """Unit tests for the `Review` module."""
 
 import os
+import tempfile
 import unittest
 from datetime import datetime
 from models.review import Review
@@ -12,13 +13,16 @@ class TestReview(unittest.TestCase):
     """Test cases for the `Review` class."""
 
     def setUp(self):
-        pass
+        """Goes to a temporary directory."""
+        self.dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir.name)
 
     def tearDown(self) -> None:
-        """Resets FileStorage data."""
+        """Resets FileStorage data and removes the temporary directory."""
         FileStorage._FileStorage__objects = {}
-        if os.path.exists(FileStorage._FileStorage__file_path):
-            os.remove(FileStorage._FileStorage__file_path)
+        os.chdir(self.cwd)
+        self.dir.cleanup()
 
     def test_params(self):
         """Test method for checking class attributes"""
@@ -70,6 +74,19 @@ class TestReview(unittest.TestCase):
         self.assertIn('updated_at', a_dict.keys())
         self.assertNotEqual(r1, r2)
 
+    def test_compact(self):
+        """Test method for checking the compact variant"""
+        r1 = Review()
+        r1.place_id = "".join(["place", "-", "1"])
+        r2 = Review.compact()(**r1.to_dict())
+
+        # Declared attributes live in slots, with class defaults as fallback
+        self.assertIsInstance(r2, Review)
+        self.assertEqual(r2.__dict__, {})
+        self.assertEqual(r2.text, "")
+        self.assertEqual(r2.to_dict(), r1.to_dict())
+        r3 = Review.compact()(**{**r1.to_dict(), "id": "other"})
+        self.assertIs(r2.place_id, r3.place_id)
 
 if __name__ == "__main__":
     unittest.main()